@@ -8,10 +8,12 @@ import logging
 router = APIRouter()
 logger = logging.getLogger("Archaios.API")
 
+# Shared so every request reuses the callback connection pool
+callback_service = CallbackService()
+
 def get_gee_service():
     """Get the GEE service instance."""
     processor = GeeProcessor()
-    callback_service = CallbackService()
     return GeeService(processor, callback_service)
 
 @router.get("/health")
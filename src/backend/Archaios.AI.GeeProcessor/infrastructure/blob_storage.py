@@ -1,16 +1,38 @@
 from azure.storage.blob import BlobServiceClient
 from azure.core.exceptions import ClientAuthenticationError
 import logging
+import time
 from urllib.parse import urlparse
 import os
 
 logger = logging.getLogger("Archaios.BlobStorage")
 
+class DownloadProgress:
+    """Progress hook for blob transfers that logs every tenth of the file and the final throughput."""
+    def __init__(self, name: str, log_step: float = 0.1):
+        self.name = name
+        self.log_step = log_step
+        self.started = time.perf_counter()
+        self.next_fraction = log_step
+        self.bytes_done = 0
+
+    def __call__(self, current: int, total: int) -> None:
+        self.bytes_done = current
+        if total and current / total >= self.next_fraction and current < total:
+            logger.info(f"Downloading {self.name}: {current / total:.0%} of {total / 1024 ** 2:.1f} MiB")
+            self.next_fraction = (int(current / total / self.log_step) + 1) * self.log_step
+
+    def summary(self) -> str:
+        seconds = time.perf_counter() - self.started
+        rate = self.bytes_done / 1024 ** 2 / seconds if seconds > 0 else 0.0
+        return f"{self.bytes_done / 1024 ** 2:.1f} MiB in {seconds:.2f}s ({rate:.1f} MiB/s)"
+
 class AzureBlobStorage:
     """Service for interacting with Azure Blob Storage."""
     
-    def __init__(self, connection_string: str = None):
-        """Initialize with Azure Storage connection string."""
+    def __init__(self, connection_string: str = None, max_concurrency: int = 8):
+        """Initialize with Azure Storage connection string and the number of parallel ranged requests per download."""
+        self.max_concurrency = max_concurrency
         if connection_string is None:
             connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
             
@@ -37,12 +59,15 @@ class AzureBlobStorage:
             container_client = self.blob_service_client.get_container_client(container_name)
             blob_client = container_client.get_blob_client(blob_name)
 
-            # Use synchronous download methods
+            # Parallel ranged requests are written into place in a preallocated
+            # file, so memory stays at a few chunks whatever the blob size
+            progress = DownloadProgress(blob_name)
+            download_stream = blob_client.download_blob(max_concurrency=self.max_concurrency, progress_hook=progress)
             with open(local_path, "wb") as file:
-                download_stream = blob_client.download_blob()
-                file.write(download_stream.readall())
+                file.truncate(download_stream.size)
+                download_stream.readinto(file)
 
-            logger.info(f"Successfully downloaded blob {blob_name} to {local_path}")
+            logger.info(f"Successfully downloaded blob {blob_name} to {local_path}: {progress.summary()}")
             return True
 
         except ClientAuthenticationError as auth_error:
@@ -3,6 +3,7 @@ Callback service for sending results back to the caller.
 """
 
 import logging
+import random
 import httpx
 from core.models import GeeImageResult
 import asyncio
@@ -11,7 +12,36 @@ import json
 logger = logging.getLogger("Archaios.CallbackService")
 
 class CallbackService:
-    """Service for sending results back to the caller."""
+    """
+    Service for sending results back to the caller.
+
+    One pooled httpx client is kept for the lifetime of the service, so
+    callbacks reuse keep-alive connections instead of a new TLS handshake per
+    result. Timeouts, transport errors, 429 and 5xx responses are retried with
+    full-jitter exponential backoff.
+    """
+
+    def __init__(self, max_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 10.0, timeout: float = 30.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Close the pooled client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     async def send_result(self, url: str, result: GeeImageResult) -> bool:
         """Send the result to the provided callback URL."""
@@ -20,21 +50,25 @@ class CallbackService:
             
             # Convert result to dict, handling Earth Engine objects if present
             result_dict = self._prepare_result_dict(result)
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    url,
-                    json=result_dict,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    logger.warning(f"Callback failed with status code {response.status_code}")
-                    logger.debug(f"Response content: {response.text}")
-                    return False
-                    
-                logger.info("Callback succeeded")
-                return True
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.client.post(url, json=result_dict)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    logger.warning(f"Callback attempt {attempt + 1} failed: {str(e)}")
+                else:
+                    if response.status_code == 200:
+                        logger.info("Callback succeeded")
+                        return True
+                    if response.status_code != 429 and response.status_code < 500 or attempt == self.max_retries:
+                        logger.warning(f"Callback failed with status code {response.status_code}")
+                        logger.debug(f"Response content: {response.text}")
+                        return False
+                    logger.warning(f"Callback attempt {attempt + 1} returned {response.status_code}")
+
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
                 
         except Exception as e:
             logger.error(f"Error sending callback: {str(e)}")
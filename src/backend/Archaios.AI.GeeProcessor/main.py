@@ -4,7 +4,7 @@ import sys
 import uvicorn
 from fastapi import FastAPI
 from config import AppConfig
-from api.routes import router as api_router
+from api.routes import router as api_router, callback_service
 
 # Configure logging for Visual Studio output
 logging.basicConfig(
@@ -44,6 +44,7 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Archaios GEE Processor")
+    await callback_service.close()
 
 def main():
     config = AppConfig.from_env()
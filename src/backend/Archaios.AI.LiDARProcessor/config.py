@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 import os
 
@@ -11,6 +12,20 @@ class AppConfig:
     connection_name: str
     system_key: str
     local_mode: bool = False
+    stage_cache_dir: Optional[str] = None
+    stage_cache_max_gb: float = 10.0
+    stage_cache_container: Optional[str] = None
+    max_concurrent_jobs: int = 1
+    job_memory_budget_gb: Optional[float] = None
+    local_queue_dir: Optional[str] = None
+    download_concurrency: int = 8
+    event_batch_window_ms: int = 0
+    event_batch_size: int = 16
+    event_max_retries: int = 4
+    queue_visibility_timeout: int = 300
+    max_dequeue_count: int = 5
+    poison_queue_name: Optional[str] = None
+    job_state_container: str = 'lidar-job-state'
 
     @classmethod
     def from_env(cls):
@@ -22,5 +37,19 @@ class AppConfig:
             task_hub=os.getenv('TASK_HUB', 'LiDARHub'),
             connection_name=os.getenv('CONNECTION_NAME', 'Storage'),
             system_key=os.getenv('SYSTEM_KEY'),
-            local_mode =os.getenv('LOCAL_MODE', 'false').lower() in ('true', 'yes', '1')
+            local_mode =os.getenv('LOCAL_MODE', 'false').lower() in ('true', 'yes', '1'),
+            stage_cache_dir=os.getenv('STAGE_CACHE_DIR'),
+            stage_cache_max_gb=float(os.getenv('STAGE_CACHE_MAX_GB', '10')),
+            stage_cache_container=os.getenv('STAGE_CACHE_CONTAINER'),
+            max_concurrent_jobs=int(os.getenv('MAX_CONCURRENT_JOBS', '1')),
+            job_memory_budget_gb=float(os.getenv('JOB_MEMORY_BUDGET_GB')) if os.getenv('JOB_MEMORY_BUDGET_GB') else None,
+            local_queue_dir=os.getenv('LOCAL_QUEUE_DIR'),
+            download_concurrency=int(os.getenv('DOWNLOAD_CONCURRENCY', '8')),
+            event_batch_window_ms=int(os.getenv('EVENT_BATCH_WINDOW_MS', '0')),
+            event_batch_size=int(os.getenv('EVENT_BATCH_SIZE', '16')),
+            event_max_retries=int(os.getenv('EVENT_MAX_RETRIES', '4')),
+            queue_visibility_timeout=int(os.getenv('QUEUE_VISIBILITY_TIMEOUT', '300')),
+            max_dequeue_count=int(os.getenv('MAX_DEQUEUE_COUNT', '5')),
+            poison_queue_name=os.getenv('POISON_QUEUE_NAME'),
+            job_state_container=os.getenv('JOB_STATE_CONTAINER', 'lidar-job-state')
         )
@@ -4,8 +4,15 @@ from .models import ProcessingResult
 
 class IBlobStorage(Protocol):
     """Interface for blob storage operations."""
-    async def download_file(self, uri: str, local_path: str) -> None:
-        """Download a file from blob storage to a local path."""
+    async def download_file(self, uri: str, local_path: str, on_header=None) -> str:
+        """Download a file from blob storage to a local path and return its ETag.
+
+        on_header, if given, receives the leading bytes before the rest is fetched.
+        """
+        ...
+
+    async def start_progressive_download(self, uri: str, local_path: str):
+        """Start a download whose file can be read while it arrives; returns (etag, task)."""
         ...
     
     async def upload_file(self, local_path: str, container_name: str, blob_name: str) -> str:
@@ -18,11 +25,27 @@ class IBlobStorage(Protocol):
 
 class IQueueStorage(ABC):
     @abstractmethod
-    async def receive_messages(self) -> list: pass
+    async def receive_messages(self, max_messages: int = None) -> list: pass
     
     @abstractmethod
     async def delete_message(self, message: Any) -> None: pass
 
+    @abstractmethod
+    async def renew_message(self, message: Any, visibility_timeout: int) -> None:
+        """Keep a received message invisible for another visibility_timeout seconds."""
+
+    @abstractmethod
+    async def move_to_poison(self, message: Any) -> None:
+        """Park a message that keeps failing outside the work queue and delete it."""
+
+class IJobStateStore(ABC):
+    """Records finished jobs by orchestration instance so redelivered messages are not reprocessed."""
+    @abstractmethod
+    async def is_completed(self, instance_id: str) -> bool: pass
+
+    @abstractmethod
+    async def mark_completed(self, instance_id: str, event_name: str, status: str) -> None: pass
+
 class IEventService(ABC):
     @abstractmethod
     async def raise_completion_event(self, instance_id: str, event_name: str, result: Dict) -> None: pass
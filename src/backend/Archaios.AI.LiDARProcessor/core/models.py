@@ -49,10 +49,31 @@ class ProcessingParameters:
     # Noise Filter Parameters - match actual module parameters
     noise_filter_std_ratio: float = 2.0
     noise_filter_neighbors: int = 8
+    noise_filter_method: str = "sor"  # "sor" (KD-tree) or "voxel"
+
+    # Voxel Filter Parameters
+    voxel_filter_size: float = 0.5
+    voxel_filter_min_points: int = 3
+    voxel_filter_decimate: bool = False
     
     # Ground Classifier Parameters - match actual module parameters
     ground_classifier_cell_size: float = 5.0  # Maps to grid_size
     ground_classifier_max_distance: float = 0.5  # Maps to z_threshold
+    ground_classifier_method: str = "simple"  # "simple", "pmf" or "csf"
+
+    # Progressive Morphological Filter Parameters
+    pmf_cell_size: float = 1.0
+    pmf_max_window_size: float = 33.0
+    pmf_slope: float = 1.0
+    pmf_initial_distance: float = 0.15
+    pmf_max_distance: float = 2.5
+
+    # Cloth Simulation Filter Parameters
+    csf_cloth_resolution: float = 2.0
+    csf_rigidness: int = 2  # 1 steep slopes, 2 relief, 3 flat terrain
+    csf_iterations: int = 500
+    csf_time_step: float = 0.65
+    csf_class_threshold: float = 0.5
     
     # Hillshade Parameters - match actual module parameters
     hillshade_azimuth: float = 315
@@ -63,12 +84,35 @@ class ProcessingParameters:
     dtm_fill_nan: bool = True
     dtm_smooth: bool = True
     
+    # Threads for concurrent pipeline stages (None lets the executor decide)
+    pipeline_workers: Optional[int] = None
+    
+    # Hillshade/slope/LRM rasters wider than this (cells) are processed in overlapping windows; 0 disables
+    raster_block_size: int = 2048
+    
+    # Element type of the DTM/DSM grids and GeoTIFFs: "float32" or "float64"
+    raster_dtype: str = "float32"
+    
+    # Write intermediate GeoTIFFs (dtm/dsm/hillshade/slope .tif) next to the images
+    write_geotiffs: bool = True
+    cog_outputs: bool = False  # Write and upload Cloud-Optimized GeoTIFFs of the requested products
+    cog_compression: str = "deflate"
+    
+    # Reuse cached DTM/DSM surfaces for the same input and upstream parameters
+    use_stage_cache: bool = True
+    
     # Visualization Parameters
     dtm_colormap: str = "gray"
     dsm_colormap: str = "terrain"
     hillshade_colormap: str = "gray"
     slope_colormap: str = "inferno"
     transparent_nodata: bool = True
+
+    # Map Tile Parameters
+    generate_map_tiles: bool = False  # XYZ tile pyramids of the DTM, hillshade and slope
+    tile_format: str = "png"
+    tile_min_zoom: Optional[int] = None
+    tile_max_zoom: Optional[int] = None
     
     # GEE Parameters
     collection: str = "LANDSAT/LC08/C02/T1_TOA"
@@ -79,6 +123,12 @@ class ProcessingParameters:
     # E57 Processing Parameters
     max_points_per_chunk: int = 5000000
 
+    # Streaming Parameters
+    streaming_mode: bool = False
+    streaming_chunk_size: int = 2000000
+    streaming_point_threshold: int = 100000000
+    pipelined_download: bool = False  # Process LAS/LAZ while the blob is still downloading
+
     # Add historical context files
     historical_context_files: Optional[List[HistoricalContextFile]] = None
 
@@ -110,6 +160,7 @@ class ProcessingResult:
     systemPrompt: str = None
     elevationImage: str = None
     blobUrls: Dict[str, str] = field(default_factory=dict)
+    mapTiles: Dict[str, Any] = None
 
 @dataclass
 class E57ProcessingOptions:
@@ -142,10 +193,31 @@ def convert_dict_to_processing_params(params_dict: dict) -> ProcessingParameters
         # Noise filter parameters
         params.noise_filter_std_ratio = params_dict.get('NoiseFilterStdRatio', 2.0)
         params.noise_filter_neighbors = params_dict.get('NoiseFilterNeighbors', 8)
+        params.noise_filter_method = params_dict.get('NoiseFilterMethod', 'sor')
+        
+        # Voxel filter parameters
+        params.voxel_filter_size = params_dict.get('VoxelFilterSize', 0.5)
+        params.voxel_filter_min_points = params_dict.get('VoxelFilterMinPoints', 3)
+        params.voxel_filter_decimate = params_dict.get('VoxelFilterDecimate', False)
         
         # Ground classifier parameters
         params.ground_classifier_cell_size = params_dict.get('GroundClassifierCellSize', 5.0)
         params.ground_classifier_max_distance = params_dict.get('GroundClassifierMaxDistance', 0.5)
+        params.ground_classifier_method = params_dict.get('GroundClassifierMethod', 'simple')
+        
+        # Progressive morphological filter parameters
+        params.pmf_cell_size = params_dict.get('PmfCellSize', 1.0)
+        params.pmf_max_window_size = params_dict.get('PmfMaxWindowSize', 33.0)
+        params.pmf_slope = params_dict.get('PmfSlope', 1.0)
+        params.pmf_initial_distance = params_dict.get('PmfInitialDistance', 0.15)
+        params.pmf_max_distance = params_dict.get('PmfMaxDistance', 2.5)
+        
+        # Cloth simulation filter parameters
+        params.csf_cloth_resolution = params_dict.get('CsfClothResolution', 2.0)
+        params.csf_rigidness = params_dict.get('CsfRigidness', 2)
+        params.csf_iterations = params_dict.get('CsfIterations', 500)
+        params.csf_time_step = params_dict.get('CsfTimeStep', 0.65)
+        params.csf_class_threshold = params_dict.get('CsfClassThreshold', 0.5)
         
         # Hillshade parameters
         params.hillshade_azimuth = params_dict.get('HillshadeAzimuth', 315)
@@ -156,12 +228,26 @@ def convert_dict_to_processing_params(params_dict: dict) -> ProcessingParameters
         params.dtm_fill_nan = params_dict.get('DtmFillNan', True)
         params.dtm_smooth = params_dict.get('DtmSmooth', True)
         
+        params.write_geotiffs = params_dict.get('WriteGeoTiffs', True)
+        params.cog_outputs = params_dict.get('CogOutputs', False)
+        params.cog_compression = params_dict.get('CogCompression', 'deflate')
+        params.pipeline_workers = params_dict.get('PipelineWorkers')
+        params.raster_block_size = params_dict.get('RasterBlockSize', 2048)
+        params.raster_dtype = params_dict.get('RasterDtype', 'float32')
+        params.use_stage_cache = params_dict.get('UseStageCache', True)
+        
         # Visualization parameters
         params.dtm_colormap = params_dict.get('DtmColormap', 'gray')
         params.dsm_colormap = params_dict.get('DsmColormap', 'terrain')
         params.hillshade_colormap = params_dict.get('HillshadeColormap', 'gray')
         params.slope_colormap = params_dict.get('SlopeColormap', 'inferno')
         params.transparent_nodata = params_dict.get('TransparentNoData', True)
+
+        # Map tile parameters
+        params.generate_map_tiles = params_dict.get('GenerateMapTiles', False)
+        params.tile_format = params_dict.get('TileFormat', 'png')
+        params.tile_min_zoom = params_dict.get('TileMinZoom')
+        params.tile_max_zoom = params_dict.get('TileMaxZoom')
         
         # GEE parameters
         params.collection = params_dict.get('Collection', 'LANDSAT/LC08/C02/T1_TOA')
@@ -172,6 +258,12 @@ def convert_dict_to_processing_params(params_dict: dict) -> ProcessingParameters
         # E57 processing parameters
         params.max_points_per_chunk = params_dict.get('MaxPointsPerChunk', 5000000)
         
+        # Streaming parameters
+        params.streaming_mode = params_dict.get('StreamingMode', False)
+        params.streaming_chunk_size = params_dict.get('StreamingChunkSize', 2000000)
+        params.streaming_point_threshold = params_dict.get('StreamingPointThreshold', 100000000)
+        params.pipelined_download = params_dict.get('PipelinedDownload', False)
+        
         # Workflow
         workflow_nodes = params_dict.get('Workflow')
         if workflow_nodes:
@@ -1,16 +1,81 @@
 from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+from azure.core import MatchConditions
 from azure.core.exceptions import ClientAuthenticationError
+import os
+import json
+import time
+import asyncio
 import logging
 from urllib.parse import urlparse
 from core.interfaces import IBlobStorage
+from modules.progressive_file import DownloadMarker
 
 logger = logging.getLogger("Archaios.BlobStorage")
 
+# Leading bytes fetched first when the caller wants to inspect the file header early
+HEADER_PREFETCH_BYTES = 64 * 1024
+
+# Trailing bytes fetched first by progressive downloads; LAZ keeps its chunk table at the end
+TAIL_PREFETCH_BYTES = 1024 * 1024
+
+# Range size of progressive downloads
+PROGRESSIVE_CHUNK_BYTES = 4 * 1024 * 1024
+
+class DownloadProgress:
+    """Progress hook for blob transfers that logs every tenth of the file and the final throughput."""
+    def __init__(self, name: str, log_step: float = 0.1):
+        self.name = name
+        self.log_step = log_step
+        self.started = time.perf_counter()
+        self.next_fraction = log_step
+        self.bytes_done = 0
+
+    async def __call__(self, current: int, total: int) -> None:
+        self.bytes_done = current
+        if total and current / total >= self.next_fraction and current < total:
+            logger.info(f"Downloading {self.name}: {current / total:.0%} of {total / 1024 ** 2:.1f} MiB")
+            self.next_fraction = (int(current / total / self.log_step) + 1) * self.log_step
+
+    def summary(self) -> str:
+        seconds = time.perf_counter() - self.started
+        rate = self.bytes_done / 1024 ** 2 / seconds if seconds > 0 else 0.0
+        return f"{self.bytes_done / 1024 ** 2:.1f} MiB in {seconds:.2f}s ({rate:.1f} MiB/s)"
+
+def _blob_size(download_stream) -> int:
+    """Full blob size of a (possibly ranged) download, from its 'bytes a-b/size' content range."""
+    return int(download_stream.properties.content_range.rsplit('/', 1)[1])
+
+def _preallocate(file, size: int) -> None:
+    """Reserve the full file size up front so parallel ranges write into place without growing it."""
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except (AttributeError, OSError):
+        file.truncate(size)
+
 class AzureBlobStorage(IBlobStorage):
-    def __init__(self, connection_string: str):
-        self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+    def __init__(self, connection_string: str, max_concurrency: int = 8):
+        # Async client: transfers yield to the event loop so several jobs' I/O interleaves
+        self.blob_service_client = AsyncBlobServiceClient.from_connection_string(connection_string)
+        self.max_concurrency = max_concurrency
+
+    async def close(self) -> None:
+        await self.blob_service_client.close()
 
-    async def download_file(self, uri: str, local_path: str) -> None:
+    async def download_file(self, uri: str, local_path: str, on_header=None) -> str:
+        """
+        Download a blob to a local path and return its ETag.
+
+        The blob is fetched as parallel ranged requests written straight into a
+        preallocated file, so memory stays at a few chunks whatever the size.
+
+        Args:
+            uri: Blob URL
+            local_path: Destination file
+            on_header: Optional callable given the first HEADER_PREFETCH_BYTES as
+                soon as they arrive, before the rest is fetched; raising aborts
+                the download
+        """
         try:
             # Parse the blob URL to get container and blob name
             parsed_url = urlparse(uri)
@@ -22,12 +87,37 @@ class AzureBlobStorage(IBlobStorage):
             container_client = self.blob_service_client.get_container_client(container_name)
             blob_client = container_client.get_blob_client(blob_name)
 
-            # Use synchronous download methods
+            progress = DownloadProgress(blob_name)
             with open(local_path, "wb") as file:
-                download_stream = blob_client.download_blob()
-                file.write(download_stream.readall())
+                offset = 0
+                conditions = {}
+                if on_header is not None:
+                    head_stream = await blob_client.download_blob(offset=0, length=HEADER_PREFETCH_BYTES)
+                    head = await head_stream.readall()
+                    on_header(head)
+                    file.write(head)
+                    offset = len(head)
+                    # The remaining ranges must come from the same blob version as the header
+                    conditions = {'etag': head_stream.properties.etag, 'match_condition': MatchConditions.IfNotModified}
+
+                    if offset >= _blob_size(head_stream):
+                        progress.bytes_done = offset
+                        logger.info(f"Successfully downloaded blob {blob_name}: {progress.summary()}")
+                        return head_stream.properties.etag
 
-            logger.info(f"Successfully downloaded blob {blob_name}")
+                download_stream = await blob_client.download_blob(
+                    offset=offset or None,
+                    max_concurrency=self.max_concurrency,
+                    progress_hook=progress,
+                    **conditions
+                )
+                _preallocate(file, _blob_size(download_stream))
+                file.seek(offset)
+                await download_stream.readinto(file)
+                progress.bytes_done += offset
+
+            logger.info(f"Successfully downloaded blob {blob_name}: {progress.summary()}")
+            return download_stream.properties.etag
 
         except ClientAuthenticationError as auth_error:
             logger.error(f"Authentication error accessing blob: {uri}")
@@ -44,13 +134,139 @@ class AzureBlobStorage(IBlobStorage):
             container_client = self.blob_service_client.get_container_client(container_name)
             blob_client = container_client.get_blob_client(blob_name)
             
-            # Use synchronous upload methods
             with open(local_path, "rb") as file:
-                blob_client.upload_blob(file, overwrite=True)
+                await blob_client.upload_blob(file, overwrite=True)
             
             logger.info(f"Successfully uploaded {local_path} to {blob_client.url}")
             return blob_client.url
 
         except Exception as e:
             logger.error(f"Error uploading file {local_path}: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    async def start_progressive_download(self, uri: str, local_path: str):
+        """
+        Start downloading a blob so it can be read while it arrives.
+
+        The file is preallocated and a DownloadMarker is published before this
+        returns; the tail of the blob is fetched first, then ranges in order
+        with up to max_concurrency in flight, advancing the marker's contiguous
+        watermark. Readers open the file through ProgressiveFile (LiDARReader
+        does so automatically while the marker exists).
+
+        Args:
+            uri: Blob URL
+            local_path: Destination file
+
+        Returns:
+            Tuple of (etag, task); the task completes when the whole blob is on disk
+        """
+        parsed_url = urlparse(uri)
+        path_parts = parsed_url.path.strip('/').split('/')
+        blob_client = self.blob_service_client.get_container_client(path_parts[0]).get_blob_client('/'.join(path_parts[1:]))
+
+        properties = await blob_client.get_blob_properties()
+        size, etag = properties.size, properties.etag
+        with open(local_path, "wb") as file:
+            _preallocate(file, size)
+        marker = DownloadMarker(local_path, size)
+
+        task = asyncio.create_task(self._download_progressively(blob_client, local_path, size, etag, marker))
+        return etag, task
+
+    async def _download_progressively(self, blob_client, local_path, size, etag, marker):
+        progress = DownloadProgress(blob_client.blob_name)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+        fd = os.open(local_path, os.O_WRONLY)
+        pending = {}
+
+        async def fetch(offset, length):
+            async with semaphore:
+                stream = await blob_client.download_blob(offset=offset, length=length, **conditions)
+                data = await stream.readall()
+            os.pwrite(fd, data, offset)
+
+        try:
+            tail_start = max(0, size - TAIL_PREFETCH_BYTES)
+            if tail_start > 0:
+                await fetch(tail_start, size - tail_start)
+                marker.set_tail(tail_start)
+
+            offsets = list(range(0, tail_start or size, PROGRESSIVE_CHUNK_BYTES))
+            end = tail_start or size
+            pending = {
+                asyncio.ensure_future(fetch(offset, min(PROGRESSIVE_CHUNK_BYTES, end - offset))): offset
+                for offset in offsets
+            }
+            done_offsets, watermark = set(), 0
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+                    done_offsets.add(pending.pop(task))
+
+                # Only the contiguous prefix is readable, however ranges complete
+                while watermark < end and watermark in done_offsets:
+                    watermark = min(watermark + PROGRESSIVE_CHUNK_BYTES, end)
+                marker.advance(watermark)
+                await progress(watermark, size)
+
+            progress.bytes_done = size
+            marker.complete()
+            logger.info(f"Successfully downloaded blob {blob_client.blob_name} progressively: {progress.summary()}")
+            return etag
+        except BaseException:
+            marker.fail()
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            os.close(fd)
+
+class AzureBlobCacheBackend:
+    """Stage cache backend storing each entry as blobs under <prefix>/<key>/ in one container."""
+    def __init__(self, connection_string: str, container_name: str, prefix: str = "stage-cache"):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.prefix = prefix.strip('/')
+        self._container_client = None
+
+    def __getstate__(self):
+        # Pipelines may run in worker processes; each one opens its own client
+        state = self.__dict__.copy()
+        state['_container_client'] = None
+        return state
+
+    @property
+    def container_client(self):
+        if self._container_client is None:
+            client = BlobServiceClient.from_connection_string(self.connection_string).get_container_client(self.container_name)
+            if not client.exists():
+                client.create_container()
+            self._container_client = client
+        return self._container_client
+
+    def download(self, key: str, dest_dir: str) -> bool:
+        manifest_client = self.container_client.get_blob_client(f"{self.prefix}/{key}/manifest.json")
+        if not manifest_client.exists():
+            return False
+
+        manifest_bytes = manifest_client.download_blob().readall()
+        manifest = json.loads(manifest_bytes)
+        for name in manifest["files"]:
+            with open(os.path.join(dest_dir, name), "wb") as file:
+                self.container_client.get_blob_client(f"{self.prefix}/{key}/{name}").download_blob().readinto(file)
+
+        # The manifest is written last locally too, marking the entry complete
+        with open(os.path.join(dest_dir, "manifest.json"), "wb") as file:
+            file.write(manifest_bytes)
+        logger.info(f"Downloaded stage cache entry {key}")
+        return True
+
+    def upload(self, key: str, src_dir: str) -> None:
+        names = sorted(os.listdir(src_dir), key=lambda name: name == "manifest.json")
+        for name in names:
+            with open(os.path.join(src_dir, name), "rb") as file:
+                self.container_client.get_blob_client(f"{self.prefix}/{key}/{name}").upload_blob(file, overwrite=True)
+        logger.info(f"Uploaded stage cache entry {key}")
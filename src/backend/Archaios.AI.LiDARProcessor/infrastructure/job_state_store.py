@@ -0,0 +1,59 @@
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob.aio import ContainerClient
+from core.interfaces import IJobStateStore
+
+logger = logging.getLogger("Archaios.JobStateStore")
+
+def _completion_record(instance_id: str, event_name: str, status: str) -> str:
+    return json.dumps({
+        "instanceId": instance_id,
+        "eventName": event_name,
+        "status": status,
+        "completedAt": datetime.now(timezone.utc).isoformat()
+    })
+
+class AzureBlobJobStateStore(IJobStateStore):
+    """Completion records as one small blob per orchestration instance, shared by every replica."""
+    def __init__(self, connection_string: str, container_name: str):
+        self.container_client = ContainerClient.from_connection_string(connection_string, container_name)
+        self._container_created = False
+
+    async def is_completed(self, instance_id: str) -> bool:
+        try:
+            return await self.container_client.get_blob_client(f"{instance_id}.json").exists()
+        except ResourceNotFoundError:
+            return False
+
+    async def mark_completed(self, instance_id: str, event_name: str, status: str) -> None:
+        if not self._container_created:
+            try:
+                await self.container_client.create_container()
+            except ResourceExistsError:
+                pass
+            self._container_created = True
+
+        await self.container_client.upload_blob(
+            f"{instance_id}.json",
+            _completion_record(instance_id, event_name, status),
+            overwrite=True
+        )
+        logger.info(f"Recorded completion of instance {instance_id}")
+
+    async def close(self) -> None:
+        await self.container_client.close()
+
+class LocalJobStateStore(IJobStateStore):
+    """Directory-backed completion records for running the worker locally."""
+    def __init__(self, state_dir: str):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    async def is_completed(self, instance_id: str) -> bool:
+        return (self.state_dir / f"{instance_id}.json").exists()
+
+    async def mark_completed(self, instance_id: str, event_name: str, status: str) -> None:
+        (self.state_dir / f"{instance_id}.json").write_text(_completion_record(instance_id, event_name, status))
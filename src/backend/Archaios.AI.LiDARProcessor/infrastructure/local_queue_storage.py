@@ -0,0 +1,59 @@
+import os
+import base64
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from core.interfaces import IQueueStorage
+
+logger = logging.getLogger("Archaios.LocalQueueStorage")
+
+@dataclass
+class LocalQueueMessage:
+    """Queue message with the fields LiDARService reads from an Azure QueueMessage."""
+    id: str
+    content: str
+    path: Path
+    dequeue_count: int = 1
+
+class LocalQueueStorage(IQueueStorage):
+    """
+    Directory-backed stand-in for the Azure queue, for running the worker locally.
+
+    Every *.json file in the directory is one message holding the orchestrator
+    payload as plain JSON. Receiving a message renames it to *.json.leased so
+    concurrent receivers never see it twice; deleting it removes the file.
+    Leases never expire, and poison messages are moved to a poison/ subfolder.
+    """
+    def __init__(self, queue_dir: str):
+        self.queue_dir = Path(queue_dir)
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+
+    async def receive_messages(self, max_messages: int = None) -> list:
+        messages = []
+        for path in sorted(self.queue_dir.glob("*.json"), key=os.path.getmtime):
+            if max_messages is not None and len(messages) >= max_messages:
+                break
+
+            leased = path.with_suffix(".json.leased")
+            try:
+                path.rename(leased)
+            except FileNotFoundError:
+                continue
+
+            content = base64.b64encode(leased.read_bytes()).decode("utf-8")
+            messages.append(LocalQueueMessage(id=path.stem, content=content, path=leased))
+
+        logger.info(f"Received {len(messages)} messages from {self.queue_dir}")
+        return messages
+
+    async def delete_message(self, message) -> None:
+        message.path.unlink(missing_ok=True)
+
+    async def renew_message(self, message, visibility_timeout: int) -> None:
+        pass
+
+    async def move_to_poison(self, message) -> None:
+        poison_dir = self.queue_dir / "poison"
+        poison_dir.mkdir(exist_ok=True)
+        message.path.rename(poison_dir / f"{message.id}.json")
+        logger.warning(f"Moved message {message.id} to {poison_dir}")
@@ -1,15 +1,55 @@
-from azure.storage.queue import QueueClient
+import logging
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.queue.aio import QueueClient
 from core.interfaces import IQueueStorage
 
+logger = logging.getLogger("Archaios.QueueStorage")
+
 class AzureQueueStorage(IQueueStorage):
-    def __init__(self, connection_string: str, queue_name: str):
+    def __init__(self, connection_string: str, queue_name: str, visibility_timeout: int = 300, poison_queue_name: str = None):
         self.queue_client = QueueClient.from_connection_string(
             connection_string, 
             queue_name
         )
+        # Same naming as the Functions host uses for its own poison queues
+        self.poison_queue_client = QueueClient.from_connection_string(
+            connection_string,
+            poison_queue_name or f"{queue_name}-poison"
+        )
+        self.visibility_timeout = visibility_timeout
+        self._poison_queue_created = False
 
-    async def receive_messages(self) -> list:
-        return self.queue_client.receive_messages()
+    async def receive_messages(self, max_messages: int = None) -> list:
+        return [
+            message async for message in
+            self.queue_client.receive_messages(
+                messages_per_page=max_messages,
+                max_messages=max_messages,
+                visibility_timeout=self.visibility_timeout
+            )
+        ]
 
     async def delete_message(self, message) -> None:
-        self.queue_client.delete_message(message)
+        await self.queue_client.delete_message(message)
+
+    async def renew_message(self, message, visibility_timeout: int) -> None:
+        updated = await self.queue_client.update_message(message, visibility_timeout=visibility_timeout)
+        # Every update issues a new pop receipt; later renewals and the delete need it
+        message.pop_receipt = updated.pop_receipt
+        message.next_visible_on = updated.next_visible_on
+
+    async def move_to_poison(self, message) -> None:
+        if not self._poison_queue_created:
+            try:
+                await self.poison_queue_client.create_queue()
+            except ResourceExistsError:
+                pass
+            self._poison_queue_created = True
+
+        await self.poison_queue_client.send_message(message.content)
+        await self.queue_client.delete_message(message)
+        logger.warning(f"Moved message {message.id} to {self.poison_queue_client.queue_name} after {message.dequeue_count} deliveries")
+
+    async def close(self) -> None:
+        await self.queue_client.close()
+        await self.poison_queue_client.close()
@@ -4,10 +4,13 @@ import tempfile
 import argparse
 import os
 from config import AppConfig
-from infrastructure.blob_storage import AzureBlobStorage
+from infrastructure.blob_storage import AzureBlobStorage, AzureBlobCacheBackend
 from infrastructure.queue_storage import AzureQueueStorage
+from infrastructure.local_queue_storage import LocalQueueStorage
+from infrastructure.job_state_store import AzureBlobJobStateStore, LocalJobStateStore
 from services.event_service import DurableEventService
 from services.lidar_service import LiDARService
+from pipeline.stage_cache import StageCache
 
 async def main():    
     
@@ -19,18 +22,52 @@ async def main():
     logging.info(f"Starting LiDAR Processing Service in {'local' if local_mode else 'container'} mode")
     logging.getLogger('azure.core.pipeline.policies.http_logging_policy').setLevel(logging.WARNING)
 
-    blob_storage = AzureBlobStorage(config.storage_connection)
-    queue_storage = AzureQueueStorage(config.storage_connection, config.queue_name)
+    blob_storage = AzureBlobStorage(config.storage_connection, max_concurrency=config.download_concurrency)
+    if config.local_queue_dir:
+        queue_storage = LocalQueueStorage(config.local_queue_dir)
+        job_state = LocalJobStateStore(os.path.join(config.local_queue_dir, "completed"))
+    else:
+        queue_storage = AzureQueueStorage(
+            config.storage_connection,
+            config.queue_name,
+            visibility_timeout=config.queue_visibility_timeout,
+            poison_queue_name=config.poison_queue_name
+        )
+        job_state = AzureBlobJobStateStore(config.storage_connection, config.job_state_container)
     event_service = DurableEventService(config)
+
+    stage_cache = None
+    if config.stage_cache_dir:
+        cache_backend = None
+        if config.stage_cache_container:
+            cache_backend = AzureBlobCacheBackend(config.storage_connection, config.stage_cache_container)
+        stage_cache = StageCache(
+            config.stage_cache_dir,
+            max_bytes=int(config.stage_cache_max_gb * 1024 ** 3),
+            backend=cache_backend
+        )
     
     lidar_service = LiDARService(
         blob_storage,
         queue_storage,
         event_service,
-        local_mode=local_mode
+        local_mode=local_mode,
+        stage_cache=stage_cache,
+        max_concurrent_jobs=config.max_concurrent_jobs,
+        memory_budget_bytes=int(config.job_memory_budget_gb * 1024 ** 3) if config.job_memory_budget_gb else None,
+        job_state=job_state,
+        visibility_timeout=config.queue_visibility_timeout,
+        max_dequeue_count=config.max_dequeue_count
     )
     
-    await lidar_service.run()
+    try:
+        await lidar_service.run()
+    finally:
+        await blob_storage.close()
+        await event_service.close()
+        if isinstance(queue_storage, AzureQueueStorage):
+            await queue_storage.close()
+            await job_state.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,98 @@
+import math
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("Archaios.BlockProcessor")
+
+DEFAULT_BLOCK_SIZE = 2048
+
+def gaussian_halo(sigma, truncate=4.0):
+    """Kernel radius of scipy's gaussian_filter for sigma (cells needed on each side)."""
+    return int(truncate * float(sigma) + 0.5)
+
+class BlockProcessor:
+    """
+    Applies a neighbourhood operation to a raster one window at a time.
+
+    The raster is split into block_size x block_size windows, each read with a
+    halo of extra cells on every side (clipped at the raster edges). With the
+    halo at least as wide as the operation's kernel radius, the core of every
+    window matches processing the whole raster at once, including the edge
+    handling at the real borders. Windows run on a thread pool and their cores
+    are written straight into the output array, so temporaries scale with the
+    block size instead of the raster.
+
+    Usage:
+        blocks = BlockProcessor(block_size=2048, halo=1)
+        slope = blocks.map(lambda dem: compute_slope(dem), [dem])
+    """
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE, halo=1, max_workers=None):
+        """
+        Args:
+            block_size: Window edge length in cells; None or 0 processes the whole raster at once
+            halo: Overlap in cells on each side of a window
+            max_workers: Threads processing windows (None lets the executor decide)
+        """
+        self.block_size = block_size
+        self.halo = halo
+        self.max_workers = max_workers
+
+    def applies(self, shape):
+        """Whether a raster of this shape is split into more than one window."""
+        return bool(self.block_size) and max(shape) > self.block_size
+
+    def windows(self, shape):
+        """
+        Yield (core, padded, inner) slice pairs covering shape.
+
+        core is the window's region of the raster, padded the region read with
+        its halo, and inner the position of core within the padded block.
+        """
+        height, width = shape
+        for row in range(0, height, self.block_size):
+            for col in range(0, width, self.block_size):
+                row_end, col_end = min(row + self.block_size, height), min(col + self.block_size, width)
+                pad_row, pad_col = max(0, row - self.halo), max(0, col - self.halo)
+                yield (
+                    (slice(row, row_end), slice(col, col_end)),
+                    (slice(pad_row, min(height, row_end + self.halo)), slice(pad_col, min(width, col_end + self.halo))),
+                    (slice(row - pad_row, row_end - pad_row), slice(col - pad_col, col_end - pad_col)),
+                )
+
+    def map(self, func, arrays, out=None, dtype=np.float32):
+        """
+        Compute func over every window of the input arrays.
+
+        Args:
+            func: Called with the padded block of each array; returns an array
+                of the padded block's shape
+            arrays: 2D arrays of the same shape (e.g. a DEM and its nodata mask)
+            out: Array to write into, e.g. an np.memmap for rasters larger than
+                memory; allocated with dtype when None
+            dtype: dtype of the allocated output
+
+        Returns:
+            The output array
+        """
+        shape = arrays[0].shape
+        if not self.applies(shape):
+            result = func(*arrays)
+            if out is None:
+                return result
+            out[...] = result
+            return out
+
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+
+        def process(window):
+            core, padded, inner = window
+            out[core] = func(*(array[padded] for array in arrays))[inner]
+
+        count = math.ceil(shape[0] / self.block_size) * math.ceil(shape[1] / self.block_size)
+        logger.info(f"Processing {shape[1]}x{shape[0]} raster in {count} blocks of {self.block_size} with a {self.halo} cell halo")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _ in executor.map(process, self.windows(shape)):
+                pass
+        return out
@@ -0,0 +1,101 @@
+import numpy as np
+import logging
+from functools import lru_cache
+import matplotlib.cm as cm
+from PIL import Image
+
+logger = logging.getLogger("Archaios.ColormapRenderer")
+
+# Palette entries 0..254 hold the colormap, 255 is reserved for nodata
+DATA_LEVELS = 255
+NODATA_INDEX = 255
+
+# Rows normalized at a time, so the float scratch stays small on any raster size
+BLOCK_ROWS = 1024
+
+@lru_cache(maxsize=None)
+def colormap_palette(colormap, transparent_nodata=True):
+    """
+    Precomputed 256-entry RGBA lookup table for a matplotlib colormap.
+
+    Entries 0..254 sample the colormap evenly from its low to its high end;
+    entry 255 is the nodata color: transparent, or the colormap's low end
+    when transparent_nodata is False.
+
+    Returns:
+        Read-only (256, 4) uint8 array
+    """
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[:DATA_LEVELS] = np.round(cm.get_cmap(colormap)(np.linspace(0.0, 1.0, DATA_LEVELS)) * 255)
+    if not transparent_nodata:
+        lut[NODATA_INDEX] = lut[0]
+    lut.flags.writeable = False
+    return lut
+
+def valid_range(array, mask, block_rows=BLOCK_ROWS):
+    """Min and max of the unmasked cells, or None if every cell is masked."""
+    low, high = np.inf, -np.inf
+    for row in range(0, array.shape[0], block_rows):
+        values = array[row:row + block_rows][~mask[row:row + block_rows]]
+        if values.size:
+            low, high = min(low, values.min()), max(high, values.max())
+    return None if low > high else (float(low), float(high))
+
+def quantize(array, mask, vmin, vmax, block_rows=BLOCK_ROWS):
+    """
+    Map values linearly onto palette indices 0..254, with masked cells set to NODATA_INDEX.
+
+    Normalization runs over blocks of rows in float32, so the only full-size
+    allocation is the uint8 result (one byte per cell).
+    """
+    indices = np.empty(array.shape, dtype=np.uint8)
+    scale = (DATA_LEVELS - 1) / (vmax - vmin) if vmax > vmin else 0.0
+
+    for row in range(0, array.shape[0], block_rows):
+        block = array[row:row + block_rows].astype(np.float32)
+        if scale:
+            block -= vmin
+            block *= scale
+            block += 0.5
+            np.clip(block, 0, DATA_LEVELS - 1, out=block)
+        else:
+            block.fill((DATA_LEVELS - 1) // 2)
+        block[mask[row:row + block_rows]] = NODATA_INDEX
+        indices[row:row + block_rows] = block
+
+    return indices
+
+def render_paletted_png(array, mask, out_image_path, colormap='terrain', transparent_nodata=True, value_range=None):
+    """
+    Write a single-band raster as a paletted PNG colorized with a colormap.
+
+    Values are quantized to palette indices once and the colormap lookup table
+    becomes the PNG palette, so no RGBA image is ever built and no adaptive
+    quantization is needed.
+
+    Args:
+        array: 2D raster values
+        mask: Boolean nodata mask of the same shape
+        out_image_path: PNG path
+        colormap: matplotlib colormap name
+        transparent_nodata: Make nodata cells transparent
+        value_range: (min, max) to normalize with; defaults to the valid data range
+
+    Returns:
+        The (min, max) range used, or None if every cell was nodata
+    """
+    value_range = value_range or valid_range(array, mask)
+    if value_range is None:
+        indices = np.full(array.shape, NODATA_INDEX, dtype=np.uint8)
+    else:
+        indices = quantize(array, mask, *value_range)
+
+    lut = colormap_palette(colormap, transparent_nodata)
+    image = Image.fromarray(indices)
+    image.putpalette(lut[:, :3].tobytes())
+
+    save_options = {"optimize": True}
+    if (lut[:, 3] < 255).any():
+        save_options["transparency"] = lut[:, 3].tobytes()
+    image.save(out_image_path, **save_options)
+    return value_range
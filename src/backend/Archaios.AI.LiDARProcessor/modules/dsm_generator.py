@@ -3,14 +3,17 @@ import rasterio
 from rasterio.transform import from_origin
 from rasterio.crs import CRS
 import logging
+from modules.raster_data import RasterData, raster_dtype, DEFAULT_RASTER_DTYPE
 from scipy import ndimage, stats
+from modules.streaming_rasterizer import RasterGrid
 
 logger = logging.getLogger("Archaios.DSMGenerator")
 
 class DSMGenerator:
-    def __init__(self, grid_res=0.5, fallback_epsg=None):
+    def __init__(self, grid_res=0.5, fallback_epsg=None, dtype=DEFAULT_RASTER_DTYPE):
         self.grid_res = grid_res
         self.fallback_epsg = fallback_epsg
+        self.dtype = raster_dtype(dtype)
 
     def generate(self, las, output_path):
         x, y, z = las.x, las.y, las.z
@@ -18,19 +21,7 @@ class DSMGenerator:
         is_e57_derived = self._detect_e57(las, x)
         logger.info(f"E57-derived: {is_e57_derived}")
 
-        min_x, max_x = np.percentile(x, [0.5, 99.5])
-        min_y, max_y = np.percentile(y, [0.5, 99.5])
-
-        if max_x - min_x < 1 or max_y - min_y < 1:
-            logger.warning("Using full data extent due to small robust extent.")
-            min_x, max_x = np.min(x), np.max(x)
-            min_y, max_y = np.min(y), np.max(y)
-
-        # Snap bounds
-        min_x = np.floor(min_x / self.grid_res) * self.grid_res
-        min_y = np.floor(min_y / self.grid_res) * self.grid_res
-        max_x = np.ceil(max_x / self.grid_res) * self.grid_res
-        max_y = np.ceil(max_y / self.grid_res) * self.grid_res
+        min_x, min_y, max_x, max_y = self._robust_extent(x, y)
 
         # Adjust grid resolution dynamically
         point_density = len(x) / ((max_x - min_x) * (max_y - min_y))
@@ -48,10 +39,7 @@ class DSMGenerator:
         )
 
         stat = np.asarray(stat)
-        dsm_grid = np.flipud(stat.T).astype(np.float32)
-
-        # Fill NaNs
-        dsm_grid = self._fill_holes(dsm_grid, is_e57_derived)
+        dsm_grid = np.flipud(stat.T).astype(self.dtype)
 
         # Define transform
         transform = from_origin(
@@ -64,22 +52,71 @@ class DSMGenerator:
         # Define CRS
         crs = self._extract_crs(las)
 
-        # Write GeoTIFF
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            height=dsm_grid.shape[0],
-            width=dsm_grid.shape[1],
-            count=1,
-            dtype=dsm_grid.dtype,
-            crs=crs,
-            transform=transform
-        ) as dst:
-            dst.write(dsm_grid, 1)
-
-        logger.info(f"DSM written to {output_path}")
+        self._finalize(dsm_grid, transform, crs, is_e57_derived, output_path)
         return output_path
 
+    def plan_point_grid(self, x, y):
+        """
+        Choose the DSM grid for points that are all in memory.
+
+        Uses the same 0.5/99.5 percentile extent and point density as
+        generate(), so stray points far outside the survey neither enlarge
+        the grid nor coarsen its resolution; they are dropped when gridded.
+
+        Returns:
+            Tuple of (RasterGrid, is_e57_derived)
+        """
+        is_e57_derived = self._detect_e57(None, x)
+        logger.info(f"E57-derived: {is_e57_derived}")
+
+        min_x, min_y, max_x, max_y = self._robust_extent(x, y)
+        point_density = len(x) / max((max_x - min_x) * (max_y - min_y), 1e-9)
+        effective_grid_res = self._adjust_resolution(is_e57_derived, point_density)
+
+        grid = RasterGrid(min_x, min_y, max_x, max_y, effective_grid_res)
+        logger.info(f"Grid: {grid.width}x{grid.height} | Resolution: {effective_grid_res}m")
+        return grid, is_e57_derived
+
+    def plan_grid(self, header_summary, sample_x):
+        """
+        Choose the DSM grid for streamed rasterization before any cell is filled.
+
+        Percentile extents need every point, so the header bounds are used
+        instead; density comes from the header point count and E57 detection
+        from a sample of x coordinates (e.g. the first streamed batch).
+
+        Returns:
+            Tuple of (RasterGrid, is_e57_derived)
+        """
+        bounds = header_summary["bounds"]
+        is_e57_derived = self._detect_e57(None, sample_x)
+        logger.info(f"E57-derived: {is_e57_derived}")
+
+        area = max((bounds["max_x"] - bounds["min_x"]) * (bounds["max_y"] - bounds["min_y"]), 1e-9)
+        point_density = header_summary["point_count"] / area
+        effective_grid_res = self._adjust_resolution(is_e57_derived, point_density)
+
+        grid = RasterGrid.from_bounds(
+            bounds["min_x"], bounds["min_y"], bounds["max_x"], bounds["max_y"], effective_grid_res
+        )
+        logger.info(f"Grid: {grid.width}x{grid.height} | Resolution: {effective_grid_res}m")
+        return grid, is_e57_derived
+
+    def generate_from_grid(self, max_grid, grid, crs, is_e57_derived, output_path=None):
+        """Finish a DSM from a per-cell maximum elevation grid, returning a RasterData."""
+        dsm_grid = np.asarray(max_grid, dtype=self.dtype)
+        return self._finalize(dsm_grid, grid.transform, self._resolve_crs(crs), is_e57_derived, output_path)
+
+    def _finalize(self, dsm_grid, transform, crs, is_e57_derived, output_path):
+        # Fill NaNs
+        dsm_grid = self._fill_holes(dsm_grid, is_e57_derived)
+
+        raster = RasterData(dsm_grid, transform, crs)
+        if output_path:
+            raster.write(output_path)
+            logger.info(f"DSM written to {output_path}")
+        return raster
+
     def _fill_holes(self, grid, is_e57):
         nan_mask = np.isnan(grid)
         if np.all(nan_mask):
@@ -100,6 +137,23 @@ class DSMGenerator:
 
         return grid
 
+    def _robust_extent(self, x, y):
+        """0.5/99.5 percentile x/y extent snapped outwards to grid_res, as (min_x, min_y, max_x, max_y)."""
+        min_x, max_x = np.percentile(x, [0.5, 99.5])
+        min_y, max_y = np.percentile(y, [0.5, 99.5])
+
+        if max_x - min_x < 1 or max_y - min_y < 1:
+            logger.warning("Using full data extent due to small robust extent.")
+            min_x, max_x = np.min(x), np.max(x)
+            min_y, max_y = np.min(y), np.max(y)
+
+        # Snap bounds
+        min_x = np.floor(min_x / self.grid_res) * self.grid_res
+        min_y = np.floor(min_y / self.grid_res) * self.grid_res
+        max_x = np.ceil(max_x / self.grid_res) * self.grid_res
+        max_y = np.ceil(max_y / self.grid_res) * self.grid_res
+        return min_x, min_y, max_x, max_y
+
     def _adjust_resolution(self, is_e57, density):
         res = self.grid_res
         if is_e57:
@@ -134,6 +188,9 @@ class DSMGenerator:
         except Exception as e:
             logger.warning(f"Failed to parse CRS: {e}")
 
+        return self._resolve_crs(crs)
+
+    def _resolve_crs(self, crs):
         if crs is None:
             if self.fallback_epsg:
                 crs = CRS.from_string(str(self.fallback_epsg))
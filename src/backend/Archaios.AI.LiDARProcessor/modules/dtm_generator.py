@@ -6,12 +6,16 @@ from scipy.stats import binned_statistic_2d
 from scipy import ndimage
 from skimage.morphology import white_tophat, disk
 import logging
+from modules.raster_data import RasterData, raster_dtype, DEFAULT_RASTER_DTYPE
+from modules.block_processor import BlockProcessor, gaussian_halo
+from modules.streaming_rasterizer import RasterGrid
 
 logger = logging.getLogger("Archaios.DTMGenerator")
 
 class DTMGenerator:
     def __init__(self, grid_res=0.25, fallback_epsg=None, fill_nan=True, 
-                 smooth=False, apply_lrm=False, lrm_scales=(1, 5), apply_whitetophat=False, sharpen=False):
+                 smooth=False, apply_lrm=False, lrm_scales=(1, 5), apply_whitetophat=False, sharpen=False,
+                 block_size=None, max_workers=None, dtype=DEFAULT_RASTER_DTYPE):
         self.grid_res = grid_res
         self.fallback_epsg = fallback_epsg
         self.fill_nan = fill_nan
@@ -20,25 +24,16 @@ class DTMGenerator:
         self.lrm_scales = lrm_scales
         self.apply_whitetophat = apply_whitetophat
         self.sharpen = sharpen
+        self.dtype = raster_dtype(dtype)
+        # The wider Gaussian plus the 3x3 median
+        self.lrm_blocks = BlockProcessor(block_size, gaussian_halo(max(lrm_scales)) + 1, max_workers)
 
     def generate(self, las, output_path):
         x, y, z = las.x, las.y, las.z
 
-        # Inclusive filtering
-        ground_mask = np.isin(las.classification, [2])
-        if not np.any(ground_mask):
-            raise ValueError("No usable ground points found.")
+        ground_mask = self.select_ground(z, las.classification)
         xg, yg, zg = x[ground_mask], y[ground_mask], z[ground_mask]
 
-        # Outlier filtering
-        low_z = np.percentile(zg, 1)
-        high_z = np.percentile(zg, 99)
-        valid_z = (zg >= low_z) & (zg <= high_z)
-
-        xg, yg, zg = xg[valid_z], yg[valid_z], zg[valid_z]
-
-        logger.info(f"Filtered ground-like points: {len(zg)}")
-
         # Grid dimensions
         min_x, max_x = np.floor(xg.min()), np.ceil(xg.max())
         min_y, max_y = np.floor(yg.min()), np.ceil(yg.max())
@@ -55,8 +50,78 @@ class DTMGenerator:
             range=[[min_x, max_x], [min_y, max_y]]
         )
 
-        dtm = np.flipud(stat.T)
+        dtm = np.flipud(stat.T).astype(self.dtype)
+
+        transform = from_origin(min_x, max_y, self.grid_res, self.grid_res)
+        crs = self._extract_crs(las)
+
+        self._finalize(dtm, transform, crs, output_path)
+        return output_path
 
+    def select_ground(self, z, classification):
+        """
+        Mask of the ground (class 2) points kept for the DTM.
+
+        Ground points below the 1st or above the 99th percentile of ground
+        elevation are rejected as outliers.
+
+        Args:
+            z: Point elevations
+            classification: Point classification codes
+
+        Returns:
+            Boolean mask over the points
+        """
+        # Inclusive filtering
+        ground_mask = np.isin(classification, [2])
+        if not np.any(ground_mask):
+            raise ValueError("No usable ground points found.")
+
+        # Outlier filtering
+        zg = z[ground_mask]
+        low_z, high_z = np.percentile(zg, [1, 99])
+        ground_mask[ground_mask] = (zg >= low_z) & (zg <= high_z)
+
+        logger.info(f"Filtered ground-like points: {int(np.sum(ground_mask))}")
+        return ground_mask
+
+    def plan_grid(self, xg, yg):
+        """RasterGrid covering the extent of the selected ground points, snapped outwards to whole meters."""
+        return RasterGrid(np.floor(xg.min()), np.floor(yg.min()), np.ceil(xg.max()), np.ceil(yg.max()), self.grid_res)
+
+    def generate_from_grid(self, min_grid, grid, crs, output_path=None, filter_outliers=True):
+        """
+        Finish a DTM from a per-cell minimum of ground points.
+
+        Streamed points cannot be filtered by select_ground() before gridding,
+        so with filter_outliers cells whose minimum falls outside the 1st/99th
+        percentile of all cell minima are dropped instead and re-filled like
+        other gaps.
+
+        Args:
+            min_grid: North-up grid of per-cell minimum ground elevation (NaN = empty)
+            grid: RasterGrid the minima were accumulated on
+            crs: CRS of the point cloud, or None to use the fallback EPSG
+            output_path: Optional GeoTIFF output path
+            filter_outliers: Apply the per-cell outlier filter; pass False when
+                the points were already filtered by select_ground()
+
+        Returns:
+            RasterData of the finished DTM
+        """
+        dtm = np.array(min_grid, dtype=self.dtype)
+        valid = ~np.isnan(dtm)
+        if not np.any(valid):
+            raise ValueError("No usable ground points found.")
+
+        if filter_outliers:
+            low_z, high_z = np.percentile(dtm[valid], [1, 99])
+            dtm[valid & ((dtm < low_z) | (dtm > high_z))] = np.nan
+            logger.info(f"Streamed ground cells: {int(np.sum(~np.isnan(dtm)))}")
+
+        return self._finalize(dtm, grid.transform, self._resolve_crs(crs), output_path)
+
+    def _finalize(self, dtm, transform, crs, output_path):
         if np.all(np.isnan(dtm)):
             raise ValueError("All grid cells are NaN.")
 
@@ -84,36 +149,29 @@ class DTMGenerator:
             logger.info("Applying multiscale Local Relief Model...")
             dtm = self._compute_multiscale_lrm(dtm)
 
-        transform = from_origin(min_x, max_y, self.grid_res, self.grid_res)
-        crs = self._extract_crs(las)
-
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            height=dtm.shape[0],
-            width=dtm.shape[1],
-            count=1,
-            dtype=dtm.dtype,
-            crs=crs,
-            transform=transform
-        ) as dst:
-            dst.write(dtm, 1)
-
-        logger.info(f"Enhanced DTM written to {output_path}")
-        return output_path
+        raster = RasterData(dtm, transform, crs)
+        if output_path:
+            raster.write(output_path)
+            logger.info(f"Enhanced DTM written to {output_path}")
+        return raster
 
     def _compute_multiscale_lrm(self, dtm):
         sigma1, sigma2 = self.lrm_scales
-        low_pass1 = ndimage.gaussian_filter(dtm, sigma=sigma1)
-        low_pass2 = ndimage.gaussian_filter(dtm, sigma=sigma2)
-        lrm = low_pass1 - low_pass2
 
-        # Denoise
-        lrm = ndimage.median_filter(lrm, size=3)
+        def local_relief(block):
+            low_pass1 = ndimage.gaussian_filter(block, sigma=sigma1)
+            low_pass1 -= ndimage.gaussian_filter(block, sigma=sigma2)
+
+            # Denoise
+            return ndimage.median_filter(low_pass1, size=3)
+
+        lrm = self.lrm_blocks.map(local_relief, [dtm], dtype=dtm.dtype)
 
         # Normalize
         p2, p98 = np.percentile(lrm, [2, 98])
-        lrm = np.clip((lrm - p2) / (p98 - p2), 0, 1)
+        lrm -= p2
+        lrm /= p98 - p2
+        np.clip(lrm, 0, 1, out=lrm)
 
         return lrm
 
@@ -135,6 +193,11 @@ class DTMGenerator:
                 return crs
         except Exception as e:
             logger.warning(f"Failed to parse CRS from LAS header: {e}")
+        return self._resolve_crs(None)
+
+    def _resolve_crs(self, crs):
+        if crs:
+            return crs
         if self.fallback_epsg:
             logger.info(f"Using fallback EPSG: {self.fallback_epsg}")
             return CRS.from_epsg(int(self.fallback_epsg))
@@ -0,0 +1,315 @@
+import numpy as np
+import logging
+from modules.streaming_rasterizer import StreamingRasterizer
+
+logger = logging.getLogger("Archaios.FusedGridder")
+
+# Elevation bins of ZBinnedStatistics; the z band is resolved to one bin width
+Z_BINS = 65536
+
+# Per-cell candidates kept when the z band is deferred: low outliers are rare,
+# while canopy can put several DSM returns of a cell above the band
+MIN_CANDIDATES = 4
+MAX_CANDIDATES = 8
+
+class PointStatistics:
+    """
+    Running LAS summary statistics (point count, coordinate ranges,
+    classification and return number histograms) updated batch by batch.
+    """
+    def __init__(self):
+        self.point_count = 0
+        self.mins = np.full(3, np.inf)
+        self.maxs = np.full(3, -np.inf)
+        self.class_counts = None
+        self.return_counts = None
+
+    def update(self, x, y, z, classification=None, return_number=None):
+        if x.size == 0:
+            return
+
+        self.point_count += x.size
+        for axis, values in enumerate((x, y, z)):
+            self.mins[axis] = min(self.mins[axis], float(values.min()))
+            self.maxs[axis] = max(self.maxs[axis], float(values.max()))
+
+        if classification is not None:
+            counts = np.bincount(classification, minlength=256)
+            self.class_counts = counts if self.class_counts is None else self.class_counts + counts
+        if return_number is not None:
+            counts = np.bincount(return_number, minlength=16)
+            self.return_counts = counts if self.return_counts is None else self.return_counts + counts
+
+    def classification_counts(self):
+        """Dict of class code to point count, or None if classification was not tracked."""
+        if self.class_counts is None:
+            return None
+        return {int(cls): int(cnt) for cls, cnt in enumerate(self.class_counts) if cnt > 0}
+
+    def return_number_counts(self):
+        """Dict of return number to point count, or None if return numbers were not tracked."""
+        if self.return_counts is None:
+            return None
+        return {int(rn): int(cnt) for rn, cnt in enumerate(self.return_counts) if cnt > 0}
+
+class ZBinnedStatistics:
+    """
+    PointStatistics split into elevation bins, so a z band that is only known
+    after accumulation (the streaming noise filter) can still be applied.
+    Bins are kept when their centre lies inside the band.
+    """
+    def __init__(self, min_z, max_z, bins=Z_BINS, quantum=None):
+        """
+        Args:
+            min_z, max_z: Elevation range of the cloud
+            bins: Maximum number of bins
+            quantum: Optional (scale, offset) of the stored z values. Bins are
+                then whole multiples of scale centred on stored values, so the
+                band is exact when the range holds at most bins stored values.
+        """
+        self.bins = bins
+        self.low = float(min_z)
+        self.width = max((float(max_z) - self.low) / bins, 1e-9)
+        if quantum is not None and quantum[0] > 0:
+            scale, offset = quantum
+            first = np.floor((self.low - offset) / scale)
+            levels = np.floor((float(max_z) - offset) / scale) - first + 1
+            self.width = scale * max(np.ceil(levels / bins), 1)
+            self.low = offset + (first - 0.5) * scale
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.mins = np.full((bins, 3), np.inf)
+        self.maxs = np.full((bins, 3), -np.inf)
+        # Per-bin histograms of each class code / return number seen
+        self.class_counts = None
+        self.return_counts = None
+
+    def update(self, x, y, z, classification=None, return_number=None):
+        if x.size == 0:
+            return
+
+        # Points outside the header range (stale headers) land in the end bins
+        b = np.clip((z - self.low) // self.width, 0, self.bins - 1).astype(np.int64)
+        self.counts += np.bincount(b, minlength=self.bins)
+        for axis, values in enumerate((x, y, z)):
+            np.minimum.at(self.mins[:, axis], b, values)
+            np.maximum.at(self.maxs[:, axis], b, values)
+
+        if classification is not None:
+            self.class_counts = self._add_histograms(self.class_counts, b, classification, 256)
+        if return_number is not None:
+            self.return_counts = self._add_histograms(self.return_counts, b, return_number, 16)
+
+    def _add_histograms(self, histograms, b, codes, size):
+        # Only the codes present get a column, which keeps many bins affordable
+        present = np.flatnonzero(np.bincount(codes, minlength=size))
+        column = np.zeros(max(size, int(present[-1]) + 1), dtype=np.int64)
+        column[present] = np.arange(present.size)
+        counts = np.bincount(b * present.size + column[codes], minlength=self.bins * present.size)
+        counts = counts.reshape(self.bins, present.size)
+
+        histograms = {} if histograms is None else histograms
+        for i, code in enumerate(present.tolist()):
+            if code in histograms:
+                histograms[code] += counts[:, i]
+            else:
+                histograms[code] = counts[:, i].copy()
+        return histograms
+
+    def within(self, low, high):
+        """PointStatistics of the bins whose centre lies in the open interval (low, high)."""
+        centres = self.low + (np.arange(self.bins) + 0.5) * self.width
+        keep = (centres > low) & (centres < high) & (self.counts > 0)
+
+        stats = PointStatistics()
+        stats.point_count = int(self.counts[keep].sum())
+        if stats.point_count:
+            stats.mins = self.mins[keep].min(axis=0)
+            stats.maxs = self.maxs[keep].max(axis=0)
+        if self.class_counts is not None:
+            stats.class_counts = _sum_histograms(self.class_counts, keep, 256)
+        if self.return_counts is not None:
+            stats.return_counts = _sum_histograms(self.return_counts, keep, 16)
+        return stats
+
+def _sum_histograms(histograms, keep, size):
+    totals = np.zeros(max([size] + [code + 1 for code in histograms]), dtype=np.int64)
+    for code, counts in histograms.items():
+        totals[code] = counts[keep].sum()
+    return totals
+
+class FusedGridder:
+    """
+    Single-pass gridding kernel for the archaeological DSM pipeline.
+
+    Each batch is mapped to DTM cells once; that index drives the ground
+    minimum (DTM), the all-point maximum (DSM, shared when both grids match)
+    and the per-cell counts, while raw/filtered/classified LAS statistics are
+    accumulated from the same arrays. Batches can be a whole in-memory cloud
+    or chunks from LiDARReader.iter_chunks().
+
+    With z_range the noise filter's elevation band is applied after the last
+    batch (apply_band) instead of per batch: the minimum/maximum grids keep
+    several candidate values per cell and the filtered/classified statistics
+    are binned by elevation, so chunks can be gridded while the Z statistics
+    are still being accumulated.
+    """
+    def __init__(self, dtm_grid, dsm_grid=None, seed_grid=None, ground_class=2, dtype=np.float64,
+                 z_range=None, z_quantum=None):
+        """
+        Args:
+            dtm_grid: RasterGrid for the DTM
+            dsm_grid: RasterGrid for the DSM (defaults to dtm_grid)
+            seed_grid: Optional ground seed RasterGrid; when given, the all-point
+                minimum is gridded too so unclassified clouds can be classified
+                per cell afterwards
+            ground_class: Classification code of ground points
+            dtype: Element type of the DTM minimum and DSM maximum grids; the
+                all-point and seed minima used for ground classification stay float64
+            z_range: Optional (min_z, max_z) of the cloud enabling the deferred
+                z band; update() must then be called without inliers
+            z_quantum: Optional (scale, offset) of the stored z values, aligning
+                the deferred-band statistics bins to them
+        """
+        self.dtm_grid = dtm_grid
+        self.dsm_grid = dtm_grid if dsm_grid is None or dsm_grid == dtm_grid else dsm_grid
+        self.seed_grid = seed_grid
+        self.ground_class = ground_class
+
+        # Elevation band of the noise filter, set by apply_band
+        self.band = None
+
+        deferred = self.band_deferred = z_range is not None
+        low_depth = MIN_CANDIDATES if deferred else 1
+        high_depth = MAX_CANDIDATES if deferred else 1
+        self.ground_min = StreamingRasterizer(dtm_grid, statistics=("min", "count"), dtype=dtype, candidates=low_depth)
+        self.surface_max = StreamingRasterizer(self.dsm_grid, statistics=("max", "count"), dtype=dtype, candidates=high_depth)
+        self.all_min = StreamingRasterizer(dtm_grid, statistics=("min",), candidates=low_depth) if seed_grid else None
+        self.seed_min = StreamingRasterizer(seed_grid, statistics=("min",), candidates=low_depth) if seed_grid else None
+
+        # Stored z levels of the header range, for an exact single-key (cell, z) sort
+        self._z_levels = None
+        if deferred and z_quantum is not None and z_quantum[0] > 0:
+            scale, offset = z_quantum
+            first = np.floor((z_range[0] - offset) / scale)
+            levels = int(np.floor((z_range[1] - offset) / scale) - first) + 1
+            if 0 < levels and dtm_grid.size * levels < 2 ** 62:
+                self._z_levels = (scale, offset + first * scale, levels)
+
+        self.raw_stats = PointStatistics()
+        if deferred:
+            self.filtered_stats = ZBinnedStatistics(*z_range, quantum=z_quantum)
+            self.classified_stats = None
+        else:
+            self.filtered_stats = PointStatistics()
+            self.classified_stats = PointStatistics()
+
+    def update(self, x, y, z, classification=None, return_number=None, inliers=None, classified=None):
+        """
+        Accumulate one batch of points.
+
+        Args:
+            x, y, z: Point coordinates
+            classification: Original classification codes, if present
+            return_number: Return numbers, if present
+            inliers: Optional boolean mask of points kept by the noise filter
+            classified: Optional classification codes for the inlier points
+                (aligned with the masked batch) replacing the original codes
+        """
+        self.raw_stats.update(x, y, z, classification, return_number)
+
+        if inliers is not None and not np.all(inliers):
+            x, y, z = x[inliers], y[inliers], z[inliers]
+            classification = classification[inliers] if classification is not None else None
+            return_number = return_number[inliers] if return_number is not None else None
+
+        self.filtered_stats.update(x, y, z, classification, return_number)
+        if classified is not None:
+            classification = classified
+        # Deferred-band batches keep their original codes, shared with filtered_stats
+        if self.classified_stats is not None:
+            self.classified_stats.update(x, y, z, classification, return_number)
+
+        self._grid(x, y, z, classification)
+
+    def apply_band(self, low, high):
+        """
+        Restrict the deferred-band accumulation to the open z interval (low, high).
+
+        Grid minima/maxima are then read with get(..., band=gridder.band), and
+        the filtered/classified statistics become those of the kept elevation bins.
+        """
+        self.band = (low, high)
+        self.filtered_stats = self.filtered_stats.within(low, high)
+        self.classified_stats = self.filtered_stats
+
+    def update_cloud(self, raw, filtered=None, classified=None, ground=None):
+        """
+        Accumulate PointCloud views of one batch.
+
+        Args:
+            raw: PointCloud of the batch as read
+            filtered: Noise-filtered selection of raw (defaults to raw)
+            classified: View with the same selection as filtered whose
+                classification replaces the original codes (defaults to filtered)
+            ground: Optional boolean mask over the filtered points selecting the
+                DTM points (defaults to every point of ground_class)
+        """
+        filtered = raw if filtered is None else filtered
+        classified = filtered if classified is None else classified
+
+        self.raw_stats.update(raw.x, raw.y, raw.z, raw.get("classification"), raw.get("return_number"))
+
+        # Both views share one selection, so coordinates are gathered only once
+        x, y, z = filtered.x, filtered.y, filtered.z
+        return_number = filtered.get("return_number")
+        self.filtered_stats.update(x, y, z, filtered.get("classification"), return_number)
+        classification = classified.get("classification")
+        self.classified_stats.update(x, y, z, classification, return_number)
+
+        self._grid(x, y, z, classification, ground)
+
+    def _grid(self, x, y, z, classification, ground=None):
+        idx = self.dtm_grid.cell_index(x, y)
+        valid = idx >= 0
+
+        presorted = self.band_deferred
+        if presorted:
+            # Candidate grids need the batch sorted by (cell, z); sort it once
+            # for every DTM-grid accumulator instead of once per rasterizer
+            order = self._cell_z_order(idx, z)
+            idx, z, valid = idx[order], z[order], valid[order]
+            x, y = x[order], y[order]
+            classification = classification[order] if classification is not None else None
+            ground = ground[order] if ground is not None else None
+
+        if ground is None and classification is not None:
+            ground = classification == self.ground_class
+        if ground is not None:
+            ground = valid & ground
+            self.ground_min.update_indexed(idx[ground], z[ground], presorted=presorted)
+
+        if self.dsm_grid is self.dtm_grid:
+            self.surface_max.update_indexed(idx[valid], z[valid], presorted=presorted)
+        else:
+            self.surface_max.update(x, y, z)
+
+        if self.seed_grid is not None:
+            self.all_min.update_indexed(idx[valid], z[valid], presorted=presorted)
+            self.seed_min.update(x, y, z)
+
+    def _cell_z_order(self, idx, z):
+        if self._z_levels is not None:
+            scale, base, levels = self._z_levels
+            level = np.rint((z - base) / scale).astype(np.int64)
+            # Stored values map to distinct levels; outside the header range they might not
+            if level.min() >= 0 and level.max() < levels:
+                return np.argsort(idx * levels + level)
+        order = np.argsort(z)
+        return order[np.argsort(idx[order], kind="stable")]
+
+    @property
+    def ground_points(self):
+        if self.band is not None:
+            counts = self.classified_stats.class_counts
+            return int(counts[self.ground_class]) if counts is not None else 0
+        return self.ground_min.points_accumulated
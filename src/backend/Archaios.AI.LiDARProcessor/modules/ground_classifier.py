@@ -1,5 +1,9 @@
 import numpy as np
-from scipy import stats
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from scipy import ndimage
+from modules.streaming_rasterizer import RasterGrid, StreamingRasterizer
+from modules.point_cloud import PointCloud
 import logging
 
 logger = logging.getLogger("Archaios.GroundClassifier")
@@ -31,12 +35,16 @@ class GroundClassifier:
         Returns:
             bool: True if ground classification exists
         """
-        if not hasattr(las, 'classification'):
+        if isinstance(las, PointCloud):
+            classification = las.get('classification')
+        else:
+            classification = getattr(las, 'classification', None)
+        if classification is None:
             return False
             
         # Check if class 2 (ground) exists in the classification
-        ground_points = np.where(las.classification == self.ground_class)[0]
-        ground_percentage = (len(ground_points) / len(las.points)) * 100 if len(las.points) > 0 else 0
+        ground_points = np.where(classification == self.ground_class)[0]
+        ground_percentage = (len(ground_points) / len(classification)) * 100 if len(classification) > 0 else 0
         
         # Require at least some reasonable percentage to be ground
         if len(ground_points) > 0 and ground_percentage > 1.0:
@@ -49,40 +57,394 @@ class GroundClassifier:
             logger.info("Using existing ground classification")
             return las
 
-        x, y, z = las.x, las.y, las.z
+        if isinstance(las, PointCloud):
+            return las.with_column('classification', self.classify_points(las.x, las.y, las.z))
 
-        # Ensure classification is initialized
-        if not hasattr(las, 'classification') or len(las.classification) != len(z):
-            las.classification = np.full_like(z, fill_value=0, dtype=np.uint8)
+        las.classification = self.classify_points(np.asarray(las.x), np.asarray(las.y), np.asarray(las.z))
+        return las
+
+    def classify_points(self, x, y, z):
+        """
+        Classify points from their coordinates alone.
+
+        Args:
+            x, y, z: Point coordinates
+
+        Returns:
+            uint8 classification array (ground_class / non_ground_class)
+        """
+        seed_grid = RasterGrid.from_bounds(np.min(x), np.min(y), np.max(x), np.max(y), self.grid_size)
+        idx = seed_grid.cell_index(x, y)
 
-        min_x, max_x = np.min(x), np.max(x)
-        min_y, max_y = np.min(y), np.max(y)
+        seed_min = StreamingRasterizer(seed_grid, statistics=("min",))
+        seed_min.update_indexed(idx, z)
+        cell_min_z = seed_min.get("min").ravel()[idx]
 
-        n_cols = int((max_x - min_x) / self.grid_size) + 1
-        n_rows = int((max_y - min_y) / self.grid_size) + 1
+        ground_mask = z <= (cell_min_z + self.z_threshold)
 
-        stat, _, _, _ = stats.binned_statistic_2d(
-            x, y, z, statistic='min',
-            bins=[n_cols, n_rows],
-            range=[[min_x, max_x], [min_y, max_y]]
+        classification = np.where(ground_mask, self.ground_class, self.non_ground_class).astype(np.uint8)
+
+        ground_percentage = (np.sum(ground_mask) / len(z)) * 100
+        logger.info(f"Ground classification complete: {np.sum(ground_mask)} points ({ground_percentage:.2f}%) classified as ground")
+
+        return classification
+
+    def seed_grid(self, bounds):
+        """RasterGrid of ground seed cells covering the given header bounds."""
+        return RasterGrid.from_bounds(
+            bounds["min_x"], bounds["min_y"], bounds["max_x"], bounds["max_y"], self.grid_size
         )
 
-        col_idx = ((x - min_x) / self.grid_size).astype(int)
-        row_idx = ((y - min_y) / self.grid_size).astype(int)
+    def classify_grid(self, min_grid, grid, seed_min, seed_grid):
+        """
+        Derive per-cell ground minima for a streamed, unclassified cloud.
+
+        A cell's lowest point is ground exactly when it lies within z_threshold
+        of its seed cell minimum, and then it is also the lowest ground point of
+        the cell; otherwise the cell holds no ground points. This gives the same
+        DTM input as classify() without labelling individual points.
+
+        Args:
+            min_grid: North-up per-cell minimum of all points on grid
+            grid: RasterGrid of min_grid
+            seed_min: North-up per-cell minimum on seed_grid
+            seed_grid: RasterGrid with cell size grid_size
+
+        Returns:
+            min_grid with non-ground cells set to NaN
+        """
+        cell_x = grid.min_x + (np.arange(grid.width) + 0.5) * grid.res
+        cell_y = grid.max_y - (np.arange(grid.height) + 0.5) * grid.res
+        seed_cols = np.clip(((cell_x - seed_grid.min_x) / seed_grid.res).astype(int), 0, seed_grid.width - 1)
+        seed_rows = np.clip(((seed_grid.max_y - cell_y) / seed_grid.res).astype(int), 0, seed_grid.height - 1)
+
+        cell_seed_min = seed_min[seed_rows][:, seed_cols]
+        ground_mask = min_grid <= (cell_seed_min + self.z_threshold)
+
+        ground_percentage = (np.sum(ground_mask) / max(np.sum(~np.isnan(min_grid)), 1)) * 100
+        logger.info(f"Streamed ground classification complete: {ground_percentage:.2f}% of occupied cells hold ground")
+
+        return np.where(ground_mask, min_grid, np.nan)
+
+def _pmf_flags(surface, windows, thresholds):
+    """Non-ground flags of a gap-free min-Z raster after progressive openings."""
+    flags = np.zeros(surface.shape, dtype=bool)
+    for window, threshold in zip(windows, thresholds):
+        opened = ndimage.grey_opening(surface, size=(window, window))
+        flags |= (surface - opened) > threshold
+        surface = opened
+    return flags
+
+def _pmf_tile(args):
+    surface, windows, thresholds, core = args
+    rows, cols = core
+    return _pmf_flags(surface, windows, thresholds)[rows, cols]
+
+class ProgressiveMorphologicalClassifier(GroundClassifier):
+    """
+    Progressive morphological filter (Zhang et al., 2003) ground classifier.
+
+    Works on the min-Z raster: grey openings with exponentially growing windows
+    flag cells that rise above the opened surface by more than a slope-dependent
+    threshold. Large rasters are split into tiles with enough overlap for the
+    whole opening sequence and processed across a process pool.
+    """
+    def __init__(self, cell_size=1.0, max_window_size=33.0, slope=1.0, initial_distance=0.15,
+                 max_distance=2.5, z_threshold=0.5, tile_size=1024, max_workers=None,
+                 ground_class=2, non_ground_class=1):
+        """
+        Initialize the PMF classifier with configurable parameters.
+
+        Args:
+            cell_size: Cell size of the min-Z raster
+            max_window_size: Largest opening window, in map units
+            slope: Terrain slope used to scale the elevation thresholds
+            initial_distance: Elevation threshold of the first window
+            max_distance: Upper bound of the elevation threshold
+            z_threshold: Maximum height of a ground point above its cell's ground surface
+            tile_size: Tile edge in cells for parallel processing
+            max_workers: Spawned worker processes for tiled processing (None uses all cores)
+            ground_class: Classification value for ground points
+            non_ground_class: Classification value for non-ground points
+        """
+        super().__init__(grid_size=cell_size, z_threshold=z_threshold,
+                         ground_class=ground_class, non_ground_class=non_ground_class)
+        self.max_window_size = max_window_size
+        self.slope = slope
+        self.initial_distance = initial_distance
+        self.max_distance = max_distance
+        self.tile_size = tile_size
+        self.max_workers = max_workers
+        logger.info(f"PMF parameters: max_window_size={max_window_size}, slope={slope}, "
+                    f"initial_distance={initial_distance}, max_distance={max_distance}")
 
-        # Handle out-of-bound indices
-        col_idx = np.clip(col_idx, 0, n_cols - 1)
-        row_idx = np.clip(row_idx, 0, n_rows - 1)
+    def classify_points(self, x, y, z):
+        """
+        Classify points against the PMF ground surface.
 
-        # Transpose stat to align with index order
-        cell_min_z = stat.T[row_idx, col_idx]
+        Args:
+            x, y, z: Point coordinates
 
-        valid_mask = ~np.isnan(cell_min_z)
-        ground_mask = (z <= (cell_min_z + self.z_threshold)) & valid_mask
+        Returns:
+            uint8 classification array (ground_class / non_ground_class)
+        """
+        grid = RasterGrid.from_bounds(np.min(x), np.min(y), np.max(x), np.max(y), self.grid_size)
+        idx = grid.cell_index(x, y)
 
-        las.classification = np.where(ground_mask, self.ground_class, self.non_ground_class).astype(np.uint8)
+        cell_min = StreamingRasterizer(grid, statistics=("min",))
+        cell_min.update_indexed(idx, z)
+        min_z = cell_min.get("min")
+
+        ground_surface = np.where(self.non_ground_cells(min_z, grid.res), np.nan, min_z).ravel()[idx]
+        ground_mask = z <= (ground_surface + self.z_threshold)
+
+        classification = np.where(ground_mask, self.ground_class, self.non_ground_class).astype(np.uint8)
 
         ground_percentage = (np.sum(ground_mask) / len(z)) * 100
-        logger.info(f"Ground classification complete: {np.sum(ground_mask)} points ({ground_percentage:.2f}%) classified as ground")
+        logger.info(f"PMF ground classification complete: {np.sum(ground_mask)} points ({ground_percentage:.2f}%) classified as ground")
 
-        return las
+        return classification
+
+    def classify_grid(self, min_grid, grid, seed_min=None, seed_grid=None):
+        """
+        Derive per-cell ground minima for a streamed, unclassified cloud.
+
+        The PMF runs directly on the streamed min-Z raster, so no seed grid is needed.
+
+        Args:
+            min_grid: North-up per-cell minimum of all points on grid
+            grid: RasterGrid of min_grid
+
+        Returns:
+            min_grid with non-ground cells set to NaN
+        """
+        non_ground = self.non_ground_cells(min_grid, grid.res)
+
+        ground_percentage = (np.sum(~non_ground & ~np.isnan(min_grid)) / max(np.sum(~np.isnan(min_grid)), 1)) * 100
+        logger.info(f"Streamed PMF ground classification complete: {ground_percentage:.2f}% of occupied cells hold ground")
+
+        return np.where(non_ground, np.nan, min_grid)
+
+    def window_schedule(self, res):
+        """
+        Opening windows (in cells) and their elevation thresholds.
+
+        Windows grow as 2 * 2^k + 1 cells; the threshold of each window is
+        slope * (w_k - w_k-1) * res + initial_distance, capped at max_distance.
+        """
+        windows = [3]
+        while (2 * 2 ** len(windows) + 1) * res <= self.max_window_size:
+            windows.append(2 * 2 ** len(windows) + 1)
+
+        thresholds = [self.initial_distance]
+        for previous, window in zip(windows, windows[1:]):
+            thresholds.append(min(self.slope * (window - previous) * res + self.initial_distance, self.max_distance))
+        return windows, thresholds
+
+    def non_ground_cells(self, min_z, res):
+        """
+        Run the progressive morphological filter on a min-Z raster.
+
+        Args:
+            min_z: North-up per-cell minimum elevation (NaN for empty cells)
+            res: Cell size of min_z
+
+        Returns:
+            Boolean raster, True for occupied cells flagged as non-ground
+        """
+        valid = ~np.isnan(min_z)
+        if not np.any(valid):
+            return np.zeros(min_z.shape, dtype=bool)
+
+        # Openings need a gap-free surface; empty cells take their nearest neighbour's value
+        nearest = ndimage.distance_transform_edt(~valid, return_distances=False, return_indices=True)
+        surface = min_z[tuple(nearest)]
+
+        windows, thresholds = self.window_schedule(res)
+        # Each opening reads w - 1 cells around a cell, so this halo keeps tiles exact
+        halo = sum(window - 1 for window in windows)
+        logger.info(f"PMF windows {windows} with thresholds {[round(t, 2) for t in thresholds]}")
+
+        height, width = surface.shape
+        if height <= self.tile_size and width <= self.tile_size:
+            return _pmf_flags(surface, windows, thresholds) & valid
+
+        tasks, cores = [], []
+        for row in range(0, height, self.tile_size):
+            for col in range(0, width, self.tile_size):
+                r0, c0 = max(row - halo, 0), max(col - halo, 0)
+                r1, c1 = min(row + self.tile_size + halo, height), min(col + self.tile_size + halo, width)
+                rows = slice(row - r0, min(row + self.tile_size, height) - r0)
+                cols = slice(col - c0, min(col + self.tile_size, width) - c0)
+                tasks.append((surface[r0:r1, c0:c1], windows, thresholds, (rows, cols)))
+                cores.append((slice(row, row + self.tile_size), slice(col, col + self.tile_size)))
+
+        logger.info(f"Running PMF on {len(tasks)} tiles of {self.tile_size} cells with a {halo}-cell overlap")
+        flags = np.zeros(surface.shape, dtype=bool)
+        # Spawned, not forked: the caller may be a thread of the service's event
+        # loop process holding live client sockets and locks
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for core, tile_flags in zip(cores, executor.map(_pmf_tile, tasks)):
+                flags[core] = tile_flags
+        return flags & valid
+
+class ClothSimulationClassifier(GroundClassifier):
+    """
+    Cloth Simulation Filter (Zhang et al., 2016) ground classifier.
+
+    The min-Z raster is inverted and a grid of cloth particles falls onto it
+    under gravity; particles that hit the surface stick, and internal springs
+    between neighbouring particles (rigidness) keep the cloth from sinking into
+    the inverted canopy. Every step is a whole-array NumPy update, so the cost
+    depends on the raster size rather than the point count.
+    """
+    def __init__(self, cloth_resolution=2.0, rigidness=2, iterations=500, time_step=0.65,
+                 class_threshold=0.5, gravity=0.2, damping=0.01, tolerance=0.005,
+                 ground_class=2, non_ground_class=1):
+        """
+        Initialize the CSF classifier with configurable parameters.
+
+        Args:
+            cloth_resolution: Distance between cloth particles
+            rigidness: Spring relaxation passes per step (1 steep, 2 relief, 3 flat terrain)
+            iterations: Maximum number of simulation steps
+            time_step: Simulation time step
+            class_threshold: Maximum distance of a ground point from the cloth
+            gravity: Gravity acceleration applied to the cloth
+            damping: Velocity damping of the Verlet integration
+            tolerance: Maximum particle movement at which the simulation is settled
+            ground_class: Classification value for ground points
+            non_ground_class: Classification value for non-ground points
+        """
+        super().__init__(grid_size=cloth_resolution, z_threshold=class_threshold,
+                         ground_class=ground_class, non_ground_class=non_ground_class)
+        self.rigidness = max(int(rigidness), 1)
+        self.iterations = iterations
+        self.time_step = time_step
+        self.gravity = gravity
+        self.damping = damping
+        self.tolerance = tolerance
+        logger.info(f"CSF parameters: cloth_resolution={cloth_resolution}, rigidness={rigidness}, "
+                    f"iterations={iterations}, class_threshold={class_threshold}")
+
+    def classify_points(self, x, y, z):
+        """
+        Classify points by their distance to the simulated cloth.
+
+        Args:
+            x, y, z: Point coordinates
+
+        Returns:
+            uint8 classification array (ground_class / non_ground_class)
+        """
+        grid = RasterGrid.from_bounds(np.min(x), np.min(y), np.max(x), np.max(y), self.grid_size)
+        cell_min = StreamingRasterizer(grid, statistics=("min",))
+        cell_min.update(x, y, z)
+        cloth = self.simulate(cell_min.get("min"))
+
+        # Bilinear cloth height at every point, in fractional cell coordinates
+        rows = (grid.max_y - y) / grid.res - 0.5
+        cols = (x - grid.min_x) / grid.res - 0.5
+        cloth_z = ndimage.map_coordinates(cloth, [rows, cols], order=1, mode='nearest')
+        ground_mask = np.abs(z - cloth_z) <= self.z_threshold
+
+        classification = np.where(ground_mask, self.ground_class, self.non_ground_class).astype(np.uint8)
+
+        ground_percentage = (np.sum(ground_mask) / len(z)) * 100
+        logger.info(f"CSF ground classification complete: {np.sum(ground_mask)} points ({ground_percentage:.2f}%) classified as ground")
+
+        return classification
+
+    def classify_grid(self, min_grid, grid, seed_min=None, seed_grid=None):
+        """
+        Derive per-cell ground minima for a streamed, unclassified cloud.
+
+        The streamed min-Z raster is aggregated to the cloth resolution, the
+        cloth is simulated there and cells within class_threshold of it are kept.
+
+        Args:
+            min_grid: North-up per-cell minimum of all points on grid
+            grid: RasterGrid of min_grid
+
+        Returns:
+            min_grid with non-ground cells set to NaN
+        """
+        factor = max(int(round(self.grid_size / grid.res)), 1)
+        height, width = min_grid.shape
+        padded = np.full((-(-height // factor) * factor, -(-width // factor) * factor), np.nan)
+        padded[:height, :width] = min_grid
+        blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+        with np.errstate(all='ignore'):
+            cloth_min = np.where(np.all(np.isnan(blocks), axis=(1, 3)), np.nan, np.nanmin(blocks, axis=(1, 3)))
+        cloth = self.simulate(cloth_min)
+
+        rows = (np.arange(height) + 0.5) / factor - 0.5
+        cols = (np.arange(width) + 0.5) / factor - 0.5
+        grid_rows, grid_cols = np.meshgrid(rows, cols, indexing='ij')
+        cloth_z = ndimage.map_coordinates(cloth, [grid_rows, grid_cols], order=1, mode='nearest')
+        ground_mask = np.abs(min_grid - cloth_z) <= self.z_threshold
+
+        ground_percentage = (np.sum(ground_mask) / max(np.sum(~np.isnan(min_grid)), 1)) * 100
+        logger.info(f"Streamed CSF ground classification complete: {ground_percentage:.2f}% of occupied cells hold ground")
+
+        return np.where(ground_mask, min_grid, np.nan)
+
+    def simulate(self, min_z):
+        """
+        Drop the cloth onto the inverted min-Z raster.
+
+        Args:
+            min_z: North-up per-cell minimum elevation (NaN for empty cells)
+
+        Returns:
+            Cloth elevation per cell, in the original (non-inverted) heights
+        """
+        valid = ~np.isnan(min_z)
+        if not np.any(valid):
+            return np.full(min_z.shape, np.nan)
+
+        nearest = ndimage.distance_transform_edt(~valid, return_distances=False, return_indices=True)
+        surface = -min_z[tuple(nearest)]
+
+        cloth = np.full(surface.shape, surface.max() + self.z_threshold)
+        previous = cloth.copy()
+        movable = np.ones(surface.shape, dtype=bool)
+        displacement = self.gravity * self.time_step ** 2
+
+        for step in range(self.iterations):
+            # Verlet integration under gravity for particles still falling
+            moved = cloth + (cloth - previous) * (1.0 - self.damping) - displacement
+            previous = cloth
+            cloth = np.where(movable, moved, cloth)
+
+            for _ in range(self.rigidness):
+                self._relax(cloth, movable)
+
+            # Particles reaching the surface stick to it
+            collided = movable & (cloth <= surface)
+            cloth[collided] = surface[collided]
+            movable &= ~collided
+
+            change = np.abs(cloth - previous)[movable]
+            if change.size == 0 or change.max() < self.tolerance:
+                logger.info(f"Cloth settled after {step + 1} iterations")
+                break
+
+        return -cloth
+
+    def _relax(self, cloth, movable):
+        """One pass of the springs between horizontally and vertically adjacent particles."""
+        for axis in (0, 1):
+            first = (slice(None, -1), slice(None)) if axis == 0 else (slice(None), slice(None, -1))
+            second = (slice(1, None), slice(None)) if axis == 0 else (slice(None), slice(1, None))
+            difference = cloth[second] - cloth[first]
+            first_movable, second_movable = movable[first], movable[second]
+
+            # A movable particle takes half the correction when its neighbour can
+            # move too and all of it when the neighbour is fixed; the whole pass is
+            # scaled by 0.5 so simultaneous updates stay a convex combination
+            both = first_movable & second_movable
+            first_weight = np.where(both, 0.25, np.where(first_movable, 0.5, 0.0))
+            second_weight = np.where(both, 0.25, np.where(second_movable, 0.5, 0.0))
+            cloth[first] += first_weight * difference
+            cloth[second] -= second_weight * difference
@@ -1,55 +1,70 @@
 import rasterio
 from rasterio.enums import Resampling
-from matplotlib.colors import LightSource
 import numpy as np
 from scipy.ndimage import gaussian_filter
 import logging
+from functools import partial
+from modules.raster_data import RasterData
+from modules.terrain_derivatives import TerrainDerivatives
+from modules.block_processor import BlockProcessor, gaussian_halo
 
 logger = logging.getLogger(__name__)
 
 class HillshadeGenerator:
-    def __init__(self, azimuth=315, altitude=45, z_factor=1.0, smooth_sigma=0.0, stretch=True):
+    def __init__(self, azimuth=315, altitude=45, z_factor=1.0, smooth_sigma=0.0, stretch=True, block_size=None, max_workers=None):
         self.azimuth = azimuth
         self.altitude = altitude
         self.z_factor = z_factor
         self.smooth_sigma = smooth_sigma
         self.stretch = stretch
+        # Horn's 3x3 kernel, widened by the smoothing kernel when there is one
+        halo = 1 + (gaussian_halo(smooth_sigma) if smooth_sigma > 0.0 else 0)
+        self.blocks = BlockProcessor(block_size, halo, max_workers)
 
     def _contrast_stretch(self, arr, low=2, high=98):
+        # In place: the hillshade is already a fresh full-size array
         p_low, p_high = np.percentile(arr[~np.isnan(arr)], (low, high))
-        stretched = np.clip((arr - p_low) / (p_high - p_low), 0, 1)
-        return stretched
+        arr -= p_low
+        arr /= p_high - p_low
+        np.clip(arr, 0, 1, out=arr)
+        return arr
 
     def generate(self, dtm_path, output_path):
-        with rasterio.open(dtm_path) as src:
-            dtm = src.read(1, masked=True)
-            transform = src.transform
-            crs = src.crs
-            cellsize = (transform.a + abs(transform.e)) / 2.0
-            base_dtm = dtm.filled(np.nan)
-
-            if self.smooth_sigma > 0.0:
-                base_dtm = gaussian_filter(base_dtm, sigma=self.smooth_sigma)
-
-            ls = LightSource(azdeg=self.azimuth, altdeg=self.altitude)
-            hillshade = ls.hillshade(base_dtm, vert_exag=self.z_factor, dx=cellsize, dy=cellsize)
-            hillshade = np.where(dtm.mask, np.nan, hillshade)
-
-            if self.stretch:
-                hillshade = self._contrast_stretch(hillshade)
-
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            height=hillshade.shape[0],
-            width=hillshade.shape[1],
-            count=1,
-            dtype='float32',
-            crs=crs,
-            transform=transform,
-            nodata=np.nan
-        ) as dst:
-            dst.write(hillshade.astype('float32'), 1)
-
+        self.generate_raster(dtm_path).write(output_path)
         logger.info(f"Hillshade written to {output_path}")
         return output_path
+
+    def generate_raster(self, dtm, derivatives=None):
+        """
+        Compute the hillshade in memory.
+
+        Rasters larger than block_size are shaded window by window.
+
+        Args:
+            dtm: RasterData or path to a DTM GeoTIFF
+            derivatives: Optional precomputed TerrainDerivatives of dtm
+                (ignored when smooth_sigma requires a smoothed surface or the
+                raster is processed in blocks)
+
+        Returns:
+            float32 RasterData with NaN nodata
+        """
+        dtm = RasterData.load(dtm)
+
+        if derivatives is not None and self.smooth_sigma == 0.0 and not self.blocks.applies(dtm.shape):
+            hillshade = derivatives.hillshade(self.azimuth, self.altitude, self.z_factor)
+            hillshade[dtm.mask] = np.nan
+        else:
+            hillshade = self.blocks.map(partial(self._shade_block, dtm.transform), [dtm.filled(np.nan), dtm.mask])
+
+        if self.stretch:
+            hillshade = self._contrast_stretch(hillshade)
+
+        return dtm.with_array(hillshade.astype('float32', copy=False), nodata=np.nan)
+
+    def _shade_block(self, transform, dem, mask):
+        if self.smooth_sigma > 0.0:
+            dem = gaussian_filter(dem, sigma=self.smooth_sigma)
+        hillshade = TerrainDerivatives(dem, transform.a, abs(transform.e)).hillshade(self.azimuth, self.altitude, self.z_factor)
+        hillshade[mask] = np.nan
+        return hillshade
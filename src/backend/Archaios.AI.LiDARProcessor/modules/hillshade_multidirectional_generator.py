@@ -1,58 +1,62 @@
 import rasterio
 import numpy as np
 from rasterio.enums import Resampling
-from matplotlib.colors import LightSource
+from modules.raster_data import RasterData
+from modules.terrain_derivatives import TerrainDerivatives
+from modules.block_processor import BlockProcessor
 
 class HillshadeMultiDirectionalGenerator:
-    def __init__(self, z_factor=1.0, multi=True, azimuths=None, altitude=45, stretch=True):
+    def __init__(self, z_factor=1.0, multi=True, azimuths=None, altitude=45, stretch=True, block_size=None, max_workers=None):
         self.z_factor = z_factor
         self.multi = multi
         self.azimuths = azimuths or [315, 0, 45, 90, 135, 180, 225, 270]
         self.altitude = altitude
         self.stretch = stretch
+        self.blocks = BlockProcessor(block_size, halo=1, max_workers=max_workers)
 
     def _contrast_stretch(self, arr, low=2, high=98):
+        # In place: the hillshade is already a fresh full-size array
         p_low, p_high = np.percentile(arr[~np.isnan(arr)], (low, high))
-        stretched = np.clip((arr - p_low) / (p_high - p_low), 0, 1)
-        return stretched
+        arr -= p_low
+        arr /= p_high - p_low
+        np.clip(arr, 0, 1, out=arr)
+        return arr
 
     def generate(self, dtm_path, output_path):
-        with rasterio.open(dtm_path) as src:
-            dtm = src.read(1, masked=True)
-            transform = src.transform
-            crs = src.crs
-            cellsize = (transform.a + abs(transform.e)) / 2.0
-            base_dtm = dtm.filled(np.nan)
-
-            if self.multi:
-                hillshade = self._multi_directional(base_dtm, cellsize)
-            else:
-                ls = LightSource(azdeg=self.azimuths[0], altdeg=self.altitude)
-                hillshade = ls.hillshade(base_dtm, vert_exag=self.z_factor, dx=cellsize, dy=cellsize)
-
-            hillshade = np.where(dtm.mask, np.nan, hillshade)
-
-            if self.stretch:
-                hillshade = self._contrast_stretch(hillshade)
-
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            height=hillshade.shape[0],
-            width=hillshade.shape[1],
-            count=1,
-            dtype='float32',
-            crs=crs,
-            transform=transform,
-            nodata=np.nan
-        ) as dst:
-            dst.write(hillshade.astype('float32'), 1)
+        self.generate_raster(dtm_path).write(output_path)
         return output_path
 
-    def _multi_directional(self, dtm, cellsize):
-        results = []
-        for az in self.azimuths:
-            ls = LightSource(azdeg=az, altdeg=self.altitude)
-            hs = ls.hillshade(dtm, vert_exag=self.z_factor, dx=cellsize, dy=cellsize)
-            results.append(hs)
-        return np.mean(results, axis=0)
+    def generate_raster(self, dtm, derivatives=None):
+        """
+        Compute the (multi-directional) hillshade in memory.
+
+        All azimuths share one set of gradients, so extra directions only add
+        a per-azimuth dot product. Rasters larger than block_size are shaded
+        window by window.
+
+        Args:
+            dtm: RasterData or path to a DTM GeoTIFF
+            derivatives: Optional precomputed TerrainDerivatives of dtm
+                (ignored when the raster is processed in blocks)
+
+        Returns:
+            float32 RasterData with NaN nodata
+        """
+        dtm = RasterData.load(dtm)
+        azimuths = self.azimuths if self.multi else self.azimuths[:1]
+
+        def shade(dem, mask, derivatives=None):
+            derivatives = derivatives or TerrainDerivatives(dem, dtm.transform.a, abs(dtm.transform.e))
+            hillshade = derivatives.multi_hillshade(azimuths, self.altitude, self.z_factor)
+            hillshade[mask] = np.nan
+            return hillshade
+
+        if derivatives is not None and not self.blocks.applies(dtm.shape):
+            hillshade = shade(None, dtm.mask, derivatives)
+        else:
+            hillshade = self.blocks.map(shade, [dtm.filled(np.nan), dtm.mask])
+
+        if self.stretch:
+            hillshade = self._contrast_stretch(hillshade)
+
+        return dtm.with_array(hillshade.astype('float32', copy=False), nodata=np.nan)
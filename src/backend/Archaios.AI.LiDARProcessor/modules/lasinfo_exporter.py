@@ -1,5 +1,6 @@
 import numpy as np
 from pathlib import Path
+from modules.fused_gridder import PointStatistics
 
 class LASInfoExporter:
     """
@@ -9,50 +10,64 @@ class LASInfoExporter:
         self.output_dir = Path(output_dir)
 
     def export(self, las, stage_name: str):
+        dimension_names = las.point_format.dimension_names
+        stats = PointStatistics()
+        stats.update(
+            np.asarray(las.x), np.asarray(las.y), np.asarray(las.z),
+            np.asarray(las.classification) if 'classification' in dimension_names else None,
+            np.asarray(las.return_number) if 'return_number' in dimension_names else None
+        )
+        return self.export_statistics(stats, las.header, stage_name)
+
+    def export_statistics(self, stats: PointStatistics, header, stage_name: str):
+        """
+        Write the info file from pre-computed statistics (e.g. from FusedGridder),
+        so no pass over the point records is needed here.
+        """
         info_path = self.output_dir / f"{stage_name}_info.txt"
         with open(info_path, "w") as f:
             f.write(f"LAS Info ({stage_name})\n")
             f.write("=" * 40 + "\n")
 
-            if hasattr(las, 'header'):
-                f.write(f"File Signature: {getattr(las.header, 'file_signature', 'N/A')}\n")
-                f.write(f"Version: {getattr(las.header, 'version', 'N/A')}\n")
-                f.write(f"System Identifier: {getattr(las.header, 'system_identifier', 'N/A')}\n")
-                f.write(f"Generating Software: {getattr(las.header, 'generating_software', 'N/A')}\n")
-                f.write(f"Creation Date: {getattr(las.header, 'creation_date', 'N/A')}\n")
+            if header is not None:
+                f.write(f"File Signature: {getattr(header, 'file_signature', 'N/A')}\n")
+                f.write(f"Version: {getattr(header, 'version', 'N/A')}\n")
+                f.write(f"System Identifier: {getattr(header, 'system_identifier', 'N/A')}\n")
+                f.write(f"Generating Software: {getattr(header, 'generating_software', 'N/A')}\n")
+                f.write(f"Creation Date: {getattr(header, 'creation_date', 'N/A')}\n")
                 try:
-                    crs = las.header.parse_crs()
+                    crs = header.parse_crs()
                     f.write(f"CRS: {crs}\n")
                 except:
                     f.write("CRS: (unknown)\n")
 
             f.write("\nPoint Records:\n")
-            f.write(f"Total Points: {len(las.points)}\n")
-            point_format = getattr(las.header, 'point_format', None)
+            f.write(f"Total Points: {stats.point_count}\n")
+            point_format = getattr(header, 'point_format', None)
             f.write(f"Point Format: {point_format}\n")
 
             f.write("\nCoordinate Ranges:\n")
-            f.write(f"  X: {np.min(las.x):.3f} - {np.max(las.x):.3f}\n")
-            f.write(f"  Y: {np.min(las.y):.3f} - {np.max(las.y):.3f}\n")
-            f.write(f"  Z: {np.min(las.z):.3f} - {np.max(las.z):.3f}\n")
+            for axis, name in enumerate(("X", "Y", "Z")):
+                f.write(f"  {name}: {stats.mins[axis]:.3f} - {stats.maxs[axis]:.3f}\n")
 
-            if 'classification' in las.point_format.dimension_names:
+            class_counts = stats.classification_counts()
+            if class_counts is not None:
                 f.write("\nClassifications:\n")
-                unique_classes, counts = np.unique(las.classification, return_counts=True)
-                for cls, cnt in zip(unique_classes, counts):
+                for cls, cnt in class_counts.items():
                     f.write(f"  Class {cls}: {cnt}\n")
             else:
                 f.write("\nClassifications: Not present\n")
 
-            if 'return_number' in las.point_format.dimension_names:
+            return_counts = stats.return_number_counts()
+            if return_counts is not None:
                 f.write("\nReturn Numbers:\n")
-                unique_returns, return_counts = np.unique(las.return_number, return_counts=True)
-                for rn, cnt in zip(unique_returns, return_counts):
+                for rn, cnt in return_counts.items():
                     f.write(f"  Return {rn}: {cnt}\n")
             else:
                 f.write("\nReturn Numbers: Not present\n")
 
-            extra_dims = [dim for dim in las.point_format.dimension_names 
+            dimension_names = point_format.dimension_names if point_format is not None else []
+            extra_dims = [dim for dim in dimension_names
                           if dim not in ['X', 'Y', 'Z', 'classification', 'return_number']]
             if extra_dims:
                 f.write("\nOther Dimensions:\n")
@@ -1,9 +1,179 @@
 import laspy
+import numpy as np
+import logging
+from modules.point_cloud import PointCloud, CLOUD_DIMENSIONS
+from modules.progressive_file import ProgressiveFile
+
+logger = logging.getLogger("Archaios.LiDARReader")
+
+DEFAULT_CHUNK_SIZE = 2_000_000
+DEFAULT_DIMENSIONS = ("x", "y", "z", "classification")
+
+# ASPRS class code of ground points
+GROUND_CLASS = 2
+
+# Sample probe() decodes to look for existing classes: 16 x 64k records
+PROBE_SAMPLE_WINDOWS = 16
+PROBE_WINDOW_POINTS = 65536
 
 class LiDARReader:
-    def __init__(self, input_path):
+    def __init__(self, input_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Args:
+            input_path: Path to a LAS/LAZ file
+            chunk_size: Number of points per batch in streaming mode
+        """
         self.input_path = input_path
+        self.chunk_size = chunk_size
 
     def read(self):
-        las = laspy.read(self.input_path)
-        return las
+        with self._open() as reader:
+            return reader.read()
+
+    def _open(self):
+        """
+        Open the input with laspy. While the file is still being downloaded
+        progressively, reads block until the bytes they need have arrived.
+        """
+        if ProgressiveFile.in_progress(self.input_path):
+            return laspy.open(ProgressiveFile(self.input_path))
+        return laspy.open(self.input_path)
+
+    def read_cloud(self, dimensions=CLOUD_DIMENSIONS):
+        """
+        Read only the requested dimensions into a columnar PointCloud.
+
+        Batches are copied into preallocated columns, so the full LAS record
+        array (every dimension of every point) is never held in memory.
+
+        Args:
+            dimensions: Dimension names to extract; x/y/z are returned scaled
+
+        Returns:
+            PointCloud with the file header attached
+        """
+        header = self.read_header()
+        columns = None
+        start = 0
+        for batch in self.iter_chunks(dimensions=dimensions):
+            if columns is None:
+                columns = {dim: np.empty(header.point_count, dtype=values.dtype) for dim, values in batch.items()}
+            size = len(batch["z"])
+            for dim, values in batch.items():
+                columns[dim][start:start + size] = values
+            start += size
+
+        if columns is None:
+            columns = {dim: np.empty(0) for dim in ("x", "y", "z")}
+        elif start != header.point_count:
+            columns = {dim: values[:start] for dim, values in columns.items()}
+
+        logger.info(f"Read {start} points with dimensions {list(columns)}")
+        return PointCloud(columns, header)
+
+    def read_header(self):
+        """Read the LAS header without decoding any point records."""
+        with self._open() as reader:
+            return reader.header
+
+    def header_summary(self):
+        """
+        Summarize the file from its header alone (bounds, point count, CRS).
+
+        Returns:
+            Dict with point_count, bounds, point_format, version, scales, offsets,
+            crs and the available dimension names
+        """
+        header = self.read_header()
+        mins, maxs = header.mins, header.maxs
+
+        crs = None
+        try:
+            crs = header.parse_crs()
+        except Exception as e:
+            logger.warning(f"Failed to parse CRS from LAS header: {e}")
+
+        summary = {
+            "point_count": int(header.point_count),
+            "point_format": header.point_format.id,
+            "version": str(header.version),
+            "bounds": {
+                "min_x": float(mins[0]), "max_x": float(maxs[0]),
+                "min_y": float(mins[1]), "max_y": float(maxs[1]),
+                "min_z": float(mins[2]), "max_z": float(maxs[2]),
+            },
+            "scales": [float(s) for s in header.scales],
+            "offsets": [float(o) for o in header.offsets],
+            "crs": crs,
+            "dimensions": list(header.point_format.dimension_names),
+        }
+        logger.info(f"Header summary: {summary['point_count']} points, format {summary['point_format']}")
+        return summary
+
+    def probe(self, sample_windows=PROBE_SAMPLE_WINDOWS, window_points=PROBE_WINDOW_POINTS):
+        """
+        Answer the pre-processing questions about a file without loading it.
+
+        Header facts (point count, bounds, CRS, point format) come from
+        header_summary(). Whether the points are already ground classified is
+        decided from sample_windows evenly spaced runs of window_points records
+        (the whole file when it is smaller than the sample), stopping at the
+        first ground point; LAZ readers seek straight to each window.
+
+        Args:
+            sample_windows: Number of windows to decode; 0 skips the scan
+            window_points: Records per window
+
+        Returns:
+            The header summary plus has_ground_classification (None when not scanned)
+        """
+        summary = self.header_summary()
+        summary["has_ground_classification"] = None
+        if sample_windows > 0:
+            summary["has_ground_classification"] = self._sample_for_class(GROUND_CLASS, sample_windows, window_points)
+        return summary
+
+    def _sample_for_class(self, class_code, sample_windows, window_points):
+        with self._open() as reader:
+            if "classification" not in reader.header.point_format.dimension_names:
+                return False
+
+            point_count = reader.header.point_count
+            if point_count <= sample_windows * window_points:
+                return any(np.any(points.classification == class_code) for points in reader.chunk_iterator(window_points))
+
+            step = point_count // sample_windows
+            for window in range(sample_windows):
+                reader.seek(window * step)
+                if np.any(reader.read_points(window_points).classification == class_code):
+                    return True
+            return False
+
+    def iter_chunks(self, chunk_size=None, dimensions=DEFAULT_DIMENSIONS):
+        """
+        Stream the point cloud as fixed-size batches using laspy's chunk iterator.
+
+        Only one batch is decoded at a time, so memory stays bounded by
+        chunk_size regardless of the file size.
+
+        Args:
+            chunk_size: Points per batch (defaults to the reader's chunk_size)
+            dimensions: Dimension names to extract; x/y/z are returned scaled
+
+        Yields:
+            Dict mapping dimension name to a NumPy array for each batch
+        """
+        chunk_size = chunk_size or self.chunk_size
+        with self._open() as reader:
+            available = set(reader.header.point_format.dimension_names)
+            missing = [dim for dim in dimensions if dim not in ("x", "y", "z") and dim not in available]
+            if missing:
+                logger.warning(f"Dimensions not present in point format, skipping: {missing}")
+
+            for points in reader.chunk_iterator(chunk_size):
+                batch = {}
+                for dim in dimensions:
+                    if dim in missing:
+                        continue
+                    batch[dim] = np.asarray(points[dim])
+                yield batch
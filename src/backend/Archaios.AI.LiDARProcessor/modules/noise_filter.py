@@ -1,45 +1,53 @@
 import numpy as np
 import laspy
 import logging
+from modules.point_cloud import PointCloud
+from scipy.spatial import cKDTree
+from modules.streaming_rasterizer import RasterGrid
 
 logger = logging.getLogger("Archaios.NoiseFilter")
 
+DEFAULT_TILE_POINTS = 4_000_000
+QUERY_BATCH_SIZE = 1_000_000
+
 class NoiseFilter:
-    def __init__(self, nb_neighbors=8, std_ratio=2.0):
+    def __init__(self, nb_neighbors=8, std_ratio=2.0, tile_points=DEFAULT_TILE_POINTS, workers=-1):
         """
         Initialize noise filter with configurable parameters
         
         Args:
             nb_neighbors: Number of neighbors to consider
             std_ratio: Standard deviation threshold for outlier detection
+            tile_points: Approximate number of points per KD-tree tile
+            workers: Threads used for KD-tree queries (-1 uses all cores)
         """
-        self.nb_neighbors = nb_neighbors
+        self.nb_neighbors = max(int(nb_neighbors), 1)
         self.std_ratio = std_ratio
+        self.tile_points = tile_points
+        self.workers = workers
+        self.z_mean = None
+        self.z_std = None
+        # Running (count, mean, M2) of partial_fit
+        self._moments = None
+        self.distance_mean = None
+        self.distance_std = None
         logger.info(f"Noise filter initialized with nb_neighbors={nb_neighbors}, std_ratio={std_ratio}")
 
-    def filter(self, las: laspy.LasData):
+    def filter(self, las):
         """
         Remove noise points based on statistical outlier removal
         
         Args:
-            las: Input LAS point cloud
+            las: Input LAS point cloud or PointCloud view
             
         Returns:
-            Filtered LAS with noise points removed
+            Filtered LAS with noise points removed, or a narrowed PointCloud
+            view (no point records are copied) when given a PointCloud
         """
-        # Extract Z values
-        z = las.z
-
-        # Compute global mean and standard deviation
-        mean = np.mean(z)
-        std = np.std(z)
-
-        # Log statistics
-        logger.info(f"Z statistics - mean: {mean:.2f}, std dev: {std:.2f}")
-        logger.info(f"Using std_ratio: {self.std_ratio} to filter outliers")
+        if isinstance(las, PointCloud):
+            return las.select(self.compute_mask(las.x, las.y, las.z))
 
-        # Create mask for inliers
-        mask = np.abs(z - mean) < self.std_ratio * std
+        mask = self.compute_mask(np.asarray(las.x), np.asarray(las.y), np.asarray(las.z))
         # Apply mask to las.points correctly
         filtered_points = las.points[mask]
 
@@ -48,3 +56,173 @@ class NoiseFilter:
         filtered_las.points = filtered_points
 
         return filtered_las
+
+    def compute_mask(self, x, y, z):
+        """
+        Statistical outlier removal without copying any point records.
+
+        A point is an outlier when its mean distance to its nb_neighbors nearest
+        neighbours exceeds the global mean of those distances by more than
+        std_ratio standard deviations.
+
+        Args:
+            x, y, z: Point coordinates
+
+        Returns:
+            Boolean array, True for points kept by the filter
+        """
+        if len(z) <= self.nb_neighbors:
+            logger.warning(f"Only {len(z)} points available, skipping statistical outlier removal")
+            return np.ones(len(z), dtype=bool)
+
+        mean_distances = self.mean_neighbor_distances(x, y, z)
+        self.distance_mean = float(np.mean(mean_distances))
+        self.distance_std = float(np.std(mean_distances))
+        threshold = self.distance_mean + self.std_ratio * self.distance_std
+
+        # Log statistics
+        logger.info(f"Neighbour distance statistics - mean: {self.distance_mean:.3f}, std dev: {self.distance_std:.3f}")
+        logger.info(f"Using std_ratio: {self.std_ratio} to filter outliers (threshold {threshold:.3f})")
+
+        return mean_distances <= threshold
+
+    def mean_neighbor_distances(self, x, y, z):
+        """
+        Mean 3D distance of every point to its nb_neighbors nearest neighbours.
+
+        The cloud is split into XY tiles of roughly tile_points points. Each tile
+        gets its own KD-tree built from the tile plus a halo of surrounding
+        points; points whose k-th neighbour lies beyond the halo are re-queried
+        against a wider halo, so the result is exact while only one tile's tree
+        is held in memory at a time.
+
+        Args:
+            x, y, z: Point coordinates
+
+        Returns:
+            float64 array of mean neighbour distances
+        """
+        n = len(z)
+        k = self.nb_neighbors
+        min_x, max_x = float(np.min(x)), float(np.max(x))
+        min_y, max_y = float(np.min(y)), float(np.max(y))
+
+        # Average point spacing drives both the tile size and the initial halo
+        spacing = max(np.sqrt(max((max_x - min_x) * (max_y - min_y), 1e-6) / n), 1e-3)
+        tile_size = max(np.sqrt(self.tile_points) * spacing, spacing)
+        halo = min(4.0 * spacing * np.sqrt(k), tile_size)
+
+        tiles = RasterGrid.from_bounds(min_x, min_y, max_x, max_y, tile_size, snap=False)
+        tile_index = tiles.cell_index(x, y)
+        order = np.argsort(tile_index, kind="stable")
+        offsets = np.searchsorted(tile_index[order], np.arange(tiles.size + 1))
+        del tile_index
+
+        logger.info(f"Running SOR over {n} points in {tiles.width}x{tiles.height} tiles of {tile_size:.1f} with halo {halo:.2f}")
+
+        mean_distances = np.empty(n, dtype=np.float64)
+        for tile in range(tiles.size):
+            core = order[offsets[tile]:offsets[tile + 1]]
+            if core.size == 0:
+                continue
+
+            row, col = divmod(tile, tiles.width)
+            box = (tiles.min_x + col * tile_size, tiles.max_y - (row + 1) * tile_size,
+                   tiles.min_x + (col + 1) * tile_size, tiles.max_y - row * tile_size)
+            ring = np.concatenate([
+                order[offsets[r * tiles.width + max(col - 1, 0)]:offsets[r * tiles.width + min(col + 1, tiles.width - 1) + 1]]
+                for r in range(max(row - 1, 0), min(row + 1, tiles.height - 1) + 1)
+            ])
+
+            distances, kth = self._query_tile(x, y, z, core, self._halo_members(x, y, ring, box, halo), k)
+            mean_distances[core] = distances
+
+            # Neighbours beyond the halo may have been missed; the k-th distance
+            # found is an upper bound of the true one, so one wider query is exact
+            retry = kth > halo
+            if np.any(retry):
+                radius = float(kth[retry].max())
+                candidates = ring if radius <= tile_size else np.arange(n)
+                members = self._halo_members(x, y, candidates, box, radius)
+                distances, _ = self._query_tile(x, y, z, core[retry], members, k)
+                mean_distances[core[retry]] = distances
+
+        return mean_distances
+
+    def _halo_members(self, x, y, candidates, box, halo):
+        min_x, min_y, max_x, max_y = box
+        cx, cy = x[candidates], y[candidates]
+        inside = (cx >= min_x - halo) & (cx <= max_x + halo) & (cy >= min_y - halo) & (cy <= max_y + halo)
+        return candidates[inside]
+
+    def _query_tile(self, x, y, z, queries, members, k):
+        tree = cKDTree(np.column_stack((x[members], y[members], z[members])),
+                       balanced_tree=False, compact_nodes=False)
+
+        mean_distances = np.empty(queries.size, dtype=np.float64)
+        kth = np.empty(queries.size, dtype=np.float64)
+        for start in range(0, queries.size, QUERY_BATCH_SIZE):
+            batch = queries[start:start + QUERY_BATCH_SIZE]
+            # The first neighbour of every point is the point itself
+            distances, _ = tree.query(np.column_stack((x[batch], y[batch], z[batch])),
+                                      k=k + 1, workers=self.workers)
+            mean_distances[start:start + batch.size] = distances[:, 1:].mean(axis=1)
+            kth[start:start + batch.size] = distances[:, -1]
+        return mean_distances, kth
+
+    def fit_streaming(self, chunks):
+        """
+        Compute the global Z statistics from point batches without loading the cloud.
+
+        Batch moments are merged with the parallel variance formula, so the
+        result matches np.mean/np.std over the whole cloud.
+
+        Args:
+            chunks: Iterable of point batches with a "z" array
+
+        Returns:
+            Tuple of (mean, std)
+        """
+        self._moments = (0, 0.0, 0.0)
+        for batch in chunks:
+            self.partial_fit(batch["z"])
+        return self.finish_streaming()
+
+    def partial_fit(self, z):
+        """Merge one batch of elevations into the running Z moments (see fit_streaming)."""
+        count, mean, m2 = self._moments or (0, 0.0, 0.0)
+        if z.size:
+            batch_mean = float(np.mean(z))
+            batch_m2 = float(np.sum((z - batch_mean) ** 2))
+            delta = batch_mean - mean
+            total = count + z.size
+            mean += delta * z.size / total
+            m2 += batch_m2 + delta ** 2 * count * z.size / total
+            count = total
+        self._moments = (count, mean, m2)
+
+    def finish_streaming(self):
+        """Fix the Z statistics from the batches passed to partial_fit, returning (mean, std)."""
+        count, mean, m2 = self._moments or (0, 0.0, 0.0)
+        self._moments = None
+        self.z_mean = mean
+        self.z_std = float(np.sqrt(m2 / count)) if count else 0.0
+        logger.info(f"Streamed Z statistics - mean: {self.z_mean:.2f}, std dev: {self.z_std:.2f}")
+        return self.z_mean, self.z_std
+
+    def inlier_band(self):
+        """Open interval (low, high) of z kept by inlier_mask."""
+        if self.z_mean is None:
+            raise ValueError("fit_streaming or finish_streaming must be called before inlier_band")
+        return self.z_mean - self.std_ratio * self.z_std, self.z_mean + self.std_ratio * self.z_std
+
+    def inlier_mask(self, z):
+        """
+        Boolean Z z-score mask from the statistics of fit_streaming.
+
+        Streaming batches are not spatially coherent, so out-of-core processing
+        keeps this global elevation test instead of neighbour-based SOR.
+        """
+        if self.z_mean is None:
+            raise ValueError("fit_streaming or finish_streaming must be called before inlier_mask")
+        return np.abs(z - self.z_mean) < self.std_ratio * self.z_std
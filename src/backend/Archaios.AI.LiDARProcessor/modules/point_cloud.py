@@ -0,0 +1,94 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger("Archaios.PointCloud")
+
+CLOUD_DIMENSIONS = ("x", "y", "z", "classification", "return_number")
+
+class PointCloud:
+    """
+    Lightweight columnar view of a point cloud.
+
+    Holds one NumPy array per dimension plus an optional index of selected
+    rows. Filters compose through select(), which only narrows the index, so
+    no stage ever copies full LAS point records.
+    """
+    def __init__(self, columns, header=None, index=None):
+        """
+        Args:
+            columns: Dict mapping dimension name to a full-length array
+            header: LAS header of the source file (used for metadata exports)
+            index: Optional int64 array of selected rows (None selects all)
+        """
+        self.columns = columns
+        self.header = header
+        self.index = index
+
+    @classmethod
+    def from_las(cls, las, dimensions=CLOUD_DIMENSIONS):
+        """Extract the requested dimensions of a LasData into a PointCloud."""
+        available = set(las.point_format.dimension_names)
+        columns = {
+            dim: np.asarray(las[dim]) for dim in dimensions
+            if dim in ("x", "y", "z") or dim in available
+        }
+        return cls(columns, las.header)
+
+    def __len__(self):
+        if self.index is not None:
+            return len(self.index)
+        return len(self.columns["z"]) if "z" in self.columns else 0
+
+    def __contains__(self, dimension):
+        return dimension in self.columns
+
+    def __getitem__(self, dimension):
+        values = self.columns[dimension]
+        return values if self.index is None else values[self.index]
+
+    def get(self, dimension, default=None):
+        """Selected values of a dimension, or default if it is not present."""
+        return self[dimension] if dimension in self.columns else default
+
+    @property
+    def x(self):
+        return self["x"]
+
+    @property
+    def y(self):
+        return self["y"]
+
+    @property
+    def z(self):
+        return self["z"]
+
+    def select(self, selection):
+        """
+        Narrow the view to a subset of the currently selected points.
+
+        Args:
+            selection: Boolean mask or integer indices relative to this view
+
+        Returns:
+            New PointCloud sharing the same columns
+        """
+        selection = np.asarray(selection)
+        rows = np.flatnonzero(selection) if selection.dtype == bool else selection.astype(np.int64)
+        index = rows if self.index is None else self.index[rows]
+        return PointCloud(self.columns, self.header, index)
+
+    def with_column(self, dimension, values):
+        """
+        Return a view whose dimension is replaced by values for the selected points.
+
+        Only the replaced column is copied; all other columns stay shared.
+        """
+        columns = dict(self.columns)
+        if self.index is None:
+            columns[dimension] = np.asarray(values)
+        else:
+            base = self.columns.get(dimension)
+            full = np.zeros(len(self.columns["z"]), dtype=np.asarray(values).dtype) if base is None else base.copy()
+            full[self.index] = values
+            columns[dimension] = full
+        return PointCloud(columns, self.header, self.index)
@@ -0,0 +1,122 @@
+import io
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger("Archaios.ProgressiveFile")
+
+def marker_path(path):
+    """Sidecar that describes how much of a file being downloaded is already on disk."""
+    return f"{path}.progress"
+
+def read_marker(path):
+    """Download state of path, or None once the download has completed (or never ran)."""
+    try:
+        with open(marker_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+class DownloadMarker:
+    """
+    Writer side of a progressive download.
+
+    The marker records the file size, the length of the contiguous prefix
+    already written and where the prefetched tail starts. It is replaced
+    atomically on every update, so readers in other threads or processes
+    always see a consistent state, and removed once the file is complete.
+    """
+    def __init__(self, path, size, tail_start=None):
+        self.path = path
+        self.state = {"size": size, "watermark": 0, "tail_start": size if tail_start is None else tail_start, "failed": False}
+        self._write()
+
+    def advance(self, watermark):
+        self.state["watermark"] = watermark
+        self._write()
+
+    def set_tail(self, tail_start):
+        self.state["tail_start"] = tail_start
+        self._write()
+
+    def fail(self):
+        self.state["failed"] = True
+        self._write()
+
+    def complete(self):
+        try:
+            os.remove(marker_path(self.path))
+        except FileNotFoundError:
+            pass
+
+    def _write(self):
+        staging = marker_path(self.path) + ".tmp"
+        with open(staging, "w") as f:
+            json.dump(self.state, f)
+        os.replace(staging, marker_path(self.path))
+
+class ProgressiveFile(io.RawIOBase):
+    """
+    Read-only file that blocks until the requested bytes have been downloaded.
+
+    Lets laspy decode a LAS/LAZ file while it is still arriving: the header and
+    the LAZ chunk table (prefetched from the end of the blob) are available
+    first, and point records are read as the contiguous prefix grows.
+    """
+    def __init__(self, path, poll_interval=0.05, timeout=600):
+        """
+        Args:
+            path: Local file being written by a progressive download
+            poll_interval: Seconds between checks of the download marker
+            timeout: Seconds without progress before giving up
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._file = open(path, "rb")
+
+    @staticmethod
+    def in_progress(path):
+        return read_marker(path) is not None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def readinto(self, buffer):
+        start = self._file.tell()
+        self._wait_for(start, start + len(buffer))
+        return self._file.readinto(buffer)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    def _wait_for(self, start, end):
+        last_watermark, deadline = None, time.monotonic() + self.timeout
+        while True:
+            state = read_marker(self.path)
+            if state is None:
+                return
+            if state["failed"]:
+                raise IOError(f"Download of {self.path} failed")
+
+            end = min(end, state["size"])
+            watermark, tail_start = state["watermark"], state["tail_start"]
+            if end <= watermark or start >= tail_start or watermark >= tail_start:
+                return
+
+            if watermark != last_watermark:
+                last_watermark, deadline = watermark, time.monotonic() + self.timeout
+            elif time.monotonic() > deadline:
+                raise IOError(f"Timed out waiting for bytes {start}-{end} of {self.path}")
+            time.sleep(self.poll_interval)
@@ -0,0 +1,149 @@
+import numpy as np
+import rasterio
+import logging
+
+logger = logging.getLogger("Archaios.RasterData")
+
+COG_COMPRESSIONS = ("deflate", "zstd")
+
+# Element types the DTM/DSM may be gridded, filtered and written in
+RASTER_DTYPES = ("float32", "float64")
+DEFAULT_RASTER_DTYPE = "float32"
+
+def raster_dtype(name=DEFAULT_RASTER_DTYPE):
+    """
+    Resolve a raster dtype policy name.
+
+    float32 keeps elevations to about a millimetre for any terrain on
+    Earth while halving memory traffic and GeoTIFF sizes; float64 is kept for
+    callers that need bit-compatible output with older runs.
+
+    Args:
+        name: One of RASTER_DTYPES (or a matching NumPy dtype)
+
+    Returns:
+        numpy.dtype
+    """
+    dtype = np.dtype(name)
+    if dtype.name not in RASTER_DTYPES:
+        raise ValueError(f"Unsupported raster dtype '{name}', expected one of {RASTER_DTYPES}")
+    return dtype
+
+# Internal tile size of Cloud-Optimized GeoTIFFs
+COG_BLOCKSIZE = 512
+
+class RasterData:
+    """
+    Single-band raster kept in memory between pipeline stages.
+
+    Bundles the array with its affine transform, CRS and nodata mask so
+    generators can hand results to each other without a GeoTIFF round-trip.
+    Writing a GeoTIFF is an optional sink via write().
+    """
+    def __init__(self, array, transform, crs=None, mask=None, nodata=None):
+        """
+        Args:
+            array: 2D raster values
+            transform: Affine transform of the raster (north-up)
+            crs: Coordinate reference system, or None if unknown
+            mask: Boolean nodata mask (defaults to the NaN cells of array)
+            nodata: Nodata value to declare when written to GeoTIFF
+        """
+        self.array = array
+        self.transform = transform
+        self.crs = crs
+        self.mask = np.isnan(array) if mask is None else mask
+        self.nodata = nodata
+
+    @classmethod
+    def read(cls, path):
+        """Read band 1 of a GeoTIFF into memory."""
+        with rasterio.open(path) as src:
+            data = src.read(1, masked=True)
+            return cls(data.data, src.transform, src.crs, np.ma.getmaskarray(data), src.nodata)
+
+    @classmethod
+    def load(cls, source):
+        """Return source unchanged if it is already a RasterData, otherwise read it from disk."""
+        if isinstance(source, RasterData):
+            return source
+        return cls.read(source)
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def cellsize(self):
+        return (self.transform.a + abs(self.transform.e)) / 2.0
+
+    def filled(self, fill_value=np.nan):
+        """Array with nodata cells replaced by fill_value."""
+        if not np.any(self.mask):
+            return self.array
+        return np.where(self.mask, fill_value, self.array)
+
+    def masked(self):
+        """Array as a NumPy masked array, like rasterio's read(masked=True)."""
+        return np.ma.MaskedArray(self.array, mask=self.mask)
+
+    def with_array(self, array, nodata=None):
+        """New RasterData on the same grid and CRS; the mask follows the NaN cells of array."""
+        return RasterData(array, self.transform, self.crs, nodata=nodata)
+
+    def write(self, path, cog=False, compression="deflate"):
+        """
+        Persist the raster as a single-band GeoTIFF.
+
+        Args:
+            path: Output path
+            cog: Write a Cloud-Optimized GeoTIFF instead: float32 with NaN nodata,
+                internal COG_BLOCKSIZE tiles, floating-point predictor and
+                precomputed overviews, so readers can range-request windows
+            compression: COG compression, 'deflate' or 'zstd'
+
+        Returns:
+            The output path
+        """
+        if not cog:
+            with rasterio.open(
+                path, 'w',
+                driver='GTiff',
+                height=self.array.shape[0],
+                width=self.array.shape[1],
+                count=1,
+                dtype=self.array.dtype,
+                crs=self.crs,
+                transform=self.transform,
+                nodata=self.nodata
+            ) as dst:
+                dst.write(self.array, 1)
+
+            logger.info(f"Raster written to {path}")
+            return path
+
+        if compression not in COG_COMPRESSIONS:
+            raise ValueError(f"Unsupported COG compression '{compression}', expected one of {COG_COMPRESSIONS}")
+
+        with rasterio.open(
+            path, 'w',
+            driver='COG',
+            height=self.array.shape[0],
+            width=self.array.shape[1],
+            count=1,
+            dtype='float32',
+            crs=self.crs,
+            transform=self.transform,
+            nodata=np.nan,
+            BLOCKSIZE=COG_BLOCKSIZE,
+            COMPRESS=compression.upper(),
+            PREDICTOR='YES',
+            OVERVIEWS='AUTO',
+            OVERVIEW_RESAMPLING='AVERAGE',
+            BIGTIFF='IF_SAFER',
+            NUM_THREADS='ALL_CPUS'
+        ) as dst:
+            dst.write(self.filled(np.nan).astype(np.float32, copy=False), 1)
+
+        logger.info(f"Raster written to {path}")
+        return path
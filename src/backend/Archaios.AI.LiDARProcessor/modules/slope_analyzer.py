@@ -2,59 +2,60 @@ import numpy as np
 import rasterio
 import math
 import logging
+from modules.raster_data import RasterData
+from modules.terrain_derivatives import TerrainDerivatives
+from modules.block_processor import BlockProcessor
 
 logger = logging.getLogger("Archaios.SlopeAnalyzer")
 
 class SlopeAnalyzer:
-    def __init__(self, slope_unit="degrees", clip_range=None):
+    def __init__(self, slope_unit="degrees", clip_range=None, block_size=None, max_workers=None):
         """
         Args:
             slope_unit (str): 'degrees' or 'percent'
             clip_range (tuple): (min, max) to clip slope values, e.g., (0, 60)
+            block_size (int): Process rasters larger than this in windows of this size
+            max_workers (int): Threads processing windows
         """
         self.slope_unit = slope_unit
         self.clip_range = clip_range
+        self.blocks = BlockProcessor(block_size, halo=1, max_workers=max_workers)
 
     def analyze(self, dtm_path, output_path):
-        with rasterio.open(dtm_path) as src:
-            dtm = src.read(1, masked=True)
-            transform = src.transform
-            crs = src.crs
-
-            cellsize_x = transform.a
-            cellsize_y = -transform.e  # usually negative for north-up rasters
-
-            # Compute gradient in physical units (elevation / meters)
-            dz_dy, dz_dx = np.gradient(dtm.filled(np.nan), cellsize_y, cellsize_x)
-            slope_magnitude = np.sqrt(dz_dx**2 + dz_dy**2)
-
-            # Convert slope
-            if self.slope_unit == "degrees":
-                slope = np.degrees(np.arctan(slope_magnitude))
-            elif self.slope_unit == "percent":
-                slope = slope_magnitude * 100
-            else:
-                raise ValueError("slope_unit must be 'degrees' or 'percent'")
+        self.analyze_raster(dtm_path).write(output_path)
+        logger.info(f"Slope written to {output_path}")
+        return output_path
+
+    def analyze_raster(self, dtm, derivatives=None):
+        """
+        Compute the slope raster in memory.
+
+        Args:
+            dtm: RasterData or path to a DTM GeoTIFF
+            derivatives: Optional precomputed TerrainDerivatives of dtm
+                (ignored when the raster is processed in blocks)
+
+        Returns:
+            float32 RasterData with NaN nodata
+        """
+        dtm = RasterData.load(dtm)
+
+        def analyze(dem, mask, derivatives=None):
+            # Horn gradient in physical units (elevation / meters)
+            derivatives = derivatives or TerrainDerivatives(dem, dtm.transform.a, abs(dtm.transform.e))
+            slope = derivatives.slope(self.slope_unit)
 
             # Apply clipping if needed
             if self.clip_range:
-                slope = np.clip(slope, self.clip_range[0], self.clip_range[1])
+                np.clip(slope, self.clip_range[0], self.clip_range[1], out=slope)
 
             # Mask slope where original DTM is invalid
-            slope = np.where(dtm.mask, np.nan, slope)
-
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            height=slope.shape[0],
-            width=slope.shape[1],
-            count=1,
-            dtype='float32',
-            crs=crs,
-            transform=transform,
-            nodata=np.nan
-        ) as dst:
-            dst.write(slope.astype('float32'), 1)
+            slope[mask] = np.nan
+            return slope
 
-        logger.info(f"Slope written to {output_path}")
-        return output_path
+        if derivatives is not None and not self.blocks.applies(dtm.shape):
+            slope = analyze(None, dtm.mask, derivatives)
+        else:
+            slope = self.blocks.map(analyze, [dtm.filled(np.nan), dtm.mask])
+
+        return dtm.with_array(slope.astype('float32', copy=False), nodata=np.nan)
@@ -0,0 +1,226 @@
+import numpy as np
+from rasterio.transform import from_origin
+import logging
+
+logger = logging.getLogger("Archaios.StreamingRasterizer")
+
+class RasterGrid:
+    """
+    North-up raster grid definition used to map points to cells.
+
+    The grid always covers [min_x, max_x] x [min_y, max_y] with square cells of
+    size res; max_x/min_y are extended so the extent is a whole number of cells.
+    """
+    def __init__(self, min_x, min_y, max_x, max_y, res):
+        self.res = float(res)
+        self.width = max(int(np.ceil((max_x - min_x) / self.res)), 1)
+        self.height = max(int(np.ceil((max_y - min_y) / self.res)), 1)
+        self.min_x = float(min_x)
+        self.max_y = float(max_y)
+        self.max_x = self.min_x + self.width * self.res
+        self.min_y = self.max_y - self.height * self.res
+
+    @classmethod
+    def from_bounds(cls, min_x, min_y, max_x, max_y, res, snap=True):
+        """Create a grid from point bounds, optionally snapping the extent to multiples of res."""
+        if snap:
+            min_x = np.floor(min_x / res) * res
+            min_y = np.floor(min_y / res) * res
+            max_x = np.ceil(max_x / res) * res
+            max_y = np.ceil(max_y / res) * res
+        return cls(min_x, min_y, max_x, max_y, res)
+
+    def __eq__(self, other):
+        if not isinstance(other, RasterGrid):
+            return NotImplemented
+        return (self.min_x, self.max_y, self.res, self.width, self.height) == \
+            (other.min_x, other.max_y, other.res, other.width, other.height)
+
+    def __hash__(self):
+        return hash((self.min_x, self.max_y, self.res, self.width, self.height))
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    @property
+    def size(self):
+        return self.height * self.width
+
+    @property
+    def transform(self):
+        return from_origin(self.min_x, self.max_y, self.res, self.res)
+
+    def cell_index(self, x, y):
+        """
+        Compute the flat (row-major, north-up) cell index of every point.
+
+        Args:
+            x, y: Point coordinates
+
+        Returns:
+            int64 array of flat cell indices, -1 for points outside the grid
+        """
+        col = np.floor((x - self.min_x) / self.res).astype(np.int64)
+        row = np.floor((self.max_y - y) / self.res).astype(np.int64)
+
+        # Points on the far edges belong to the last row/column
+        inside = (x >= self.min_x) & (x <= self.max_x) & (y >= self.min_y) & (y <= self.max_y)
+        np.clip(col, 0, self.width - 1, out=col)
+        np.clip(row, 0, self.height - 1, out=row)
+
+        idx = row * self.width + col
+        idx[~inside] = -1
+        return idx
+
+class StreamingRasterizer:
+    """
+    Accumulates per-cell statistics incrementally from point batches.
+
+    Memory is proportional to the raster (one array per statistic), not to the
+    number of points, so arbitrarily large clouds can be gridded chunk by chunk.
+    """
+    STATISTICS = ("min", "max", "count", "sum")
+
+    def __init__(self, grid, statistics=STATISTICS, dtype=np.float64, candidates=1):
+        """
+        Args:
+            grid: RasterGrid describing the output raster
+            statistics: Subset of ("min", "max", "count", "sum") to accumulate
+            dtype: Element type of the min/max accumulators (sums are always float64)
+            candidates: Number of lowest/highest values kept per cell for
+                min/max; more than one lets get() apply a z band that is only
+                known after accumulation
+        """
+        unknown = set(statistics) - set(self.STATISTICS)
+        if unknown:
+            raise ValueError(f"Unsupported statistics: {sorted(unknown)}")
+
+        self.grid = grid
+        self.statistics = tuple(statistics)
+        self.points_accumulated = 0
+
+        # Per cell, ranked best first: _lows[0] is the minimum, _highs[0] the maximum
+        self.candidates = max(int(candidates), 1)
+        self._lows = np.full((self.candidates, grid.size), np.inf, dtype=dtype) if "min" in statistics else None
+        self._highs = np.full((self.candidates, grid.size), -np.inf, dtype=dtype) if "max" in statistics else None
+        self._min = self._lows[0] if self._lows is not None else None
+        self._max = self._highs[0] if self._highs is not None else None
+        self._count = np.zeros(grid.size, dtype=np.int64) if "count" in statistics or "sum" in statistics else None
+        self._sum = np.zeros(grid.size, dtype=np.float64) if "sum" in statistics else None
+
+    def update(self, x, y, z, mask=None):
+        """
+        Add a batch of points to the accumulators.
+
+        Args:
+            x, y, z: Point coordinates of the batch
+            mask: Optional boolean array selecting the points to include
+        """
+        idx = self.grid.cell_index(x, y)
+        keep = idx >= 0
+        if mask is not None:
+            keep &= mask
+        if not np.all(keep):
+            idx, z = idx[keep], z[keep]
+        self.update_indexed(idx, z)
+
+    def update_indexed(self, idx, z, presorted=False):
+        """
+        Add a batch of points whose flat cell indices are already known (all >= 0).
+
+        presorted tells candidate grids that the batch is already sorted by (cell, z).
+        """
+        if idx.size == 0:
+            return
+
+        if self.candidates > 1 and not presorted:
+            # One (cell, z) sort serves both ends of every cell; a z sort followed
+            # by a stable cell sort is cheaper than np.lexsort
+            order = np.argsort(z)
+            order = order[np.argsort(idx[order], kind="stable")]
+            idx, z = idx[order], z[order]
+        if self.candidates > 1:
+            if self._lows is not None:
+                _merge_candidates(self._lows, idx, z, lowest=True)
+            if self._highs is not None:
+                _merge_candidates(self._highs, idx, z, lowest=False)
+        else:
+            if self._min is not None:
+                np.minimum.at(self._min, idx, z)
+            if self._max is not None:
+                np.maximum.at(self._max, idx, z)
+        if self._count is not None:
+            self._count += np.bincount(idx, minlength=self.grid.size)
+        if self._sum is not None:
+            self._sum += np.bincount(idx, weights=z, minlength=self.grid.size)
+
+        self.points_accumulated += idx.size
+
+    def get(self, statistic, band=None):
+        """
+        Return a north-up 2D grid for the requested statistic.
+
+        Empty cells are NaN for min/max/mean and 0 for count/sum.
+
+        Args:
+            statistic: "min", "max", "count", "sum" or "mean"
+            band: Optional open interval (low, high) of z; min/max then only
+                consider values inside it. A cell is exact unless as many of
+                its values as there are candidates lie beyond the band on the
+                side the statistic starts from; such cells are left empty.
+        """
+        if band is not None:
+            return self._get_within(statistic, *band)
+
+        if statistic == "min" and self._min is not None:
+            grid = np.where(np.isinf(self._min), np.nan, self._min)
+        elif statistic == "max" and self._max is not None:
+            grid = np.where(np.isinf(self._max), np.nan, self._max)
+        elif statistic == "count" and self._count is not None:
+            grid = self._count
+        elif statistic == "sum" and self._sum is not None:
+            grid = self._sum
+        elif statistic == "mean" and self._sum is not None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                grid = np.where(self._count > 0, self._sum / self._count, np.nan)
+        else:
+            raise ValueError(f"Statistic '{statistic}' was not accumulated")
+
+        return grid.reshape(self.grid.shape)
+
+    def _get_within(self, statistic, low, high):
+        if statistic == "min" and self._lows is not None:
+            # Candidates are sorted, so the first one past low is the in-band minimum
+            ranked = np.where(self._lows > low, self._lows, np.inf).min(axis=0)
+            grid = np.where(ranked < high, ranked, np.nan)
+        elif statistic == "max" and self._highs is not None:
+            ranked = np.where(self._highs < high, self._highs, -np.inf).max(axis=0)
+            grid = np.where(ranked > low, ranked, np.nan)
+        else:
+            raise ValueError(f"Statistic '{statistic}' was not accumulated")
+
+        return grid.reshape(self.grid.shape)
+
+def _merge_candidates(ranked, idx, z, lowest):
+    """
+    Merge a batch sorted by (cell, z) into the per-cell candidate rows.
+
+    ranked has one row per candidate, best first; each touched cell keeps the
+    best len(ranked) of its previous candidates and its batch values.
+    """
+    depth = len(ranked)
+    starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    sizes = np.diff(np.r_[starts, idx.size])
+    cells = idx[starts]
+    group = np.repeat(np.arange(cells.size), sizes)
+
+    position = np.arange(idx.size) - starts[group]
+    rank = position if lowest else sizes[group] - 1 - position
+    keep = rank < depth
+
+    batch = np.full((cells.size, depth), np.inf if lowest else -np.inf, dtype=ranked.dtype)
+    batch[group[keep], rank[keep]] = z[keep]
+    merged = np.concatenate((ranked[:, cells].T, batch), axis=1)
+    merged.sort(axis=1)
+    ranked[:, cells] = (merged[:, :depth] if lowest else merged[:, :-depth - 1:-1]).T
@@ -0,0 +1,106 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger("Archaios.TerrainDerivatives")
+
+class TerrainDerivatives:
+    """
+    First derivatives of a DEM, computed once and shared by slope, aspect and hillshade.
+
+    dz/dx and dz/dy come from Horn's 3x3 kernel in float32; every product is
+    then a closed-form expression on those two arrays, so each additional
+    hillshade azimuth costs a few multiply-adds instead of a new gradient.
+    """
+    def __init__(self, dem, cellsize_x, cellsize_y=None):
+        """
+        Args:
+            dem: 2D north-up elevation array (NaN for nodata)
+            cellsize_x: Cell width in map units
+            cellsize_y: Cell height in map units (defaults to cellsize_x)
+        """
+        cellsize_y = cellsize_x if cellsize_y is None else cellsize_y
+
+        # Removing the mean keeps float32 precise for high-elevation terrain
+        valid = np.isfinite(dem)
+        reference = float(np.mean(dem[valid])) if np.any(valid) else 0.0
+        z = np.pad((dem - reference).astype(np.float32), 1, mode='edge')
+
+        a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+        d, f = z[1:-1, :-2], z[1:-1, 2:]
+        g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+
+        # Row 0 is the northern edge, so the a-b-c row lies north of the centre cell
+        self.dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / np.float32(8 * cellsize_x)
+        self.dz_dy = ((a + 2 * b + c) - (g + 2 * h + i)) / np.float32(8 * cellsize_y)
+
+    @classmethod
+    def from_raster(cls, raster):
+        """Derivatives of a RasterData's valid cells (nodata cells become NaN)."""
+        transform = raster.transform
+        return cls(raster.filled(np.nan), transform.a, abs(transform.e))
+
+    def slope(self, unit="degrees", z_factor=1.0):
+        """
+        Slope of every cell.
+
+        Args:
+            unit: 'degrees' or 'percent'
+            z_factor: Vertical exaggeration applied to the gradient
+
+        Returns:
+            float32 slope array
+        """
+        magnitude = np.float32(z_factor) * np.hypot(self.dz_dx, self.dz_dy)
+        if unit == "degrees":
+            return np.degrees(np.arctan(magnitude))
+        if unit == "percent":
+            return magnitude * np.float32(100)
+        raise ValueError("slope_unit must be 'degrees' or 'percent'")
+
+    def aspect(self):
+        """Downslope direction in degrees clockwise from north (NaN on flat cells)."""
+        aspect = np.degrees(np.arctan2(-self.dz_dx, -self.dz_dy)) % np.float32(360)
+        return np.where((self.dz_dx == 0) & (self.dz_dy == 0), np.float32(np.nan), aspect)
+
+    def hillshade(self, azimuth=315, altitude=45, z_factor=1.0):
+        """
+        Lambertian hillshade in [0, 1] for a single light direction.
+
+        Args:
+            azimuth: Light azimuth in degrees clockwise from north
+            altitude: Light altitude in degrees above the horizon
+            z_factor: Vertical exaggeration applied to the gradient
+        """
+        return self.multi_hillshade([azimuth], altitude, z_factor)
+
+    def multi_hillshade(self, azimuths, altitude=45, z_factor=1.0):
+        """
+        Mean hillshade over several light azimuths.
+
+        The surface normal is (-p, -q, 1) / sqrt(1 + p^2 + q^2) with p, q the
+        scaled gradients, so each azimuth reduces to one dot product with the
+        light vector on the shared gradients.
+
+        Args:
+            azimuths: Light azimuths in degrees clockwise from north
+            altitude: Light altitude in degrees above the horizon
+            z_factor: Vertical exaggeration applied to the gradient
+
+        Returns:
+            float32 array of mean illumination in [0, 1]
+        """
+        p = np.float32(z_factor) * self.dz_dx
+        q = np.float32(z_factor) * self.dz_dy
+        inv_norm = 1.0 / np.sqrt(1.0 + p * p + q * q)
+
+        altitude = np.radians(altitude)
+        sin_alt, cos_alt = np.float32(np.sin(altitude)), np.float32(np.cos(altitude))
+
+        total = np.zeros(p.shape, dtype=np.float32)
+        for azimuth in azimuths:
+            azimuth = np.radians(azimuth)
+            light_x = np.float32(np.sin(azimuth)) * cos_alt
+            light_y = np.float32(np.cos(azimuth)) * cos_alt
+            total += np.clip((sin_alt - p * light_x - q * light_y) * inv_norm, 0, 1)
+
+        return total / np.float32(len(azimuths))
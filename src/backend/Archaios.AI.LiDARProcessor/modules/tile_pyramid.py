@@ -0,0 +1,246 @@
+import os
+import json
+import math
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from affine import Affine
+from PIL import Image
+from rasterio.crs import CRS
+from rasterio.warp import reproject, transform_bounds, calculate_default_transform, Resampling
+from modules.raster_data import RasterData
+from modules.colormap_renderer import NODATA_INDEX, colormap_palette, quantize, valid_range
+
+logger = logging.getLogger("Archaios.TilePyramid")
+
+WEB_MERCATOR = CRS.from_epsg(3857)
+WGS84 = CRS.from_epsg(4326)
+
+# Half the circumference of the Web Mercator square, in meters
+ORIGIN_SHIFT = 20037508.342789244
+
+MAX_ZOOM = 22
+
+TILE_FORMATS = ("png", "webp")
+
+def zoom_for_resolution(resolution, tile_size=256):
+    """Shallowest zoom level whose pixels are at least as fine as resolution (Web Mercator meters)."""
+    zoom = math.ceil(math.log2(2 * ORIGIN_SHIFT / (tile_size * resolution)))
+    return max(0, min(MAX_ZOOM, zoom))
+
+class TilePyramidGenerator:
+    """
+    Cuts a single-band raster into an XYZ (Web Mercator, top-left origin) tile pyramid.
+
+    The deepest zoom level is produced one block of block_tiles x block_tiles
+    tiles at a time: each block is warped straight from the source at that
+    level's resolution, quantized to colormap palette indices and decimated
+    into the shallower levels it covers, so memory scales with the block
+    instead of the reprojected raster. The single tiles those blocks shrink to
+    are collected into a small mosaic from which the remaining levels are
+    decimated. Fully transparent tiles are not written; the others are
+    encoded in parallel to <output_dir>/<z>/<x>/<y>.<ext>.
+    """
+    def __init__(self, colormap='terrain', transparent_nodata=True, tile_size=256, tile_format='png',
+                 min_zoom=None, max_zoom=None, max_workers=None, block_tiles=8):
+        """
+        Args:
+            colormap: matplotlib colormap name
+            transparent_nodata: Make nodata cells transparent
+            tile_size: Tile width and height in pixels
+            tile_format: 'png' (paletted) or 'webp' (lossless RGBA)
+            min_zoom: Shallowest level (defaults to the level where the raster fits one tile)
+            max_zoom: Deepest level (defaults to the first level at least as fine as the
+                raster; clamped to one level beyond that)
+            max_workers: Tile encoding threads (None lets the executor decide)
+            block_tiles: Edge of a warped block in tiles; a power of two
+        """
+        if tile_format not in TILE_FORMATS:
+            raise ValueError(f"Unsupported tile format '{tile_format}', expected one of {TILE_FORMATS}")
+        if min_zoom is not None and max_zoom is not None and min_zoom > max_zoom:
+            raise ValueError(f"Tile min zoom {min_zoom} is greater than max zoom {max_zoom}")
+        if block_tiles < 1 or block_tiles & (block_tiles - 1):
+            raise ValueError(f"block_tiles must be a power of two, got {block_tiles}")
+        self.colormap = colormap
+        self.transparent_nodata = transparent_nodata
+        self.tile_size = tile_size
+        self.tile_format = tile_format
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.max_workers = max_workers
+        self.block_tiles = block_tiles
+
+    def generate(self, raster, output_dir):
+        """
+        Write the tile pyramid of a raster.
+
+        Args:
+            raster: RasterData or GeoTIFF path; it must have a CRS
+            output_dir: Root directory of the pyramid
+
+        Returns:
+            Dict with min_zoom, max_zoom, bounds (west, south, east, north in
+            degrees), format, tile_size, tile_count and directory
+        """
+        raster = RasterData.load(raster)
+        if raster.crs is None:
+            raise ValueError("Cannot tile a raster without a CRS")
+
+        value_range = valid_range(raster.array, raster.mask)
+        if value_range is None:
+            raise ValueError("Cannot tile a raster with no valid cells")
+
+        height, width = raster.shape
+        src_bounds = (
+            raster.transform.c,
+            raster.transform.f + raster.transform.e * height,
+            raster.transform.c + raster.transform.a * width,
+            raster.transform.f
+        )
+        west, south, east, north = transform_bounds(raster.crs, WEB_MERCATOR, *src_bounds)
+
+        native_transform, _, _ = calculate_default_transform(raster.crs, WEB_MERCATOR, width, height, *src_bounds)
+        native_zoom = zoom_for_resolution(native_transform.a, self.tile_size)
+        max_zoom = native_zoom if self.max_zoom is None else self.max_zoom
+        if max_zoom > native_zoom + 1:
+            logger.warning(f"Clamping tile max zoom {max_zoom} to {native_zoom + 1}, one level beyond the raster resolution")
+            max_zoom = native_zoom + 1
+
+        tile_span = 2 * ORIGIN_SHIFT / 2 ** max_zoom
+        tx0 = int(math.floor((west + ORIGIN_SHIFT) / tile_span))
+        tx1 = int(math.ceil((east + ORIGIN_SHIFT) / tile_span))
+        ty0 = int(math.floor((ORIGIN_SHIFT - north) / tile_span))
+        ty1 = int(math.ceil((ORIGIN_SHIFT - south) / tile_span))
+
+        min_zoom = self.min_zoom
+        if min_zoom is None:
+            min_zoom = max(0, max_zoom - math.ceil(math.log2(max(tx1 - tx0, ty1 - ty0, 1))))
+        min_zoom = min(min_zoom, max_zoom)
+
+        # Levels decimated inside a block; below them the blocks are single tiles
+        block_levels = min(int(math.log2(self.block_tiles)), max_zoom - min_zoom)
+        block = 2 ** block_levels
+        bx0, by0 = tx0 // block, ty0 // block
+        bx1, by1 = -(-tx1 // block), -(-ty1 // block)
+
+        logger.info(f"Tiling {width}x{height} raster into zoom {min_zoom}-{max_zoom} "
+                    f"({(tx1 - tx0) * (ty1 - ty0)} tiles at zoom {max_zoom}, {(bx1 - bx0) * (by1 - by0)} blocks of {block}x{block})")
+        lut = colormap_palette(self.colormap, self.transparent_nodata)
+        mosaic = np.full(((by1 - by0) * self.tile_size, (bx1 - bx0) * self.tile_size), NODATA_INDEX, dtype=np.uint8)
+        tile_count = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for by in range(by0, by1):
+                for bx in range(bx0, bx1):
+                    indices = self._reproject_indices(raster, value_range, max_zoom, bx * block, by * block, block)
+                    for level in range(block_levels + 1):
+                        if level:
+                            # Blocks start on even tiles of every level, so this matches decimating the whole level
+                            indices = indices[::2, ::2]
+                        scale = 2 ** level
+                        tile_count += self._write_level(executor, indices, lut, max_zoom - level,
+                                                        bx * block // scale, by * block // scale, Path(output_dir))
+                    row, col = (by - by0) * self.tile_size, (bx - bx0) * self.tile_size
+                    mosaic[row:row + self.tile_size, col:col + self.tile_size] = indices
+
+            indices, tx, ty = mosaic, bx0, by0
+            for zoom in range(max_zoom - block_levels - 1, min_zoom - 1, -1):
+                indices, tx, ty = self._decimate(indices, tx, ty)
+                tile_count += self._write_level(executor, indices, lut, zoom, tx, ty, Path(output_dir))
+
+        lon_west, lat_south, lon_east, lat_north = transform_bounds(WEB_MERCATOR, WGS84, west, south, east, north)
+        metadata = {
+            "min_zoom": min_zoom,
+            "max_zoom": max_zoom,
+            "bounds": [lon_west, lat_south, lon_east, lat_north],
+            "format": self.tile_format,
+            "tile_size": self.tile_size,
+            "tile_count": tile_count,
+            "directory": str(output_dir),
+        }
+        with open(Path(output_dir) / "metadata.json", "w") as f:
+            json.dump({key: value for key, value in metadata.items() if key != "directory"}, f)
+
+        logger.info(f"Wrote {tile_count} tiles to {output_dir}")
+        return metadata
+
+    def _reproject_indices(self, raster, value_range, zoom, tx0, ty0, tiles):
+        """
+        Warp a block of tiles x tiles tiles of zoom and quantize it to palette indices.
+
+        Only the window of the source under the block (plus a margin for the
+        bilinear kernel) is filled and handed to the warper.
+        """
+        pixel = 2 * ORIGIN_SHIFT / 2 ** zoom / self.tile_size
+        left, top = -ORIGIN_SHIFT + tx0 * pixel * self.tile_size, ORIGIN_SHIFT - ty0 * pixel * self.tile_size
+        span = tiles * self.tile_size
+        dst_transform = Affine(pixel, 0.0, left, 0.0, -pixel, top)
+
+        src_left, src_bottom, src_right, src_top = transform_bounds(
+            WEB_MERCATOR, raster.crs, left, top - span * pixel, left + span * pixel, top, densify_pts=21
+        )
+        inverse = ~raster.transform
+        cols, rows = zip(inverse * (src_left, src_top), inverse * (src_right, src_bottom))
+        height, width = raster.shape
+        row0, row1 = max(int(math.floor(min(rows))) - 2, 0), min(int(math.ceil(max(rows))) + 2, height)
+        col0, col1 = max(int(math.floor(min(cols))) - 2, 0), min(int(math.ceil(max(cols))) + 2, width)
+        if row0 >= row1 or col0 >= col1:
+            return np.full((span, span), NODATA_INDEX, dtype=np.uint8)
+
+        window = (slice(row0, row1), slice(col0, col1))
+        source = np.where(raster.mask[window], np.float32(np.nan), raster.array[window]).astype(np.float32, copy=False)
+        warped = np.full((span, span), np.nan, dtype=np.float32)
+
+        reproject(
+            source=source,
+            destination=warped,
+            src_transform=raster.transform * Affine.translation(col0, row0),
+            src_crs=raster.crs,
+            src_nodata=np.nan,
+            dst_transform=dst_transform,
+            dst_crs=WEB_MERCATOR,
+            dst_nodata=np.nan,
+            resampling=Resampling.bilinear
+        )
+        # Palette indices are shared by every level, so colors match across zooms
+        return quantize(warped, np.isnan(warped), *value_range)
+
+    def _decimate(self, indices, tx0, ty0):
+        """Overview of the next shallower level: pad to even tile boundaries and keep every other pixel."""
+        size = self.tile_size
+        pad_left, pad_top = (tx0 % 2) * size, (ty0 % 2) * size
+        pad_right = (-(indices.shape[1] + pad_left)) % (2 * size)
+        pad_bottom = (-(indices.shape[0] + pad_top)) % (2 * size)
+        if pad_left or pad_top or pad_right or pad_bottom:
+            indices = np.pad(indices, ((pad_top, pad_bottom), (pad_left, pad_right)), constant_values=NODATA_INDEX)
+        return indices[::2, ::2], tx0 // 2, ty0 // 2
+
+    def _write_level(self, executor, indices, lut, zoom, tx0, ty0, output_dir):
+        size = self.tile_size
+        jobs = []
+        for row in range(indices.shape[0] // size):
+            for col in range(indices.shape[1] // size):
+                block = indices[row * size:(row + 1) * size, col * size:(col + 1) * size]
+                if (block == NODATA_INDEX).all():
+                    continue
+                path = output_dir / str(zoom) / str(tx0 + col) / f"{ty0 + row}.{self.tile_format}"
+                jobs.append(executor.submit(self._write_tile, block, lut, path))
+
+        for job in jobs:
+            job.result()
+        return len(jobs)
+
+    def _write_tile(self, block, lut, path):
+        os.makedirs(path.parent, exist_ok=True)
+        if self.tile_format == "webp":
+            # Fastest lossless method: tiles are small and exact colors matter more than bytes
+            Image.fromarray(lut[block]).save(path, lossless=True, method=0)
+            return
+
+        image = Image.fromarray(np.ascontiguousarray(block))
+        image.putpalette(lut[:, :3].tobytes())
+        save_options = {}
+        if (lut[:, 3] < 255).any():
+            save_options["transparency"] = lut[:, 3].tobytes()
+        image.save(path, **save_options)
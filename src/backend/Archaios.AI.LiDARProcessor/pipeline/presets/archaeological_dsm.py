@@ -1,9 +1,11 @@
 from pathlib import Path
+from functools import partial
 
 from scipy import optimize
 from modules.lidar_reader import LiDARReader
 from modules.noise_filter import NoiseFilter
-from modules.ground_classifier import GroundClassifier
+from modules.voxel_filter import VoxelFilter
+from modules.ground_classifier import GroundClassifier, ProgressiveMorphologicalClassifier, ClothSimulationClassifier
 from modules.dtm_generator import DTMGenerator
 from modules.dsm_generator import DSMGenerator
 from modules.hillshade_generator import HillshadeGenerator
@@ -11,13 +13,24 @@ from modules.hillshade_multidirectional_generator import HillshadeMultiDirection
 from modules.slope_analyzer import SlopeAnalyzer
 from modules.lasinfo_exporter import LASInfoExporter
 from modules.coordinate_publisher import CoordinatePublisher
+from modules.streaming_rasterizer import RasterGrid
+from modules.fused_gridder import FusedGridder
+from modules.raster_data import RasterData, DEFAULT_RASTER_DTYPE
+from modules.colormap_renderer import render_paletted_png
+from modules.tile_pyramid import TilePyramidGenerator
+from modules.terrain_derivatives import TerrainDerivatives
+from modules.block_processor import BlockProcessor, DEFAULT_BLOCK_SIZE
+from pipeline.stage_graph import StageGraph
+from pipeline.stage_cache import file_fingerprint
 from pyproj import Transformer
+from rasterio.crs import CRS
 import utm
 import os
 import json
+import shutil
 import logging
 import datetime
-import matplotlib.cm as cm
+import tempfile
 
 import numpy as np
 import rasterio
@@ -112,6 +125,14 @@ def extract_survey_key_and_code(filename):
         return survey_key, survey_code
     return None, None
 
+def survey_crs(filename):
+    """UTM south CRS of a survey from the fallback zone table, or None for unknown surveys."""
+    survey_key, survey_code = extract_survey_key_and_code(filename or "")
+    zone = survey_to_zone.get(survey_key)
+    if zone is None and survey_code:
+        zone = next((zone for key, zone in survey_to_zone.items() if key.startswith(survey_code)), None)
+    return CRS.from_epsg(32700 + zone) if zone else None
+
 def extract_latlon_from_las(las, filename):
     """
     Extract latitude/longitude from LAS file.
@@ -123,9 +144,24 @@ def extract_latlon_from_las(las, filename):
     center_x = (min_x + max_x) / 2
     center_y = (min_y + max_y) / 2
 
+    return _center_to_latlon(center_x, center_y, las.header.parse_crs, filename)
+
+def extract_latlon_from_header(header_summary, filename):
+    """
+    Extract latitude/longitude from a LiDARReader header summary.
+    Uses the header bounds, so no point records need to be decoded.
+    """
+    bounds = header_summary["bounds"]
+    center_x = (bounds["min_x"] + bounds["max_x"]) / 2
+    center_y = (bounds["min_y"] + bounds["max_y"]) / 2
+
+    return _center_to_latlon(center_x, center_y, lambda: header_summary.get("crs"), filename)
+
+def _center_to_latlon(center_x, center_y, parse_crs, filename):
+    """Transform a projected center point to lat/lon, falling back to the survey zone table."""
     # Try to get CRS from LAS header
     try:
-        las_crs = las.header.parse_crs()
+        las_crs = parse_crs()
         if las_crs:
             crs_epsg = las_crs.to_epsg()
             print(f"Detected CRS EPSG:{crs_epsg}")
@@ -177,39 +213,21 @@ def tif_to_image(
 ):
     """
     Converts a single-band GeoTIFF into a colorized PNG with optional colormap and transparency.
+    tif_path may also be an in-memory RasterData, in which case nothing is read from disk.
+    The PNG is paletted, with the colormap's lookup table as its palette.
     """
-    with rasterio.open(tif_path) as src:
-        arr = src.read(1, masked=True)
-
-        if arr.mask.all():
-            logger.warning(f"All pixels are nodata in {tif_path}, generating blank image.")
-            blank_img = Image.new("RGBA", arr.shape[::-1], (255, 255, 255, 0))
-            blank_img.save(out_image_path)
-            return str(out_image_path)
-
-        valid_data = arr.compressed()
-        arr_min, arr_max = valid_data.min(), valid_data.max()
-        logger.info(f"Normalizing {tif_path}: min={arr_min}, max={arr_max}")
-
-        # Create a new array instead of modifying the original
-        norm = np.zeros_like(arr, dtype=np.float32)
-        if arr_max > arr_min:
-            # Use a boolean mask for safe assignment
-            mask = ~arr.mask
-            norm[mask] = (arr[mask] - arr_min) / (arr_max - arr_min)
-        else:
-            norm[~arr.mask] = 0.5
-
-        cmap = cm.get_cmap(colormap)
-        rgba_img = (cmap(norm) * 255).astype(np.uint8)
+    raster = RasterData.load(tif_path)
+    source_name = Path(out_image_path).stem if isinstance(tif_path, RasterData) else tif_path
 
-        if transparent_nodata:
-            rgba_img[arr.mask, 3] = 0
+    if raster.mask.all():
+        logger.warning(f"All pixels are nodata in {source_name}, generating blank image.")
+        blank_img = Image.new("RGBA", raster.shape[::-1], (255, 255, 255, 0))
+        blank_img.save(out_image_path)
+        return str(out_image_path)
 
-        img = Image.fromarray(rgba_img, mode='RGBA')
-        img = img.convert('P', palette=Image.ADAPTIVE, colors=256)
-        img.save(out_image_path, optimize=True)
-        logger.info(f"Saved colorized image: {out_image_path}")
+    arr_min, arr_max = render_paletted_png(raster.array, raster.mask, out_image_path, colormap, transparent_nodata)
+    logger.info(f"Normalized {source_name}: min={arr_min}, max={arr_max}")
+    logger.info(f"Saved colorized image: {out_image_path}")
 
     return str(out_image_path)
 
@@ -223,7 +241,214 @@ def has_ground_classification(las):
     ground_points = np.where(las.classification == 2)[0]
     return len(ground_points) > 0
 
-def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=0.0, resolution=0.5, dtm_resolution=0.5, dsm_resolution=0.5, parameters=None):
+def _write_raster(raster, path, **write_options):
+    """Persist raster as a GeoTIFF when a path is given and pass it on unchanged."""
+    if path:
+        raster.write(path, **write_options)
+    return raster
+
+def use_streaming_mode(header_summary, parameters=None):
+    """Decide from the header whether the cloud should be streamed instead of loaded."""
+    if not parameters:
+        return False
+    if getattr(parameters, 'streaming_mode', False):
+        return True
+    threshold = getattr(parameters, 'streaming_point_threshold', 0)
+    return bool(threshold) and header_summary["point_count"] > threshold
+
+# Image stages produced by each workflow node type
+WORKFLOW_PRODUCTS = {
+    "dtm_generator": ("dtm_image",),
+    "dsm_generator": ("dsm_image",),
+    "hillshade_generator": ("hillshade_image", "hillshade_multidirectional_image"),
+    "slope_analyzer": ("slope_image",),
+}
+
+# ProcessingParameters flags that request the same products as a workflow node
+PRODUCT_FLAGS = {
+    "generate_dtm": "dtm_generator",
+    "generate_dsm": "dsm_generator",
+    "generate_hillshade": "hillshade_generator",
+    "generate_slope": "slope_analyzer",
+}
+
+ALL_PRODUCTS = tuple(product for products in WORKFLOW_PRODUCTS.values() for product in products)
+
+def _workflow_node_type(node):
+    """Type of a workflow node given as a raw dict or as a WorkflowNode."""
+    if isinstance(node, dict):
+        return node.get('Type') or node.get('type')
+    return getattr(node, 'type', None)
+
+def requested_products(parameters=None):
+    """
+    Image stages the workflow asks for.
+
+    Product nodes in the workflow take precedence; otherwise the generate_*
+    flags are used. Without either, every product is built.
+
+    Args:
+        parameters: ProcessingParameters of the request, or None
+
+    Returns:
+        List of image stage names, in pipeline order
+    """
+    if not parameters:
+        return list(ALL_PRODUCTS)
+
+    node_types = {_workflow_node_type(node) for node in (getattr(parameters, 'workflow', None) or [])}
+    node_types &= set(WORKFLOW_PRODUCTS)
+    if not node_types:
+        node_types = {node_type for flag, node_type in PRODUCT_FLAGS.items() if getattr(parameters, flag, False)}
+    if not node_types:
+        logger.info("Workflow requests no raster products, building all of them")
+        return list(ALL_PRODUCTS)
+
+    requested = {product for node_type in node_types for product in WORKFLOW_PRODUCTS[node_type]}
+    return [product for product in ALL_PRODUCTS if product in requested]
+
+def generate_surfaces_in_memory(cloud, header_summary, noise_filter, ground_classifier,
+                                dtm_generator, dsm_generator, info_exporter, dtm_path, dsm_path):
+    """
+    Build the DTM, DSM and raw/filtered/classified LAS info for a loaded cloud.
+
+    Stages pass PointCloud views: the noise filter narrows the selection and the
+    ground classifier only replaces the classification column, so no point
+    records are copied. A single FusedGridder pass then computes cell indices
+    once and emits the ground minimum, surface maximum, counts and statistics.
+    """
+    filtered = noise_filter.filter(cloud)
+    logger.info(f"Filtered noise from LiDAR data: {len(filtered)} of {len(cloud)} points kept")
+
+    classification = filtered.get('classification')
+    if classification is None or not np.any(classification == 2):
+        logger.info("No existing ground classification found. Performing ground classification...")
+        classified = filtered.with_column(
+            'classification', ground_classifier.classify_points(filtered.x, filtered.y, filtered.z)
+        )
+        logger.info("Classified ground points in LiDAR data")
+    else:
+        logger.info("Using existing ground classification (class 2) from input LAS file")
+        classified = filtered
+
+    # Unlike the header bounds used when streaming, the grids follow the kept
+    # points: the DTM the outlier-filtered ground points and the DSM the robust
+    # percentile extent, so stray points neither enlarge nor coarsen them
+    x, y = classified.x, classified.y
+    ground = dtm_generator.select_ground(classified.z, classified.get('classification'))
+    dtm_grid = dtm_generator.plan_grid(x[ground], y[ground])
+    dsm_grid, is_e57_derived = dsm_generator.plan_point_grid(x, y) if dsm_generator else (None, False)
+
+    gridder = FusedGridder(dtm_grid, dsm_grid, dtype=dtm_generator.dtype)
+    gridder.update_cloud(cloud, filtered, classified, ground=ground)
+
+    for stage, stats in (("raw", gridder.raw_stats), ("filtered", gridder.filtered_stats), ("classified", gridder.classified_stats)):
+        info_exporter.export_statistics(stats, cloud.header, stage)
+
+    crs = header_summary.get("crs")
+    dtm_raster = dtm_generator.generate_from_grid(gridder.ground_min.get("min"), dtm_grid, crs, dtm_path, filter_outliers=False)
+    dsm_raster = None
+    if dsm_generator:
+        dsm_raster = dsm_generator.generate_from_grid(gridder.surface_max.get("max"), gridder.dsm_grid, crs, is_e57_derived, dsm_path)
+    return dtm_raster, dsm_raster
+
+def generate_surfaces_streaming(reader, header_summary, noise_filter, ground_classifier,
+                                dtm_generator, dsm_generator, info_exporter, dtm_path, dsm_path):
+    """
+    Build the DTM and DSM from point batches with memory proportional to the rasters.
+
+    A single FusedGridder pass accumulates the global noise statistics together
+    with the DTM minimum (class 2 points, plus all points and the ground seed
+    minimum for files without a ground classification), the DSM maximum and
+    the LAS summary statistics, so every chunk is decoded once. The z-score
+    band of the noise filter is applied to the grids when finalising.
+    """
+    bounds = header_summary["bounds"]
+    dtm_grid = _header_grid(header_summary, dtm_generator.grid_res)
+    seed_grid = ground_classifier.seed_grid(bounds)
+    gridder = None
+    is_e57_derived = False
+
+    for batch in reader.iter_chunks(dimensions=("x", "y", "z", "classification", "return_number")):
+        x, y, z = batch["x"], batch["y"], batch["z"]
+        if gridder is None:
+            dsm_grid, is_e57_derived = dsm_generator.plan_grid(header_summary, x) if dsm_generator else (None, False)
+            gridder = FusedGridder(dtm_grid, dsm_grid, seed_grid=seed_grid, dtype=dtm_generator.dtype,
+                                   z_range=(bounds["min_z"], bounds["max_z"]),
+                                   z_quantum=(header_summary["scales"][2], header_summary["offsets"][2]))
+
+        noise_filter.partial_fit(z)
+        gridder.update(x, y, z, batch.get("classification"), batch.get("return_number"))
+
+    if gridder is None:
+        raise ValueError("No points found in input file.")
+
+    noise_filter.finish_streaming()
+    gridder.apply_band(*noise_filter.inlier_band())
+    band = gridder.band
+
+    header = reader.read_header()
+    info_exporter.export_statistics(gridder.raw_stats, header, "raw")
+    info_exporter.export_statistics(gridder.filtered_stats, header, "filtered")
+
+    crs = header_summary.get("crs")
+    if gridder.ground_points > 0:
+        logger.info(f"Using existing ground classification (class 2): {gridder.ground_points} streamed ground points")
+        info_exporter.export_statistics(gridder.classified_stats, header, "classified")
+        dtm_min = gridder.ground_min.get("min", band=band)
+    else:
+        logger.info("No existing ground classification found. Classifying streamed ground cells...")
+        dtm_min = ground_classifier.classify_grid(gridder.all_min.get("min", band=band), dtm_grid,
+                                                  gridder.seed_min.get("min", band=band), seed_grid)
+
+    dtm_raster = dtm_generator.generate_from_grid(dtm_min, dtm_grid, crs, dtm_path)
+    dsm_raster = None
+    if dsm_generator:
+        dsm_raster = dsm_generator.generate_from_grid(gridder.surface_max.get("max", band=band), gridder.dsm_grid, crs, is_e57_derived, dsm_path)
+    return dtm_raster, dsm_raster
+
+# Per-stage LAS info files written next to the surfaces
+INFO_FILES = ("raw_info.txt", "filtered_info.txt", "classified_info.txt")
+
+def _store_cached_surfaces(cache, key, dtm_raster, dsm_raster, output_dir):
+    """Add the DTM/DSM rasters and the LAS info files to the stage cache."""
+    with tempfile.TemporaryDirectory() as staging:
+        files = {"dtm.tif": dtm_raster.write(Path(staging) / "dtm.tif")}
+        if dsm_raster is not None:
+            files["dsm.tif"] = dsm_raster.write(Path(staging) / "dsm.tif")
+        for name in INFO_FILES:
+            if (Path(output_dir) / name).exists():
+                files[name] = Path(output_dir) / name
+        cache.store(key, files)
+
+def _load_cached_surfaces(entry, output_dir, dtm_path=None, dsm_path=None):
+    """
+    Restore cached surfaces as if they had just been generated.
+
+    Returns:
+        Tuple of (dtm_raster, dsm_raster); dsm_raster is None if it was not cached
+    """
+    rasters = []
+    for name, path in (("dtm.tif", dtm_path), ("dsm.tif", dsm_path)):
+        if not (entry / name).exists():
+            rasters.append(None)
+            continue
+        raster = RasterData.read(entry / name)
+        # Generated rasters mark nodata with NaN, so rebuild the mask from it
+        rasters.append(raster.with_array(raster.array, raster.nodata))
+        if path:
+            shutil.copyfile(entry / name, path)
+
+    for name in INFO_FILES:
+        if (entry / name).exists():
+            shutil.copyfile(entry / name, Path(output_dir) / name)
+    return tuple(rasters)
+
+def _header_grid(header_summary, res):
+    bounds = header_summary["bounds"]
+    return RasterGrid.from_bounds(bounds["min_x"], bounds["min_y"], bounds["max_x"], bounds["max_y"], res)
+
+def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=0.0, resolution=0.5, dtm_resolution=0.5, dsm_resolution=0.5, parameters=None, stage_cache=None, input_fingerprint=None, header_summary=None, max_concurrent_jobs=1):
     """
     Process LiDAR data for archaeological feature detection
     
@@ -235,51 +460,87 @@ def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=
         dtm_resolution: Specific DTM resolution
         dsm_resolution: Specific DSM resolution
         parameters: Additional processing parameters from workflow
+        stage_cache: Optional StageCache reused across runs for the DTM/DSM surfaces
+        input_fingerprint: Content identifier of the input (e.g. blob ETag);
+            the file is hashed when a cache is given without one
+        header_summary: LiDARReader header summary or probe() result of the
+            input, read from the file when not given
+        max_concurrent_jobs: Jobs the service runs side by side; PMF tile
+            workers get an equal share of the cores
     
     Returns:
         Dict with processing results
     """
-    las = LiDARReader(input_las).read()
-    logger.info(f"Processing LiDAR data from {input_las}")
-    info_exporter = LASInfoExporter(output_dir)
-    logger.info(f"Exporting raw LAS info to {output_dir}")
-    info_exporter.export(las, "raw")
-    
+    reader_params = {}
+    if parameters:
+        if hasattr(parameters, 'streaming_chunk_size'):
+            reader_params['chunk_size'] = int(parameters.streaming_chunk_size)
+
+    reader = LiDARReader(input_las, **reader_params)
+    # The caller may already have probed the header
+    header_summary = header_summary or reader.header_summary()
+
     if (lat == 0.0 and lon == 0.0):
-        lat, lon = extract_latlon_from_las(las,site_id)
-    
+        lat, lon = extract_latlon_from_header(header_summary, site_id)
+
     logger.info(f"Extracted coordinates: lat={lat}, lon={lon}")
+
     noise_filter_params = {}
     if parameters:
         if hasattr(parameters, 'noise_filter_std_ratio'):
             noise_filter_params['std_ratio'] = parameters.noise_filter_std_ratio
         if hasattr(parameters, 'noise_filter_neighbors'):
             noise_filter_params['nb_neighbors'] = int(parameters.noise_filter_neighbors)
-    
-    noise_filter = NoiseFilter(**noise_filter_params)
-    las = noise_filter.filter(las)
-    logger.info("Filtered noise from LiDAR data")
-    info_exporter.export(las, "filtered")
 
-    # Check if ground classification already exists
-    has_ground = has_ground_classification(las)
-    
-    if not has_ground:
-        logger.info("No existing ground classification found. Performing ground classification...")
-        ground_classifier_params = {}
-        if parameters:
-            if hasattr(parameters, 'ground_classifier_cell_size'):
-                ground_classifier_params['grid_size'] = parameters.ground_classifier_cell_size
-            if hasattr(parameters, 'ground_classifier_max_distance'):
-                ground_classifier_params['z_threshold'] = parameters.ground_classifier_max_distance
-        
-        ground_classifier = GroundClassifier(**ground_classifier_params)
-        las = ground_classifier.classify(las)
-        logger.info("Classified ground points in LiDAR data")
-    else:
-        logger.info("Using existing ground classification (class 2) from input LAS file")
-    
-    info_exporter.export(las, "classified")
+    noise_filter_method = 'sor'
+    voxel_filter_params = {}
+    if parameters:
+        if hasattr(parameters, 'noise_filter_method') and parameters.noise_filter_method:
+            noise_filter_method = parameters.noise_filter_method.lower()
+        if hasattr(parameters, 'voxel_filter_size'):
+            voxel_filter_params['voxel_size'] = parameters.voxel_filter_size
+        if hasattr(parameters, 'voxel_filter_min_points'):
+            voxel_filter_params['min_points'] = int(parameters.voxel_filter_min_points)
+        if hasattr(parameters, 'voxel_filter_decimate'):
+            voxel_filter_params['decimate'] = parameters.voxel_filter_decimate
+
+    ground_classifier_params = {}
+    if parameters:
+        if hasattr(parameters, 'ground_classifier_cell_size'):
+            ground_classifier_params['grid_size'] = parameters.ground_classifier_cell_size
+        if hasattr(parameters, 'ground_classifier_max_distance'):
+            ground_classifier_params['z_threshold'] = parameters.ground_classifier_max_distance
+
+    ground_classifier_method = 'simple'
+    pmf_params = {}
+    if parameters:
+        if hasattr(parameters, 'ground_classifier_method') and parameters.ground_classifier_method:
+            ground_classifier_method = parameters.ground_classifier_method.lower()
+        if hasattr(parameters, 'ground_classifier_max_distance'):
+            pmf_params['z_threshold'] = parameters.ground_classifier_max_distance
+        if hasattr(parameters, 'pmf_cell_size'):
+            pmf_params['cell_size'] = parameters.pmf_cell_size
+        if hasattr(parameters, 'pmf_max_window_size'):
+            pmf_params['max_window_size'] = parameters.pmf_max_window_size
+        if hasattr(parameters, 'pmf_slope'):
+            pmf_params['slope'] = parameters.pmf_slope
+        if hasattr(parameters, 'pmf_initial_distance'):
+            pmf_params['initial_distance'] = parameters.pmf_initial_distance
+        if hasattr(parameters, 'pmf_max_distance'):
+            pmf_params['max_distance'] = parameters.pmf_max_distance
+
+    csf_params = {}
+    if parameters:
+        if hasattr(parameters, 'csf_cloth_resolution'):
+            csf_params['cloth_resolution'] = parameters.csf_cloth_resolution
+        if hasattr(parameters, 'csf_rigidness'):
+            csf_params['rigidness'] = int(parameters.csf_rigidness)
+        if hasattr(parameters, 'csf_iterations'):
+            csf_params['iterations'] = int(parameters.csf_iterations)
+        if hasattr(parameters, 'csf_time_step'):
+            csf_params['time_step'] = parameters.csf_time_step
+        if hasattr(parameters, 'csf_class_threshold'):
+            csf_params['class_threshold'] = parameters.csf_class_threshold
 
     dtm_path = Path(output_dir) / "dtm.tif"
     dsm_path = Path(output_dir) / "dsm.tif"
@@ -287,7 +548,22 @@ def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=
     hillshade_multidirectional_path = Path(output_dir) / "hillshade_multidirectional.tif"
     slope_path = Path(output_dir) / "slope.tif"
 
-    dtm_params = {'grid_res': dtm_resolution}
+    # Rasters are handed between stages in memory; GeoTIFFs are an optional sink
+    write_geotiffs = True
+    if parameters and hasattr(parameters, 'write_geotiffs'):
+        write_geotiffs = parameters.write_geotiffs
+
+    # COGs are written by their own stages, in place of the plain GeoTIFFs
+    cog_outputs = bool(parameters and getattr(parameters, 'cog_outputs', False))
+    cog_compression = getattr(parameters, 'cog_compression', 'deflate') if parameters else 'deflate'
+    if cog_outputs:
+        write_geotiffs = False
+
+    block_size = parameters.raster_block_size if parameters and hasattr(parameters, 'raster_block_size') else DEFAULT_BLOCK_SIZE
+
+    dtype = parameters.raster_dtype if parameters and hasattr(parameters, 'raster_dtype') else DEFAULT_RASTER_DTYPE
+
+    dtm_params = {'grid_res': dtm_resolution, 'dtype': dtype}
     if parameters:
         if hasattr(parameters, 'dtm_fill_nan'):
             dtm_params['fill_nan'] = parameters.dtm_fill_nan 
@@ -295,21 +571,106 @@ def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=
             dtm_params['smooth'] = parameters.dtm_smooth
     
     logger.info(f"Generating DTM at {dtm_path} with resolution {dtm_resolution}")
-    dtm_generator = DTMGenerator(**dtm_params)
+    # Block size only bounds memory, so it stays out of dtm_params and the stage cache key
+    dtm_generator = DTMGenerator(block_size=block_size, **dtm_params)
     
-    dsm_params = {'grid_res': dsm_resolution}
+    dsm_params = {'grid_res': dsm_resolution, 'dtype': dtype}
     if parameters:
         if hasattr(parameters, 'dsm_adjust_resolution'):
             pass
     
     logger.info(f"Generating DSM at {dsm_path} with resolution {dsm_resolution}")
     dsm_generator = DSMGenerator(**dsm_params)
+
+    info_exporter = LASInfoExporter(output_dir)
+    noise_filter = NoiseFilter(**noise_filter_params)
+    if ground_classifier_method == 'pmf':
+        # Worker count only affects speed, so it stays out of pmf_params and the stage cache key
+        pmf_workers = max(1, (os.cpu_count() or 1) // max(1, max_concurrent_jobs))
+        ground_classifier = ProgressiveMorphologicalClassifier(max_workers=pmf_workers, **pmf_params)
+    elif ground_classifier_method == 'csf':
+        ground_classifier = ClothSimulationClassifier(**csf_params)
+    else:
+        ground_classifier = GroundClassifier(**ground_classifier_params)
+
+    streaming = use_streaming_mode(header_summary, parameters)
+    if streaming:
+        logger.info(f"Streaming {header_summary['point_count']} points from {input_las} in batches of {reader.chunk_size}")
+        if noise_filter_method != 'sor':
+            logger.warning(f"Noise filter method '{noise_filter_method}' is not supported in streaming mode, using Z statistics")
+    elif noise_filter_method == 'voxel':
+        noise_filter = VoxelFilter(**voxel_filter_params)
+
+    if stage_cache is not None and parameters and not getattr(parameters, 'use_stage_cache', True):
+        stage_cache = None
+
+    # Everything the DTM/DSM depend on; visualization settings are deliberately absent
+    surfaces_cache_params = {
+        "streaming": streaming,
+        "noise_filter_method": noise_filter_method,
+        "noise_filter": noise_filter_params,
+        "voxel_filter": voxel_filter_params,
+        "ground_classifier_method": ground_classifier_method,
+        "ground_classifier": {'pmf': pmf_params, 'csf': csf_params}.get(ground_classifier_method, ground_classifier_params),
+        "dtm": dtm_params,
+        "dsm": dsm_params,
+    }
+
+    def build_surfaces():
+        if stage_cache is None:
+            return compute_surfaces()
+
+        fingerprint = input_fingerprint or file_fingerprint(input_las)
+        key = stage_cache.key(fingerprint, "surfaces", {**surfaces_cache_params, "build_dsm": build_dsm})
+        entry = stage_cache.fetch(key)
+        if entry is not None:
+            try:
+                return _load_cached_surfaces(
+                    entry,
+                    output_dir,
+                    dtm_path if write_geotiffs else None,
+                    dsm_path if write_geotiffs else None
+                )
+            except Exception as e:
+                logger.warning(f"Failed to load cached surfaces, recomputing: {e}")
+
+        surfaces = compute_surfaces()
+        try:
+            _store_cached_surfaces(stage_cache, key, surfaces[0], surfaces[1], output_dir)
+        except Exception as e:
+            logger.warning(f"Failed to cache surfaces: {e}")
+        return surfaces
+
+    def compute_surfaces():
+        if streaming:
+            return generate_surfaces_streaming(
+                reader,
+                header_summary,
+                noise_filter,
+                ground_classifier,
+                dtm_generator,
+                dsm_generator if build_dsm else None,
+                info_exporter,
+                dtm_path if write_geotiffs else None,
+                dsm_path if write_geotiffs else None
+            )
+
+        cloud = reader.read_cloud()
+        logger.info(f"Processing LiDAR data from {input_las}")
+        return generate_surfaces_in_memory(
+            cloud,
+            header_summary,
+            noise_filter,
+            ground_classifier,
+            dtm_generator,
+            dsm_generator if build_dsm else None,
+            info_exporter,
+            dtm_path if write_geotiffs else None,
+            dsm_path if write_geotiffs else None
+        )
     
-    dtm_generator.generate(las, dtm_path)
-    dsm_generator.generate(las, dsm_path)
-    
-    hillshade_params = {}
-    hillshade_multidirectional_params ={}
+    hillshade_params = {'block_size': block_size}
+    hillshade_multidirectional_params = {'block_size': block_size}
 
     if parameters:
         if hasattr(parameters, 'hillshade_azimuth'):
@@ -321,7 +682,6 @@ def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=
     
     logger.info(f"Generating hillshade at {hillshade_path} with parameters: {hillshade_params}")
     hillshade_generator = HillshadeGenerator(**hillshade_params)
-    hillshade_generator.generate(dtm_path, hillshade_path)
     
     if parameters:
         if hasattr(parameters, 'hillshade_azimuth'):
@@ -338,10 +698,7 @@ def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=
                 
     logger.info(f"Generating multi-directional hillshade at {hillshade_multidirectional_path} with parameters: {hillshade_multidirectional_params}")
     hillshade_multigenerator = HillshadeMultiDirectionalGenerator(**hillshade_multidirectional_params)
-    hillshade_multigenerator.generate(dtm_path, hillshade_multidirectional_path)
-    
-    logger.info(f"Analyzing slope at {slope_path}")
-    SlopeAnalyzer(slope_unit="degrees", clip_range=(0, 60)).analyze(dtm_path, slope_path)
+    slope_analyzer = SlopeAnalyzer(slope_unit="degrees", clip_range=(0, 60), block_size=block_size)
 
     dtm_colormap = 'gray'
     dsm_colormap = 'terrain'
@@ -365,18 +722,120 @@ def run_archaeological_dsm_pipeline(site_id,input_las, output_dir, lat=0.0, lon=
     hillsahe_multidirectional_img = Path(output_dir) / "hillshade_multidirectional.png"
     slope_img = Path(output_dir) / "slope.png"
     
-    tif_to_image(dtm_path, dtm_img, colormap=dtm_colormap, transparent_nodata=transparent_nodata)
-    tif_to_image(dsm_path, dsm_img, colormap=dsm_colormap, transparent_nodata=transparent_nodata)
-    tif_to_image(hillshade_path, hillshade_img, colormap=hillshade_colormap, transparent_nodata=transparent_nodata)
-    tif_to_image(hillshade_multidirectional_path, hillsahe_multidirectional_img, colormap=hillshade_colormap, transparent_nodata=transparent_nodata)
-    tif_to_image(slope_path, slope_img, colormap=slope_colormap, transparent_nodata=transparent_nodata)
-
-    return {
-        "lat": lat,
-        "lon": lon,
+    def hillshade_stage(dtm_raster, dtm_derivatives):
+        raster = hillshade_generator.generate_raster(dtm_raster, dtm_derivatives)
+        return _write_raster(raster, hillshade_path if write_geotiffs else None)
+
+    def hillshade_multidirectional_stage(dtm_raster, dtm_derivatives):
+        raster = hillshade_multigenerator.generate_raster(dtm_raster, dtm_derivatives)
+        return _write_raster(raster, hillshade_multidirectional_path if write_geotiffs else None)
+
+    def tiles_stage(tile_generator, tile_dir, raster):
+        # Tiles are an extra; a raster that cannot be placed on the map must not fail the job
+        if raster.crs is None:
+            raster = RasterData(raster.array, raster.transform, survey_crs(site_id), raster.mask, raster.nodata)
+        try:
+            return tile_generator.generate(raster, tile_dir)
+        except MemoryError:
+            # Running out of memory is a host problem, not a bad raster; let the job fail loudly
+            raise
+        except Exception as e:
+            logger.warning(f"Skipping map tiles in {tile_dir}: {e}")
+            return None
+
+    def slope_stage(dtm_raster, dtm_derivatives):
+        logger.info(f"Analyzing slope at {slope_path}")
+        raster = slope_analyzer.analyze_raster(dtm_raster, dtm_derivatives)
+        return _write_raster(raster, slope_path if write_geotiffs else None)
+
+    # Everything after the surfaces only depends on the DTM/DSM, so the
+    # derivative products and the PNG renders run concurrently
+    graph = StageGraph()
+    graph.add("surfaces", build_surfaces)
+    graph.add("dtm", lambda surfaces: surfaces[0], ["surfaces"])
+    graph.add("dsm", lambda surfaces: surfaces[1], ["surfaces"])
+    # dz/dx and dz/dy are computed once and shared by every hillshade and the slope;
+    # DTMs larger than one block skip the full-size gradients and are processed window by window
+    graph.add("derivatives", lambda dtm: None if BlockProcessor(block_size).applies(dtm.shape) else TerrainDerivatives.from_raster(dtm), ["dtm"])
+    graph.add("hillshade", hillshade_stage, ["dtm", "derivatives"])
+    graph.add("hillshade_multidirectional", hillshade_multidirectional_stage, ["dtm", "derivatives"])
+    graph.add("slope", slope_stage, ["dtm", "derivatives"])
+
+    for product, image_path, colormap in (
+        ("dtm", dtm_img, dtm_colormap),
+        ("dsm", dsm_img, dsm_colormap),
+        ("hillshade", hillshade_img, hillshade_colormap),
+        ("hillshade_multidirectional", hillsahe_multidirectional_img, hillshade_colormap),
+        ("slope", slope_img, slope_colormap),
+    ):
+        graph.add(
+            f"{product}_image",
+            partial(tif_to_image, out_image_path=image_path, colormap=colormap, transparent_nodata=transparent_nodata),
+            [product]
+        )
+
+    # Only the stages feeding a requested image run; a hillshade-only workflow
+    # never grids the DSM or renders the other PNGs
+    products = requested_products(parameters)
+    targets = list(products)
+
+    if parameters and getattr(parameters, 'generate_map_tiles', False):
+        tile_params = {
+            'tile_format': getattr(parameters, 'tile_format', 'png'),
+            'min_zoom': getattr(parameters, 'tile_min_zoom', None),
+            'max_zoom': getattr(parameters, 'tile_max_zoom', None),
+        }
+        # Map layers: each requested one also gets a tile pyramid next to its PNG
+        for product, colormap in (("dtm", dtm_colormap), ("hillshade", hillshade_colormap), ("slope", slope_colormap)):
+            if f"{product}_image" not in products:
+                continue
+            tile_generator = TilePyramidGenerator(colormap, transparent_nodata, **tile_params)
+            graph.add(f"{product}_tiles", partial(tiles_stage, tile_generator, Path(output_dir) / "tiles" / product), [product])
+            targets.append(f"{product}_tiles")
+
+    cog_files = {}
+    if cog_outputs:
+        for product, raster_path in (
+            ("dtm", dtm_path),
+            ("dsm", dsm_path),
+            ("hillshade", hillshade_path),
+            ("hillshade_multidirectional", hillshade_multidirectional_path),
+            ("slope", slope_path),
+        ):
+            if f"{product}_image" not in products:
+                continue
+            graph.add(f"{product}_cog", partial(_write_raster, path=raster_path, cog=True, compression=cog_compression), [product])
+            targets.append(f"{product}_cog")
+            cog_files[product] = str(raster_path)
+
+    skipped = graph.prune(targets)
+    if skipped:
+        logger.info(f"Skipping stages not needed for {products}: {skipped}")
+    build_dsm = "dsm" in graph.stages
+
+    pipeline_workers = None
+    if parameters and hasattr(parameters, 'pipeline_workers') and parameters.pipeline_workers:
+        pipeline_workers = int(parameters.pipeline_workers)
+
+    results, timings = graph.run(max_workers=pipeline_workers)
+    map_tiles = {name[:-len("_tiles")]: result for name, result in results.items() if name.endswith("_tiles") and result}
+
+    images = {
         "dtm_image": str(dtm_img),
         "dsm_image": str(dsm_img),
         "hillshade_image": str(hillshade_img),
         "hillshade_multidirectional_image": str(hillsahe_multidirectional_img),
-        "slope_image": str(slope_img)
+        "slope_image": str(slope_img),
+    }
+
+    return {
+        "lat": lat,
+        "lon": lon,
+        **{key: path for key, path in images.items() if key in products},
+        **({"map_tiles": map_tiles} if map_tiles else {}),
+        **({"cog_files": cog_files} if cog_files else {}),
+        "processing_details": {
+            "stage_timings": {name: round(seconds, 3) for name, seconds in timings.items()},
+            "skipped_stages": skipped
+        }
     }
\ No newline at end of file
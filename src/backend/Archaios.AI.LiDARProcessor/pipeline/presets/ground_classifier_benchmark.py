@@ -0,0 +1,115 @@
+"""
+Synthetic forested-terrain benchmark of the ground classifiers.
+
+Generates a cloud over sloping, undulating terrain under clustered tree crowns
+and low understory, classifies it with each method and reports recall and
+precision of the ground class against the known truth.
+
+Usage:
+    python -m pipeline.presets.ground_classifier_benchmark --points 2000000 --canopy 0.85
+"""
+import time
+import logging
+import argparse
+import numpy as np
+from modules.ground_classifier import GroundClassifier, ProgressiveMorphologicalClassifier, ClothSimulationClassifier
+
+logger = logging.getLogger("Archaios.GroundClassifierBenchmark")
+
+# Pipeline defaults of each ground_classifier_method
+CLASSIFIERS = {
+    "grid": GroundClassifier,
+    "pmf": ProgressiveMorphologicalClassifier,
+    "csf": ClothSimulationClassifier,
+}
+
+def synthetic_forest(points=2_000_000, canopy=0.85, extent=1000.0, trees_per_ha=150, seed=1):
+    """
+    Generate a forested cloud with known ground points.
+
+    Args:
+        points: Number of points
+        canopy: Fraction of returns from vegetation
+        extent: Side length of the square site
+        trees_per_ha: Tree density; crowns are 3-8 m in radius and 8-35 m tall
+        seed: Random seed
+
+    Returns:
+        Tuple of (x, y, z, is_ground)
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, extent, points)
+    y = rng.uniform(0, extent, points)
+    terrain = 0.15 * x + 8 * np.sin(y / 60) + 3 * np.cos(x / 35)
+
+    vegetation = rng.random(points) < canopy
+    z = terrain + rng.normal(0, 0.05, points)
+
+    # Most vegetation returns come from crowns around the trees, the rest
+    # from understory that sits just above the ground
+    trees = max(int(trees_per_ha * extent * extent / 10_000), 1)
+    tree_x, tree_y = rng.uniform(0, extent, trees), rng.uniform(0, extent, trees)
+    radius, height = rng.uniform(3, 8, trees), rng.uniform(8, 35, trees)
+
+    crown = vegetation & (rng.random(points) < 0.8)
+    tree = rng.integers(0, trees, int(crown.sum()))
+    angle = rng.uniform(0, 2 * np.pi, tree.size)
+    distance = radius[tree] * np.sqrt(rng.random(tree.size))
+    x[crown] = np.clip(tree_x[tree] + distance * np.cos(angle), 0, extent)
+    y[crown] = np.clip(tree_y[tree] + distance * np.sin(angle), 0, extent)
+    crown_terrain = 0.15 * x[crown] + 8 * np.sin(y[crown] / 60) + 3 * np.cos(x[crown] / 35)
+    z[crown] = crown_terrain + height[tree] * rng.uniform(0.4, 1.0, tree.size)
+
+    understory = vegetation & ~crown
+    z[understory] = terrain[understory] + rng.uniform(0.5, 3.0, int(understory.sum()))
+
+    return x, y, z, ~vegetation
+
+def score(classification, is_ground, ground_class=2):
+    """Recall and precision of ground_class against the true ground points."""
+    predicted = classification == ground_class
+    hits = int(np.count_nonzero(predicted & is_ground))
+    return {
+        "recall": hits / max(int(np.count_nonzero(is_ground)), 1),
+        "precision": hits / max(int(np.count_nonzero(predicted)), 1),
+    }
+
+def run_benchmark(methods=("grid", "csf"), **forest):
+    """
+    Classify one synthetic forest with each method.
+
+    Args:
+        methods: Keys of CLASSIFIERS to compare
+        **forest: Arguments of synthetic_forest
+
+    Returns:
+        List of dicts with method, seconds, recall and precision
+    """
+    x, y, z, is_ground = synthetic_forest(**forest)
+    logger.info(f"Synthetic forest: {z.size} points, {np.count_nonzero(is_ground)} ground")
+
+    results = []
+    for method in methods:
+        classifier = CLASSIFIERS[method]()
+        start = time.perf_counter()
+        classification = classifier.classify_points(x, y, z)
+        seconds = time.perf_counter() - start
+        results.append({"method": method, "seconds": seconds, **score(classification, is_ground, classifier.ground_class)})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ground classifiers on a synthetic forest")
+    parser.add_argument("--points", type=int, default=2_000_000)
+    parser.add_argument("--canopy", type=float, default=0.85, help="Fraction of vegetation returns")
+    parser.add_argument("--extent", type=float, default=1000.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--methods", nargs="+", choices=sorted(CLASSIFIERS), default=["grid", "csf"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_benchmark(args.methods, points=args.points, canopy=args.canopy, extent=args.extent, seed=args.seed)
+    for result in results:
+        print(f"{result['method']:5s} {result['seconds']:7.2f}s  recall {result['recall']:.3f}  precision {result['precision']:.4f}")
+
+if __name__ == "__main__":
+    main()
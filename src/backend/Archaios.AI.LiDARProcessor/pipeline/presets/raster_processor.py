@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 from modules.hillshade_generator import HillshadeGenerator
 from modules.hillshade_multidirectional_generator import HillshadeMultiDirectionalGenerator
 from modules.slope_analyzer import SlopeAnalyzer
+from modules.block_processor import DEFAULT_BLOCK_SIZE
 from pipeline.presets.archaeological_dsm import tif_to_image
 
 logger = logging.getLogger("Archaios.RasterProcessor")
@@ -102,8 +103,9 @@ def process_raster_file(site_id, input_raster, output_dir, lat=0.0, lon=0.0, par
     slope_path = output_dir / "slope.tif"
     
     # Extract hillshade parameters from processing parameters
-    hillshade_params = {}
-    hillshade_multidirectional_params = {}
+    block_size = parameters.raster_block_size if parameters and hasattr(parameters, 'raster_block_size') else DEFAULT_BLOCK_SIZE
+    hillshade_params = {'block_size': block_size}
+    hillshade_multidirectional_params = {'block_size': block_size}
     
     if parameters:
         if hasattr(parameters, 'hillshade_azimuth'):
@@ -137,7 +139,7 @@ def process_raster_file(site_id, input_raster, output_dir, lat=0.0, lon=0.0, par
     
     # Generate slope
     logger.info("Generating slope analysis")
-    slope_analyzer = SlopeAnalyzer(slope_unit="degrees", clip_range=(0, 60))
+    slope_analyzer = SlopeAnalyzer(slope_unit="degrees", clip_range=(0, 60), block_size=block_size)
     slope_analyzer.analyze(dtm_path, slope_path)
     
     # Set visualization parameters
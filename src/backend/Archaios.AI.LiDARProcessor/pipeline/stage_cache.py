@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Protocol
+
+logger = logging.getLogger("Archaios.StageCache")
+
+# Bump when a cached stage's algorithm changes so stale entries stop matching
+CACHE_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+class CacheBackend(Protocol):
+    """Shared store behind the local cache, e.g. a blob container."""
+    def download(self, key: str, dest_dir: str) -> bool:
+        """Copy entry key into dest_dir; False if the backend does not hold it."""
+        ...
+
+    def upload(self, key: str, src_dir: str) -> None:
+        """Store the files of src_dir under key."""
+        ...
+
+def file_fingerprint(path, chunk_size=8 * 1024 * 1024):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class StageCache:
+    """
+    Content-addressed cache of pipeline stage outputs.
+
+    An entry is a directory of files keyed by the input fingerprint (content
+    hash or blob ETag), the stage name and the parameters that stage depends
+    on, so changing a downstream setting such as a hillshade azimuth or a
+    colormap still reuses the expensive upstream stages. Entries live on local
+    disk with least-recently-used eviction by total size; an optional backend
+    shares them between workers.
+    """
+    def __init__(self, root, max_bytes=10 * 1024 ** 3, backend: Optional[CacheBackend] = None):
+        """
+        Args:
+            root: Local cache directory
+            max_bytes: Local size budget; least recently used entries are evicted beyond it
+            backend: Optional shared store consulted on local misses
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backend = backend
+        logger.info(f"Stage cache at {self.root} with budget {max_bytes} bytes (backend: {type(backend).__name__ if backend else 'none'})")
+
+    @staticmethod
+    def key(input_fingerprint, stage, params):
+        """
+        Cache key of a stage.
+
+        Args:
+            input_fingerprint: Content hash or ETag of the input file
+            stage: Stage name
+            params: JSON-serializable parameters the stage output depends on
+
+        Returns:
+            Hex digest identifying the entry
+        """
+        payload = json.dumps(
+            {"version": CACHE_VERSION, "input": input_fingerprint, "stage": stage, "params": params},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def fetch(self, key):
+        """
+        Look up an entry locally, then in the backend.
+
+        Returns:
+            Directory holding the entry's files, or None on a miss
+        """
+        entry = self.root / key
+        if (entry / MANIFEST_NAME).exists():
+            os.utime(entry / MANIFEST_NAME)
+            logger.info(f"Stage cache hit for {key}")
+            return entry
+
+        if self.backend is not None:
+            staging = Path(tempfile.mkdtemp(dir=self.root, prefix=".fetch-"))
+            try:
+                if self.backend.download(key, str(staging)) and (staging / MANIFEST_NAME).exists():
+                    logger.info(f"Stage cache hit for {key} in backend")
+                    return self._commit(staging, key)
+            except Exception as e:
+                logger.warning(f"Stage cache backend lookup failed for {key}: {e}")
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        logger.info(f"Stage cache miss for {key}")
+        return None
+
+    def store(self, key, files):
+        """
+        Add an entry.
+
+        Args:
+            key: Cache key from key()
+            files: Mapping of entry file name to the local file to copy in
+
+        Returns:
+            Directory holding the stored entry
+        """
+        staging = Path(tempfile.mkdtemp(dir=self.root, prefix=".store-"))
+        try:
+            for name, path in files.items():
+                shutil.copyfile(path, staging / name)
+            with open(staging / MANIFEST_NAME, "w") as f:
+                json.dump({"files": sorted(files), "created": time.time()}, f)
+
+            if self.backend is not None:
+                try:
+                    self.backend.upload(key, str(staging))
+                except Exception as e:
+                    logger.warning(f"Stage cache backend upload failed for {key}: {e}")
+
+            entry = self._commit(staging, key)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict()
+        return entry
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its budget."""
+        entries = []
+        for entry in self.root.iterdir():
+            manifest = entry / MANIFEST_NAME
+            if entry.name.startswith(".") or not manifest.exists():
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir())
+            entries.append((manifest.stat().st_mtime, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted stage cache entry {entry.name} ({size} bytes)")
+
+    def _commit(self, staging, key):
+        """Move a completed staging directory into place; concurrent writers keep the first."""
+        entry = self.root / key
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            if not (entry / MANIFEST_NAME).exists():
+                raise
+        return entry
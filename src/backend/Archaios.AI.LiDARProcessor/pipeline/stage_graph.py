@@ -0,0 +1,117 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger("Archaios.StageGraph")
+
+class Stage:
+    """A named unit of pipeline work and the stages whose results it consumes."""
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+class StageGraph:
+    """
+    Small dependency graph of pipeline stages.
+
+    Stages run on a thread pool as soon as all of their dependencies have
+    finished; NumPy, rasterio and PIL release the GIL for the bulk of the
+    raster work, so independent stages overlap on multi-core hosts. Each
+    stage receives its dependencies' results as positional arguments.
+    """
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, func, depends_on=()):
+        """
+        Register a stage.
+
+        Args:
+            name: Unique stage name
+            func: Callable invoked with the results of depends_on, in order
+            depends_on: Names of stages that must finish first
+
+        Returns:
+            The created Stage
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        missing = [dep for dep in depends_on if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+
+        stage = Stage(name, func, depends_on)
+        self.stages[name] = stage
+        return stage
+
+    def prune(self, targets):
+        """
+        Drop every stage that none of the targets depends on, directly or transitively.
+
+        Args:
+            targets: Names of the stages whose results are wanted
+
+        Returns:
+            List of removed stage names, in registration order
+        """
+        unknown = [name for name in targets if name not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown target stages: {unknown}")
+
+        needed = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.stages[name].depends_on)
+
+        removed = [name for name in self.stages if name not in needed]
+        for name in removed:
+            del self.stages[name]
+        return removed
+
+    def run(self, max_workers=None):
+        """
+        Execute every stage, overlapping those whose dependencies are met.
+
+        Args:
+            max_workers: Thread pool size (None lets the executor decide)
+
+        Returns:
+            Tuple of (results, timings): dicts keyed by stage name, timings in seconds
+        """
+        results, timings = {}, {}
+        pending = dict(self.stages)
+        running = {}
+
+        def timed(stage, args):
+            start = time.perf_counter()
+            result = stage.func(*args)
+            return result, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage.depends_on):
+                        args = [results[dep] for dep in stage.depends_on]
+                        running[executor.submit(timed, stage, args)] = name
+                        del pending[name]
+
+                if not running:
+                    raise RuntimeError(f"Stages cannot be scheduled: {sorted(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], timings[name] = future.result()
+                    except Exception:
+                        logger.error(f"Stage '{name}' failed")
+                        for other in running:
+                            other.cancel()
+                        raise
+                    logger.info(f"Stage '{name}' finished in {timings[name]:.3f}s")
+
+        return results, timings
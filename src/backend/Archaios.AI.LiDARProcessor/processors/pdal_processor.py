@@ -6,6 +6,7 @@ import rasterio
 from rasterio.transform import from_origin
 from core.interfaces import ILiDARProcessor
 from core.models import ProcessingResult
+from modules.raster_data import DEFAULT_RASTER_DTYPE
 
 class PDALProcessor(ILiDARProcessor):
     def __init__(self, temp_dir: str):
@@ -37,7 +38,7 @@ class PDALProcessor(ILiDARProcessor):
         yi = ((y - min_y) / grid_res).astype(int)
 
         # DTM: ground points, min z per cell
-        dtm_grid = np.full((height, width), np.nan)
+        dtm_grid = np.full((height, width), np.nan, dtype=DEFAULT_RASTER_DTYPE)
         for i, j, zi, ci in zip(yi, xi, z, classification):
             if ci == 2:  # ground
                 if np.isnan(dtm_grid[i, j]) or zi < dtm_grid[i, j]:
@@ -46,7 +47,7 @@ class PDALProcessor(ILiDARProcessor):
         dtm_grid = np.where(np.isnan(dtm_grid), np.nanmin(dtm_grid), dtm_grid)
 
         # DSM: max z per cell (all points)
-        dsm_grid = np.full((height, width), np.nan)
+        dsm_grid = np.full((height, width), np.nan, dtype=DEFAULT_RASTER_DTYPE)
         for i, j, zi in zip(yi, xi, z):
             if np.isnan(dsm_grid[i, j]) or zi > dsm_grid[i, j]:
                 dsm_grid[i, j] = zi
@@ -1,18 +1,129 @@
+import random
+import asyncio
+import logging
 import aiohttp
 from core.interfaces import IEventService
 from config import AppConfig
 
+logger = logging.getLogger("Archaios.EventService")
+
+# Statuses worth retrying: throttling and transient server-side failures
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
 class DurableEventService(IEventService):
-    def __init__(self, config: AppConfig):
+    """
+    Raises Durable Functions external events for finished jobs.
+
+    A single pooled aiohttp session is kept for the lifetime of the service so
+    events reuse keep-alive connections to the function host. Timeouts,
+    connection errors and retryable statuses are retried with full-jitter
+    exponential backoff.
+
+    With config.event_batch_window_ms > 0, completions are queued and flushed
+    together once the window elapses (or event_batch_size is reached), sharing
+    the session's connections; raise_completion_event still returns only after
+    its own event was delivered.
+    """
+    def __init__(self, config: AppConfig, backoff_base: float = 0.5, backoff_max: float = 10.0):
         self.config = config
+        self.max_retries = config.event_max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_window = config.event_batch_window_ms / 1000
+        self.batch_size = config.event_batch_size
+        self._session = None
+        self._pending = []
+        self._flush_task = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Deliver any queued events and close the pooled session."""
+        if self._pending:
+            await self._flush()
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def raise_completion_event(self, instance_id: str, event_name: str, result: dict) -> None:
         url = (f"{self.config.function_base_url}/runtime/webhooks/durabletask/instances/{instance_id}/"
                f"raiseEvent/{event_name}?"
                f"connection={self.config.connection_name}&"
                f"code={self.config.system_key}")
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=result) as response:
-                if response.status != 202:
-                    print(f"Failed to raise event: {response.status}, {await response.text()}")
+
+        if self.batch_window <= 0:
+            await self._post_with_retry(url, result)
+            return
+
+        delivered = asyncio.get_running_loop().create_future()
+        self._pending.append((url, result, delivered))
+        if len(self._pending) >= self.batch_size:
+            await self._flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+        await delivered
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.batch_window)
+        await self._flush()
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        logger.info(f"Flushing {len(batch)} completion events")
+        outcomes = await asyncio.gather(
+            *(self._post_with_retry(url, result) for url, result, _ in batch),
+            return_exceptions=True
+        )
+        for (_, _, delivered), outcome in zip(batch, outcomes):
+            if delivered.done():
+                continue
+            if isinstance(outcome, BaseException):
+                delivered.set_exception(outcome)
+            else:
+                delivered.set_result(outcome)
+
+    async def _post_with_retry(self, url: str, result: dict) -> None:
+        """
+        POST an event, raising once it cannot be delivered.
+
+        A final non-2xx status raises aiohttp.ClientResponseError just like an
+        exhausted transport error, so the caller keeps the queue message for
+        redelivery instead of recording the job as completed.
+        """
+        for attempt in range(self.max_retries + 1):
+            failure = None
+            try:
+                async with self.session.post(url, json=result) as response:
+                    if response.status < 300:
+                        return
+                    body = await response.text()
+                    if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        logger.error(f"Failed to raise event: {response.status}, {body}")
+                        failure = aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status, message=body
+                        )
+                    else:
+                        logger.warning(f"Raising event returned {response.status} (attempt {attempt + 1}), retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Failed to raise event after {attempt + 1} attempts: {e}")
+                    raise
+                logger.warning(f"Raising event failed (attempt {attempt + 1}): {e}, retrying")
+
+            # Raised outside the try so a final status is not retried as a transport error
+            if failure is not None:
+                raise failure
+
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from core.interfaces import IQueueStorage
+
+logger = logging.getLogger("Archaios.LeaseManager")
+
+class MessageLease:
+    """
+    Keeps a queue message invisible for as long as its job runs.
+
+    Jobs on large inputs outlive the visibility timeout the message was received
+    with; without renewal the queue hands it to another replica, which repeats
+    the whole job. While the block runs the visibility is extended every
+    renew_interval seconds (a third of the timeout by default, so two renewals
+    can fail before the lease lapses).
+
+    Usage:
+        async with MessageLease(queue_storage, message, 300):
+            ...  # process, then delete the message after the block
+    """
+    def __init__(self, queue_storage: IQueueStorage, message, visibility_timeout: int, renew_interval: float = None):
+        self.queue_storage = queue_storage
+        self.message = message
+        self.visibility_timeout = visibility_timeout
+        self.renew_interval = renew_interval or visibility_timeout / 3
+        self.renewals = 0
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._keep_alive())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Stop renewing before the caller deletes the message with the current pop receipt
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return False
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self.queue_storage.renew_message(self.message, self.visibility_timeout)
+                self.renewals += 1
+                logger.debug(f"Renewed lease on message {self.message.id} ({self.renewals} renewals)")
+            except Exception as e:
+                # Keep trying: the next renewal may still land before the message becomes visible
+                logger.warning(f"Could not renew lease on message {self.message.id}: {str(e)}")
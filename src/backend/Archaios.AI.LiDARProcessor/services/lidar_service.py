@@ -1,3 +1,4 @@
+import io
 import asyncio
 import logging
 import json
@@ -6,15 +7,25 @@ from pathlib import Path
 import tempfile
 import os
 import sys
-from core.interfaces import IBlobStorage, IQueueStorage, IEventService
+from core.interfaces import IBlobStorage, IQueueStorage, IEventService, IJobStateStore
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
 from pipeline.presets.archaeological_dsm import run_archaeological_dsm_pipeline
 from pipeline.presets.direct_image_conversion import run_direct_image_conversion
 from modules.e57_converter import E57Converter
 from core.models import ProcessingMessage, ProcessingParameters, ProcessingResult, convert_dict_to_processing_params
+from pipeline.stage_cache import StageCache
+from modules.progressive_file import ProgressiveFile
+from modules.lidar_reader import LiDARReader, PROBE_SAMPLE_WINDOWS
+from services.lease_manager import MessageLease
+from services.worker_pool import MemoryBudget, available_memory, create_process_pool, estimate_job_memory
+from typing import Optional
+from functools import partial
 
 logger = logging.getLogger("Archaios.LiDARService")
+
+# Tile uploads in flight at once; pyramids have thousands of small blobs
+TILE_UPLOAD_CONCURRENCY = 32
 logging.basicConfig(level=logging.INFO)
 logger.setLevel(logging.INFO)
 
@@ -24,103 +35,86 @@ class LiDARService:
         blob_storage: IBlobStorage,
         queue_storage: IQueueStorage,
         event_service: IEventService,
-        local_mode: bool = False
+        local_mode: bool = False,
+        stage_cache: Optional[StageCache] = None,
+        max_concurrent_jobs: int = 1,
+        memory_budget_bytes: Optional[int] = None,
+        job_state: Optional[IJobStateStore] = None,
+        visibility_timeout: int = 300,
+        max_dequeue_count: int = 5
     ):
         self.blob_storage = blob_storage
         self.queue_storage = queue_storage
         self.event_service = event_service
         self.local_mode = local_mode
+        self.stage_cache = stage_cache
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        # None selects the loop's default thread pool; several slots get worker processes
+        self.executor = create_process_pool(self.max_concurrent_jobs) if self.max_concurrent_jobs > 1 else None
+        self.memory_budget = MemoryBudget(memory_budget_bytes or available_memory())
+        self.job_state = job_state
+        self.visibility_timeout = visibility_timeout
+        self.max_dequeue_count = max_dequeue_count
+
+    async def _run_pipeline(self, input_path, func, /, *args, **kwargs):
+        """
+        Run a CPU-bound pipeline once its estimated memory fits the budget.
+
+        The pipeline runs off the event loop (in the process pool in concurrent
+        mode) so the loop keeps downloading, uploading and admitting other jobs.
+        The memory estimate uses the parameters keyword the pipeline itself
+        receives, so both agree on e.g. streaming mode.
+        """
+        # The estimate reads the header, which may still be arriving over this loop
+        estimate = await asyncio.to_thread(estimate_job_memory, input_path, kwargs.get("parameters"))
+        async with self.memory_budget.reserve(estimate):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    def _parse_message(self, message) -> ProcessingMessage:
+        decoded_text = base64.b64decode(message.content).decode('utf-8')
+        logger.debug(f"Decoded message: {decoded_text}")
+        data = json.loads(decoded_text)
+
+        return ProcessingMessage(
+            instance_id=data.get('InstanceId', ''),
+            event_name=data.get('EventName', ''),
+            blob_uri=data.get('BlobUri', ''),
+            site_id=data.get('SiteId', ''),
+            parameters=convert_dict_to_processing_params(data.get('Parameters'))
+        )
 
     async def process_message(self, message):
         try:
-            decoded_text = base64.b64decode(message.content).decode('utf-8')
-            logger.debug(f"Decoded message: {decoded_text}")
-            data = json.loads(decoded_text)
-            
-            msg_data = ProcessingMessage(
-                instance_id=data.get('InstanceId', ''),
-                event_name=data.get('EventName', ''),
-                blob_uri=data.get('BlobUri', ''),
-                site_id=data.get('SiteId', ''),
-                parameters=convert_dict_to_processing_params(data.get('Parameters'))
-            )
-            
-            logger.info(f"Processing message for instance {msg_data.instance_id}")
+            if message.dequeue_count > self.max_dequeue_count:
+                # Checked before parsing so malformed messages are parked too
+                await self._reject_poison_message(message)
+                return
+
+            msg_data = self._parse_message(message)
+
+            if self.job_state is not None and await self.job_state.is_completed(msg_data.instance_id):
+                # Redelivered after a replica finished it but before the delete landed
+                logger.info(f"Instance {msg_data.instance_id} already completed, dropping duplicate message")
+                await self.queue_storage.delete_message(message)
+                return
+
+            logger.info(f"Processing message for instance {msg_data.instance_id} (delivery {message.dequeue_count})")
             logger.info(f"Message data: {msg_data.__dict__}")
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=Path(msg_data.blob_uri).suffix) as temp_file:
-                await self.blob_storage.download_file(msg_data.blob_uri, temp_file.name)
-                output_dir = tempfile.mkdtemp()
-
-                event = (msg_data.event_name or "").strip()
-                processing_result = ProcessingResult(status="error")
-
-                if event == "LiDARProcessingCompleted":
-                    result_dict = await self._process_lidar_file(temp_file.name, output_dir, msg_data.parameters, msg_data.instance_id, msg_data.site_id)
-                    processing_result = ProcessingResult(
-                        status="success",
-                        output_dir=output_dir,
-                        statistics=result_dict.get("statistics", {}),
-                        processing_details=result_dict.get("processing_details", {}),
-                        lat=result_dict.get("lat", 0.0),
-                        lon=result_dict.get("lon", 0.0),
-                        dtmImage=result_dict.get("dtm_image"),
-                        dsmImage=result_dict.get("dsm_image"),
-                        hillshadeImage=result_dict.get("hillshade_image"),
-                        hillshadeMultiDirectionalImage =result_dict.get("hillshade_multidirectional_image"),
-                        slopeImage=result_dict.get("slope_image"),
-                        historicalContext=result_dict.get("historical_context"),
-                        systemPrompt=result_dict.get("system_prompt"),
-                        elevationImage=result_dict.get("elevation_image")
-                    )
-
-                elif event == "E57ProcessingCompleted":
-                    result_dict = await self._process_e57_file(temp_file.name, output_dir, msg_data.parameters)
-                    processing_result = ProcessingResult(
-                        status="success" if result_dict else "error",
-                        output_dir=output_dir,
-                        statistics=result_dict.get("statistics", {}),
-                        processing_details=result_dict.get("processing_details", {})
-                    )
-
-                elif event == "RasterProcessingCompleted":
-                    result_dict = await self._process_raster_file(temp_file.name, output_dir, msg_data.parameters, msg_data.instance_id, msg_data.site_id)
-                    processing_result = ProcessingResult(
-                        status="success",
-                        output_dir=output_dir,
-                        statistics=result_dict.get("statistics", {}),
-                        processing_details=result_dict.get("processing_details", {}),
-                        lat=result_dict.get("lat", 0.0),
-                        lon=result_dict.get("lon", 0.0),
-                        dtmImage=result_dict.get("dtm_image"),
-                        hillshadeImage=result_dict.get("hillshade_image"),
-                        hillshadeMultiDirectionalImage=result_dict.get("hillshade_multidirectional_image"),
-                        slopeImage=result_dict.get("slope_image"),
-                        historicalContext=result_dict.get("historical_context"),
-                        systemPrompt=result_dict.get("system_prompt"),
-                        elevationImage=result_dict.get("elevation_image")
-                    )
-
-                elif event == "ShapefileProcessingCompleted":
-                    processing_result = ProcessingResult(
-                        status="success",
-                        output_dir=output_dir,
-                        error_message="Shapefile processing not implemented"
-                    )
+            async with MessageLease(self.queue_storage, message, self.visibility_timeout):
+                processing_result = await self._execute_job(msg_data)
 
-                else:
-                    logger.warning(f"Unknown event name: {event}")
-                    processing_result = ProcessingResult(
-                        status="error",
-                        output_dir=output_dir,
-                        error_message=f"Unknown event: {event}"
-                    )
-            await self.queue_storage.delete_message(message)
+            # Raise before deleting: if this replica dies in between, the redelivered
+            # message is either dropped as completed or reprocessed, never lost
             await self.event_service.raise_completion_event(
                 msg_data.instance_id,
                 msg_data.event_name,
                 processing_result.__dict__
             )
+            if self.job_state is not None:
+                await self.job_state.mark_completed(msg_data.instance_id, msg_data.event_name, processing_result.status)
+            await self.queue_storage.delete_message(message)
 
             logger.info(f"Message processed and deleted for instance {msg_data.instance_id}")
 
@@ -128,20 +122,142 @@ class LiDARService:
             logger.error(f"Error processing message: {str(e)}")
             raise
 
-    async def _process_lidar_file(self, file_path, output_dir, parameters: ProcessingParameters, instance_id, site_id):
+    async def _reject_poison_message(self, message):
+        """Move a message that failed max_dequeue_count times to the poison queue and fail its orchestration."""
+        logger.error(f"Message {message.id} failed {message.dequeue_count - 1} times, moving it to the poison queue")
+        await self.queue_storage.move_to_poison(message)
+
+        try:
+            msg_data = self._parse_message(message)
+        except Exception as e:
+            logger.error(f"Poison message {message.id} is not a valid processing message: {str(e)}")
+            return
+
+        if msg_data.instance_id and msg_data.event_name:
+            processing_result = ProcessingResult(
+                status="error",
+                error_message=f"Processing failed after {message.dequeue_count - 1} attempts"
+            )
+            await self.event_service.raise_completion_event(msg_data.instance_id, msg_data.event_name, processing_result.__dict__)
+            if self.job_state is not None:
+                await self.job_state.mark_completed(msg_data.instance_id, msg_data.event_name, processing_result.status)
+
+    async def _execute_job(self, msg_data: ProcessingMessage) -> ProcessingResult:
+        """Download the message's input and run the processing for its event."""
+        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(msg_data.blob_uri).suffix) as temp_file:
+            event = (msg_data.event_name or "").strip()
+            is_las = Path(msg_data.blob_uri).suffix.lower() in ('.las', '.laz')
+
+            download = None
+            if event == "LiDARProcessingCompleted" and is_las and getattr(msg_data.parameters, 'pipelined_download', False):
+                # Decode and grid the points while the rest of the blob is still arriving
+                etag, download = await self.blob_storage.start_progressive_download(msg_data.blob_uri, temp_file.name)
+            else:
+                on_header = self._inspect_las_header if is_las else None
+                etag = await self.blob_storage.download_file(msg_data.blob_uri, temp_file.name, on_header=on_header)
+            output_dir = tempfile.mkdtemp()
+
+            processing_result = ProcessingResult(status="error")
+
+            if event == "LiDARProcessingCompleted":
+                # The blob ETag identifies the content without hashing the download
+                input_fingerprint = f"{msg_data.blob_uri}@{etag}" if etag else None
+                try:
+                    result_dict = await self._process_lidar_file(temp_file.name, output_dir, msg_data.parameters, msg_data.instance_id, msg_data.site_id, input_fingerprint)
+                    if download is not None:
+                        await download
+                finally:
+                    if download is not None and not download.done():
+                        download.cancel()
+                processing_result = ProcessingResult(
+                    status="success",
+                    output_dir=output_dir,
+                    statistics=result_dict.get("statistics", {}),
+                    processing_details=result_dict.get("processing_details", {}),
+                    lat=result_dict.get("lat", 0.0),
+                    lon=result_dict.get("lon", 0.0),
+                    dtmImage=result_dict.get("dtm_image"),
+                    dsmImage=result_dict.get("dsm_image"),
+                    hillshadeImage=result_dict.get("hillshade_image"),
+                    hillshadeMultiDirectionalImage =result_dict.get("hillshade_multidirectional_image"),
+                    slopeImage=result_dict.get("slope_image"),
+                    historicalContext=result_dict.get("historical_context"),
+                    systemPrompt=result_dict.get("system_prompt"),
+                    elevationImage=result_dict.get("elevation_image"),
+                    mapTiles=result_dict.get("map_tiles"),
+                    blobUrls=result_dict.get("blob_urls", {})
+                )
+
+            elif event == "E57ProcessingCompleted":
+                result_dict = await asyncio.to_thread(self._process_e57_file, temp_file.name, output_dir, msg_data.parameters)
+                processing_result = ProcessingResult(
+                    status="success" if result_dict else "error",
+                    output_dir=output_dir,
+                    statistics=result_dict.get("statistics", {}),
+                    processing_details=result_dict.get("processing_details", {})
+                )
+
+            elif event == "RasterProcessingCompleted":
+                result_dict = await self._process_raster_file(temp_file.name, output_dir, msg_data.parameters, msg_data.instance_id, msg_data.site_id)
+                processing_result = ProcessingResult(
+                    status="success",
+                    output_dir=output_dir,
+                    statistics=result_dict.get("statistics", {}),
+                    processing_details=result_dict.get("processing_details", {}),
+                    lat=result_dict.get("lat", 0.0),
+                    lon=result_dict.get("lon", 0.0),
+                    dtmImage=result_dict.get("dtm_image"),
+                    hillshadeImage=result_dict.get("hillshade_image"),
+                    hillshadeMultiDirectionalImage=result_dict.get("hillshade_multidirectional_image"),
+                    slopeImage=result_dict.get("slope_image"),
+                    historicalContext=result_dict.get("historical_context"),
+                    systemPrompt=result_dict.get("system_prompt"),
+                    elevationImage=result_dict.get("elevation_image")
+                )
+
+            elif event == "ShapefileProcessingCompleted":
+                processing_result = ProcessingResult(
+                    status="success",
+                    output_dir=output_dir,
+                    error_message="Shapefile processing not implemented"
+                )
+
+            else:
+                logger.warning(f"Unknown event name: {event}")
+                processing_result = ProcessingResult(
+                    status="error",
+                    output_dir=output_dir,
+                    error_message=f"Unknown event: {event}"
+                )
+
+        return processing_result
+
+    def _inspect_las_header(self, head: bytes):
+        """Check the first downloaded bytes of a LAS/LAZ blob, failing before the point records are fetched."""
+        if head[:4] != b"LASF":
+            raise ValueError("Blob is not a LAS/LAZ file (missing LASF signature)")
+        try:
+            import laspy
+            header = laspy.LasHeader.read_from(io.BytesIO(head))
+            logger.info(f"LAS {header.version} header received: {header.point_count} points, point format {header.point_format.id}")
+        except Exception as e:
+            # VLRs can extend past the prefetched bytes; the full header is read after the download
+            logger.warning(f"Could not parse LAS header from the first {len(head)} bytes: {e}")
+
+    async def _process_lidar_file(self, file_path, output_dir, parameters: ProcessingParameters, instance_id, site_id, input_fingerprint=None):
         try:
             logger.info(f"Processing LiDAR file: {file_path}")
             
-            # Check for existing ground classification
-            from pipeline.presets.archaeological_dsm import has_ground_classification
-            import laspy
+            # Probe the header and a sample of records; the pipeline reads the points once
+            probe = None
+            # Sampling across the file would wait for the whole download
+            sample_windows = 0 if ProgressiveFile.in_progress(file_path) else PROBE_SAMPLE_WINDOWS
             try:
-                las = laspy.read(file_path)
-                if has_ground_classification(las):
+                probe = await asyncio.to_thread(LiDARReader(file_path).probe, sample_windows)
+                if probe["has_ground_classification"]:
                     logger.info("File has existing ground classification, will skip ground classifier step")
-                del las  # Clean up memory
             except Exception as e:
-                logger.warning(f"Failed to check for ground classification: {e}")
+                logger.warning(f"Failed to probe LiDAR file: {e}")
             
             context_text = ""
 
@@ -157,7 +273,9 @@ class LiDARService:
             
             if parameters and parameters.workflow:
                 # Extract needed workflow parameters into the parameters object
-                result = run_archaeological_dsm_pipeline(
+                result = await self._run_pipeline(
+                    file_path,
+                    run_archaeological_dsm_pipeline,
                     site_id,
                     file_path, 
                     output_dir,
@@ -166,7 +284,11 @@ class LiDARService:
                     resolution=parameters.resolution,
                     dtm_resolution=parameters.dtm_resolution,
                     dsm_resolution=parameters.dsm_resolution,
-                    parameters=parameters  # Pass the full parameters object 
+                    parameters=parameters,  # Pass the full parameters object 
+                    stage_cache=self.stage_cache,
+                    input_fingerprint=input_fingerprint,
+                    header_summary=probe,
+                    max_concurrent_jobs=self.max_concurrent_jobs
                 )
                 
                 upload_tasks = []
@@ -219,6 +341,8 @@ class LiDARService:
                             result_key = f"{img_type}_image"
                             if result_key in result:
                                 result[result_key] = uploaded_urls[i]
+
+                await self._upload_derived_outputs(result, output_filename)
                 
                 if context_text:
                     result['historical_context'] = context_text
@@ -230,7 +354,7 @@ class LiDARService:
                 
                 return result
             else:
-                result = run_archaeological_dsm_pipeline(site_id,file_path, output_dir,lat,lon)
+                result = await self._run_pipeline(file_path, run_archaeological_dsm_pipeline, site_id,file_path, output_dir,lat,lon, parameters=parameters, stage_cache=self.stage_cache, input_fingerprint=input_fingerprint, header_summary=probe, max_concurrent_jobs=self.max_concurrent_jobs)
                 
                 output_filename = Path(file_path).stem
                 files_to_upload = []
@@ -251,6 +375,8 @@ class LiDARService:
                             result_key = f"{img_type}_image"
                             if result_key in result:
                                 result[result_key] = uploaded_urls[i]
+
+                await self._upload_derived_outputs(result, output_filename)
                                 
                 # Add historical context to result if available
                 if context_text:
@@ -278,6 +404,65 @@ class LiDARService:
             logger.error(f"Error uploading file {file_path}: {str(e)}")
             return None
 
+    async def _upload_derived_outputs(self, result, output_filename):
+        """
+        Upload the optional pipeline outputs beyond the PNGs, for workflow and plain jobs alike.
+
+        Replaces the local map_tiles metadata of result with the uploaded URL
+        templates and adds blob_urls for the Cloud-Optimized GeoTIFFs.
+        """
+        if result.get("map_tiles"):
+            result["map_tiles"] = await self._upload_map_tiles(result["map_tiles"], output_filename)
+
+        if result.get("cog_files"):
+            # Uploaded next to the PNGs so clients can range-read windows of the full-precision rasters
+            cog_products = list(result["cog_files"])
+            cog_urls = await asyncio.gather(*(
+                self._upload_file(result["cog_files"][product], f"{output_filename}/{product}.tif")
+                for product in cog_products
+            ))
+            result["blob_urls"] = {f"{product}_cog": url for product, url in zip(cog_products, cog_urls) if url}
+
+    async def _upload_map_tiles(self, map_tiles, output_filename):
+        """
+        Upload every tile pyramid and describe each by an XYZ URL template.
+
+        Tiles are uploaded concurrently, at most TILE_UPLOAD_CONCURRENCY at a time,
+        under <output_filename>/tiles/<product>/<z>/<x>/<y>.<format>.
+
+        Returns:
+            Dict per product of its url_template, zoom range, bounds and tile_count
+        """
+        semaphore = asyncio.Semaphore(TILE_UPLOAD_CONCURRENCY)
+
+        async def upload(file_path, blob_name):
+            async with semaphore:
+                return await self._upload_file(file_path, blob_name)
+
+        uploaded = {}
+        for product, metadata in map_tiles.items():
+            tile_dir = Path(metadata["directory"])
+            files = [path for path in tile_dir.rglob("*") if path.is_file()]
+            logger.info(f"Uploading {len(files)} {product} tiles to blob storage")
+            urls = await asyncio.gather(*(
+                upload(path, f"{output_filename}/tiles/{product}/{path.relative_to(tile_dir).as_posix()}")
+                for path in files
+            ))
+
+            failed = sum(url is None for url in urls)
+            if failed:
+                logger.warning(f"{failed} of {len(files)} {product} tiles failed to upload")
+
+            metadata_url = next((url for path, url in zip(files, urls) if path.name == "metadata.json" and url), None)
+            if metadata_url is None:
+                continue
+            base_url = metadata_url[:-len("metadata.json")]
+            uploaded[product] = {
+                **{key: value for key, value in metadata.items() if key != "directory"},
+                "url_template": f"{base_url}{{z}}/{{x}}/{{y}}.{metadata['format']}"
+            }
+        return uploaded
+
     def _process_e57_file(self, file_path, output_dir, parameters: ProcessingParameters):
         """Process E57 files based on workflow parameters."""
         try:
@@ -336,6 +521,10 @@ class LiDARService:
 
     async def _process_historical_context(self, context_files, output_dir):
         """Process historical context files and return extracted text."""
+        # PDF/DOCX text extraction is blocking, so it runs on a worker thread
+        return await asyncio.to_thread(self._extract_historical_context, context_files, output_dir)
+
+    def _extract_historical_context(self, context_files, output_dir):
         try:
             output_text = ""
             context_dir = Path(output_dir) / "historical_context"
@@ -398,38 +587,54 @@ class LiDARService:
         """Run the service, either once or in a continuous loop based on mode."""
         logger.info(f"Event-driven job started in {'local' if self.local_mode else 'container'} mode.")
 
-        if self.local_mode:
-            logger.info("Running in continuous loop mode for local development")
-            try:
-                while True:
-                    await self._process_queue_batch()
-                    await asyncio.sleep(10)
-            except KeyboardInterrupt:
-                logger.info("Keyboard interrupt received, shutting down gracefully")
-            except Exception as e:
-                logger.error(f"Error in processing loop: {str(e)}")
-                raise
-        else:
-            await self._process_queue_batch()
+        try:
+            if self.local_mode:
+                logger.info(f"Running in continuous loop mode for local development with {self.max_concurrent_jobs} job slots")
+                try:
+                    await self._process_queue_continuously()
+                except KeyboardInterrupt:
+                    logger.info("Keyboard interrupt received, shutting down gracefully")
+                except Exception as e:
+                    logger.error(f"Error in processing loop: {str(e)}")
+                    raise
+            else:
+                await self._process_queue_batch()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
             
         logger.info("Job completed successfully.")
     
     async def _process_queue_batch(self):
-        """Process a single batch of messages from the queue."""
-        messages = await self.queue_storage.receive_messages()
+        """Process one message per job slot from the queue, concurrently."""
+        messages = await self.queue_storage.receive_messages(max_messages=self.max_concurrent_jobs)
         if not messages:
             logger.info("No messages found in the queue.")
             return False
 
-        for message in messages:
-            try:
-                await self.process_message(message)
-            except Exception as e:
-                logger.error(f"Error processing message: {str(e)}")
-            break
-
+        await asyncio.gather(*(self._process_message_safely(message) for message in messages))
         return True
 
+    async def _process_queue_continuously(self):
+        """Keep every job slot busy, receiving a new message as soon as a job finishes."""
+        in_flight = set()
+        while True:
+            free_slots = self.max_concurrent_jobs - len(in_flight)
+            if free_slots > 0:
+                messages = await self.queue_storage.receive_messages(max_messages=free_slots)
+                in_flight.update(asyncio.create_task(self._process_message_safely(message)) for message in messages)
+
+            if in_flight:
+                _, in_flight = await asyncio.wait(in_flight, timeout=10, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(10)
+
+    async def _process_message_safely(self, message):
+        try:
+            await self.process_message(message)
+        except Exception as e:
+            logger.error(f"Error processing message: {str(e)}")
+
     async def _process_raster_file(self, file_path, output_dir, parameters: ProcessingParameters, instance_id, site_id):
         """Process raster file (.tif) for terrain analysis."""
         try:
@@ -448,7 +653,9 @@ class LiDARService:
             
             from pipeline.presets.raster_processor import process_raster_file
             
-            result = process_raster_file(
+            result = await self._run_pipeline(
+                file_path,
+                process_raster_file,
                 site_id,
                 file_path,
                 output_dir,
@@ -0,0 +1,108 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger("Archaios.WorkerPool")
+
+# Peak resident bytes per point of an in-memory run: float64 x/y/z columns,
+# class and return bytes, the SOR neighbour distances and the gridder indices
+BYTES_PER_POINT = 160
+
+# Rasters and E57 scans have no point count in a header; scale the file size instead
+FILE_SIZE_EXPANSION = 8
+
+LAS_SUFFIXES = (".las", ".laz")
+
+def estimate_job_memory(file_path, parameters=None):
+    """
+    Estimate the peak memory of processing a downloaded input.
+
+    LAS/LAZ inputs are sized from the header point count, capped at one batch
+    when the pipeline will stream the cloud; other inputs from their file size.
+
+    Args:
+        file_path: Local path of the input
+        parameters: ProcessingParameters of the job, or None
+
+    Returns:
+        Estimated bytes
+    """
+    if Path(file_path).suffix.lower() in LAS_SUFFIXES:
+        try:
+            from modules.lidar_reader import LiDARReader
+            from pipeline.presets.archaeological_dsm import use_streaming_mode
+
+            header_summary = LiDARReader(file_path).header_summary()
+            points = header_summary["point_count"]
+            if use_streaming_mode(header_summary, parameters):
+                points = min(points, int(getattr(parameters, 'streaming_chunk_size', points)))
+            return points * BYTES_PER_POINT
+        except Exception as e:
+            logger.warning(f"Could not read LAS header of {file_path} for memory estimate: {e}")
+
+    return os.path.getsize(file_path) * FILE_SIZE_EXPANSION
+
+def available_memory():
+    """Physical memory of the host (or container cgroup limit) in bytes."""
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            total = min(total, int(limit))
+    except (OSError, ValueError):
+        pass
+    return total
+
+class MemoryBudget:
+    """
+    Admission control for concurrent jobs by estimated memory.
+
+    A job waits until its estimate fits in the unreserved budget. A job larger
+    than the whole budget is still admitted once nothing else is running, so
+    oversized inputs are serialized rather than rejected.
+    """
+    def __init__(self, total_bytes):
+        self.total_bytes = total_bytes
+        self.reserved = 0
+        self.active = 0
+        self._condition = asyncio.Condition()
+        logger.info(f"Job memory budget: {total_bytes / 1024 ** 3:.1f} GiB")
+
+    @asynccontextmanager
+    async def reserve(self, nbytes):
+        """Hold nbytes of the budget for the duration of the block."""
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.active == 0 or self.reserved + nbytes <= self.total_bytes
+            )
+            self.reserved += nbytes
+            self.active += 1
+        logger.info(f"Admitted job needing {nbytes / 1024 ** 2:.0f} MiB ({self.active} active, {self.reserved / 1024 ** 2:.0f} MiB reserved)")
+
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.reserved -= nbytes
+                self.active -= 1
+                self._condition.notify_all()
+
+def _init_worker():
+    logging.basicConfig(level=logging.INFO)
+
+def create_process_pool(max_workers):
+    """
+    Process pool for the CPU-bound pipelines.
+
+    Workers are spawned rather than forked so they never inherit the event
+    loop or the storage clients' sockets.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker
+    )